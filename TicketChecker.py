@@ -6,7 +6,8 @@ import json
 import os
 import sys
 
-# Object representation of a ticket mapping its number to its prime number ID
+# Object representation of a ticket mapping its number to its ID. The ID is
+# either a hex bitset of track numbers or (for older games) a product of primes
 class Ticket:
 
     def __init__(self, ticketNumber, ticketId):
@@ -97,7 +98,7 @@ class MainApp:
                         pass
                 gameTracks = map(lambda s: Song(**s), gameTracks)
 
-                winPoint, title, artist = self.checkWin(int(theTicket.ticketId), path, gameTracks)
+                winPoint, title, artist = self.checkWin(theTicket.ticketId, path, gameTracks)
 
                 self.ticketStatusWindow.config(fg=normalColour)
 
@@ -123,7 +124,9 @@ class MainApp:
 
     def checkWin(self, ticketId, directory, lines):
         """returns the point and track in which the ticket will win"""
-        ticketTracks = self.primes(ticketId)
+        if ticketId.lower().startswith("0x"):
+            return self.checkWinKey(int(ticketId, 16), lines)
+        ticketTracks = self.primes(int(ticketId))
         lastSong = "INVALID"
         lastArtist = ""
         lastTitle = ""
@@ -141,6 +144,15 @@ class MainApp:
         else:
             return [0, "", ""]
 
+    def checkWinKey(self, ticketKey, lines):
+        """returns the point and track in which the ticket will win, for a
+        ticket ID that has one bit set for the number of each track"""
+        winPoint = ticketKey.bit_length()
+        for i in lines:
+            if int(i.count) == winPoint:
+                return [winPoint, i.title, i.artist]
+        return [0, "", ""]
+
     def primes(self, n):
         """calculates the prime factors of the prime ticket ID. This will tell exactly what
         tracks were on the ticket"""
@@ -27,7 +27,11 @@ def primes(n):
     return primfac
 
 def checkWin(ticketId, directory, lines):
-    ticketTracks = primes(ticketId)
+    if ticketId.lower().startswith("0x"):
+        # ticket ID is a bitset of track numbers, which are in play order
+        return int(ticketId, 16).bit_length()
+
+    ticketTracks = primes(int(ticketId))
 
     lastSong = "INVALID"
 
@@ -75,7 +79,7 @@ for i in range(0,len(fileLines)):
 
 for line in ticketFileLines:
     [ticketNum, ticketId] = line.split("/")
-    winPoint = checkWin(int(ticketId), path, fileLines)
+    winPoint = checkWin(ticketId, path, fileLines)
 
     listOfTickets.append(TicketWin(winPoint,ticketNum))
 
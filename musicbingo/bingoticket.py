@@ -3,12 +3,14 @@ Represents a Bingo ticket with a songs for each
 row and column.
 """
 
-from typing import cast, AbstractSet, Any, Dict, List, Optional
+from typing import cast, AbstractSet, Any, Dict, List, Optional, Sequence
 
 from . import models
 from .docgen.colour import Colour
 from .palette import Palette
+from .ticketkey import key_to_str, ticket_key
 from .track import Track
+from .winengine import WinEngine
 
 # pylint: disable=too-few-public-methods
 
@@ -19,40 +21,22 @@ class BingoTicket:
                  number: Optional[int] = None, tracks: Optional[List[Track]] = None):
         self.palette = palette
         self.columns = columns  # number of columns
+        # bitset of the numbers of the tracks on this ticket
         self.fingerprint = fingerprint
         self.tracks: List[Track] = []
         self.number = number
         self.wins_on_track: int = 0
         self.rows_complete_on_track: List[int] = []
         if tracks is not None:
-            self.fingerprint = 0
             self.tracks = tracks
-            for trk in tracks:
-                self.fingerprint *= trk.prime
+            self.fingerprint = ticket_key(trk.number for trk in tracks)
 
     def compute_win_values(self, tracks: List[Track]) -> None:
         """
         Calculate when the ticket is complete and when each row is
         complete.
         """
-        self.wins_on_track = 0
-        fingerprint: int = 1
-        row_fingerprints: List[int] = []
-        for idx, track in enumerate(self.tracks):
-            fingerprint *= track.prime
-            if ((idx + 1) % self.columns) == 0:
-                row_fingerprints.append(fingerprint)
-                fingerprint = 1
-        self.rows_complete_on_track = [0] * len(row_fingerprints)
-        for tnum, track in enumerate(tracks):
-            fingerprint *= track.prime
-            for idx, row in enumerate(row_fingerprints):
-                if self.rows_complete_on_track[idx] != 0:
-                    continue
-                if (fingerprint % row) == 0:
-                    self.rows_complete_on_track[idx] = tnum + 1
-            if self.wins_on_track == 0 and (fingerprint % self.fingerprint) == 0:
-                self.wins_on_track = tnum + 1
+        WinEngine(tracks).compute_win_values([self])
 
     def box_colour_style(self, col: int, row: int) -> Colour:
         """Get the background colour for a given bingo ticket"""
@@ -103,9 +87,39 @@ class BingoTicket:
         retval = models.BingoTicket(game=game,
                                     checked=0,
                                     number=self.number,
-                                    fingerprint=str(self.fingerprint))
+                                    fingerprint=key_to_str(self.fingerprint))
         retval.set_tracks(session, tracks)
         session.add(retval)
         if flush:
             session.flush()
         return retval
+
+    @staticmethod
+    def save_all(session, game: models.Game, tickets: Sequence["BingoTicket"],
+                 db_tracks: Sequence[models.Track]) -> List[models.BingoTicket]:
+        """
+        save all the tickets of a game to database, using one INSERT
+        statement for the tickets and one for the links to their tracks.
+        Any previous tickets of this game must have already been deleted.
+        Returns the database model of each ticket, in the same order as "tickets"
+        """
+        session.flush()
+        track_pks: Dict[int, int] = {trk.number: trk.pk for trk in db_tracks}
+        models.BingoTicket.bulk_insert(session, [{
+            'game_pk': game.pk,
+            'number': ticket.number,
+            'fingerprint': key_to_str(ticket.fingerprint),
+            'checked': 0,
+        } for ticket in tickets])
+        ticket_pks: Dict[int, int] = dict(
+            session.query(models.BingoTicket.number, models.BingoTicket.pk).filter_by(
+                game_pk=game.pk))
+        models.BingoTicketTrack.bulk_insert(session, [{
+            'bingoticket_pk': ticket_pks[cast(int, ticket.number)],
+            'track_pk': track_pks[track.number],
+            'order': idx,
+        } for ticket in tickets for idx, track in enumerate(ticket.tracks)])
+        db_tickets = {
+            btk.number: btk for btk in models.BingoTicket.search_with_tracks(
+                session, game_pk=game.pk)}
+        return [db_tickets[ticket.number] for ticket in tickets]
@@ -2,51 +2,91 @@
 Classes used when generating music clips
 """
 
+from concurrent import futures
 from pathlib import Path
 import re
+import threading
 import traceback
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
 from musicbingo.duration import Duration
-from musicbingo.mp3 import MP3Editor, InvalidMP3Exception
+from musicbingo.mp3 import MP3Editor, MP3Factory, MP3Parser, InvalidMP3Exception
 from musicbingo.options import Options
 from musicbingo.progress import Progress
 from musicbingo.metadata import Metadata
 from musicbingo.song import Song
 from musicbingo.utils import clean_string
 
+
+class ClipJobProgress(Progress):
+    """
+    The progress of creating one clip, which also updates the progress
+    of the ClipGenerator that is creating it
+    """
+
+    def __init__(self, generator: "ClipGenerator", index: int) -> None:
+        super().__init__()
+        self.generator = generator
+        self.index = index
+
+    def on_change_phase_percent(self, pct: float) -> None:
+        self.generator.update_progress(self.index, pct)
+
+
 class ClipGenerator:
     """A class to create clips from MP3 files"""
 
+    # allowed difference (in milliseconds) between the duration of an
+    # existing clip and the duration of the clip that would be created
+    DURATION_TOLERANCE = 250
+
     def __init__(self, options: Options, mp3_editor: MP3Editor,
-                 progress: Progress):
+                 progress: Progress, parser: Optional[MP3Parser] = None):
         self.options = options
         self.mp3 = mp3_editor
         self.progress = progress
+        self.parser = parser
+        # the progress of each clip that is being created
+        self.jobs: Dict[int, ClipJobProgress] = {}
+        self._job_pct: Dict[int, float] = {}
+        self._total_jobs = 0
+        self._lock = threading.Lock()
 
     def generate(self, songs: List[Song]) -> List[Path]:
         """
-        Generate all clips for all selected Songs
-        Returns list of filenames of new clips
+        Generate all clips for all selected Songs.
+        If options.clip_workers is greater than 1, up to that many
+        clips are created at the same time.
+        Returns list of filenames of new clips, in the same order as songs
         """
         total_songs = len(songs)
-        clips: List[Path] = []
         start = int(Duration(self.options.clip_start))
         end = start + 1000 * self.options.clip_duration
         self.progress.num_phases = 1
         self.progress.current_phase = 0
-        for index, song in enumerate(songs):
-            # pylint: disable=consider-using-f-string
-            self.progress.text = '{} ({:d}/{:d})'.format(Song.clean(song.title),
-                                                         index, total_songs)
-            self.progress.pct = 100.0 * float(index) / float(total_songs)
-            # pylint: disable=broad-except
-            try:
-                clips.append(self.generate_clip(song, start, end))
-            except (InvalidMP3Exception, ValueError) as err:
-                traceback.print_exc()
-                print(r'Error generating clip: {0} - {1}'.format(
-                    Song.clean(song.title), str(err)))
+        if self.parser is None:
+            self.parser = MP3Factory.create_parser(self.options.mp3_parser)
+        self.jobs = {}
+        self._job_pct = {}
+        self._total_jobs = total_songs
+        results: List[Optional[Path]] = [None] * total_songs
+        with futures.ThreadPoolExecutor(max_workers=max(1, self.options.clip_workers)) as pool:
+            todo: Dict[futures.Future, int] = {}
+            for index, song in enumerate(songs):
+                todo[pool.submit(self._generate_job, index, song, start, end)] = index
+            while todo and not self.progress.abort:
+                done, _ = futures.wait(list(todo.keys()), timeout=0.25,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    results[todo.pop(future)] = future.result()
+            if self.progress.abort:
+                # stop the clips that are being created, and any that
+                # have not yet started
+                pool.shutdown(wait=False, cancel_futures=True)
+                with self._lock:
+                    for job in self.jobs.values():
+                        job.abort = True
+        clips = [clip for clip in results if clip is not None]
         self.progress.pct = 100.0
         if len(songs) == 1:
             self.progress.text = f'Finished generating {Song.clean(songs[0].title)}'
@@ -54,8 +94,44 @@ class ClipGenerator:
             self.progress.text = f'Finished generating {len(songs)} clips'
         return clips
 
-    def generate_clip(self, song: Song, start: int, end: int) -> Path:
-        """Create one clip from an existing MP3 file."""
+    def _generate_job(self, index: int, song: Song, start: int, end: int) -> Optional[Path]:
+        """
+        Create one clip, reporting any error with the song
+        """
+        if self.progress.abort:
+            return None
+        job = ClipJobProgress(self, index)
+        with self._lock:
+            self.jobs[index] = job
+            # pylint: disable=consider-using-f-string
+            self.progress.text = '{} ({:d}/{:d})'.format(Song.clean(song.title),
+                                                         index, self._total_jobs)
+        try:
+            return self.generate_clip(song, start, end, job)
+        except (InvalidMP3Exception, ValueError) as err:
+            traceback.print_exc()
+            # pylint: disable=consider-using-f-string
+            print(r'Error generating clip: {0} - {1}'.format(
+                Song.clean(song.title), str(err)))
+            return None
+        finally:
+            job.pct = 100.0
+            with self._lock:
+                del self.jobs[index]
+
+    def update_progress(self, index: int, pct: float) -> None:
+        """
+        Called when the progress of creating one clip changes
+        """
+        with self._lock:
+            self._job_pct[index] = pct
+            total = sum(self._job_pct.values())
+            self.progress.pct = total / float(max(1, self._total_jobs))
+
+    def clip_filename(self, song: Song) -> Tuple[Path, Metadata]:
+        """
+        Work out the filename and metadata of the clip of a song
+        """
         album: Optional[str] = song.album
         if album is None:
             album = song.fullpath.parent.name
@@ -68,15 +144,43 @@ class ClipGenerator:
         filename = song.filename
         assert filename is not None
         assert filename != ''
-        if not dest_dir.exists():
-            dest_dir.mkdir(parents=True)
-        dest_path = dest_dir / filename
-        metadata = song.as_dict(exclude={'filename', 'ref_id', 'uuid'})
+        # the loudness of the song is not the loudness of the clip
+        metadata = song.as_dict(exclude={'filename', 'ref_id', 'uuid', 'loudness',
+                                         'true_peak', 'loudness_range'})
         metadata['album'] = album
         metadata['artist'] = clean_string(song.artist)
+        return (dest_dir / filename, Metadata(**metadata))
+
+    def clip_exists(self, dest_path: Path, metadata: Metadata, duration: int) -> bool:
+        """
+        Check if a clip has already been created with the given
+        metadata and duration
+        """
+        if self.parser is None or not dest_path.exists():
+            return False
+        try:
+            existing = self.parser.parse(dest_path)
+        except (IOError, InvalidMP3Exception):
+            return False
+        return (existing.title == metadata.title and
+                existing.artist == metadata.artist and
+                existing.album == metadata.album and
+                abs(int(existing.duration) - duration) <= self.DURATION_TOLERANCE)
+
+    def generate_clip(self, song: Song, start: int, end: int,
+                      progress: Optional[Progress] = None) -> Path:
+        """
+        Create one clip from an existing MP3 file.
+        If the clip already exists with the same metadata, it is not
+        created again.
+        """
+        dest_path, metadata = self.clip_filename(song)
         if start > int(song.duration):
             raise ValueError(f'{start} is beyond the duration of song "{song.title}"')
-        with self.mp3.create(dest_path, metadata=Metadata(**metadata)) as output:
+        if self.clip_exists(dest_path, metadata, min(end, int(song.duration)) - start):
+            return dest_path
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.mp3.create(dest_path, metadata=metadata, progress=progress) as output:
             src = self.mp3.use(song).clip(start, end)
             output.append(src)
             output.generate()
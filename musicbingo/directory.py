@@ -12,11 +12,12 @@ import stat
 import sys
 import threading
 from typing import Any, Callable, Dict, List, Optional, Sequence
-from typing import Set, Union, cast
+from typing import Set, Tuple, Union, cast
 
 from .mp3.parser import MP3Parser
 from .hasparent import HasParent
 from .progress import Progress, TextProgress
+from .scanindex import DirectoryEntry, FileEntry, ScanChanges, ScanIndex
 from .song import Song
 from . import models, utils
 from .models.db import session_scope
@@ -56,25 +57,50 @@ class Directory(HasParent):
         # as a done callback. That function also needs to acquire the lock
         self._lock = threading.RLock()
         self._disable_database = False
+        self._scan_index: Optional[ScanIndex] = None
+        self._scan_changes: Optional[ScanChanges] = None
+        # songs from the database for every directory in the tree, keyed
+        # by directory name. Shared (read-only) by all subdirectories
+        self._song_cache: Optional[Dict[str, Dict[str, Dict]]] = None
+        # name of the top directory of the tree in the song cache
+        self._song_cache_top: Optional[str] = None
+        # optional pool of processes used to parse MP3 files
+        self._parse_pool: Optional[futures.Executor] = None
+        # indexes of every song and directory in the tree, by ref_id.
+        # These are shared by every Directory in the tree
+        self._songs_by_id: Dict[int, Song] = {}
+        self._dirs_by_id: Dict[int, Directory] = {}
+        # number of songs in this directory and its subdirectories
+        self._total_songs: Optional[int] = None
         if parent is not None:
             self._disable_database = cast(Directory, parent)._disable_database
+            self._scan_index = cast(Directory, parent)._scan_index
+            self._scan_changes = cast(Directory, parent)._scan_changes
+            self._song_cache = cast(Directory, parent)._song_cache
+            self._song_cache_top = cast(Directory, parent)._song_cache_top
+            self._parse_pool = cast(Directory, parent)._parse_pool
+            self._songs_by_id = cast(Directory, parent)._songs_by_id
+            self._dirs_by_id = cast(Directory, parent)._dirs_by_id
         self.log = logging.getLogger(__name__)
 
-    def search(self, parser: MP3Parser, progress: Progress) -> None:
+    def search(self, parser: MP3Parser, progress: Progress,
+               index: Optional[ScanIndex] = None,
+               parse_workers: int = 0) -> ScanChanges:
         """
         Walk self._fullpath searching for all songs and
         sub-directories.
         This function will block until all of the songs and
         directories have been checked.
-        """
-        try:
-            max_workers = len(os.sched_getaffinity(0)) + 2  # type: ignore
-        except AttributeError:
-            cpu_count = os.cpu_count()
-            if cpu_count is None:
-                max_workers = 2
-            else:
-                max_workers = cpu_count + 2
+        If an index is provided, directories that have not changed since
+        the previous search are not listed again and only new or
+        modified files are parsed.
+        If parse_workers is greater than 1, MP3 files that are not in the
+        cache are parsed using a pool of that many processes. The parser
+        must be picklable.
+        Returns the songs that have been added, changed or removed.
+        """
+        self._scan_index = index
+        self._scan_changes = ScanChanges()
         db_opts = models.db.current_options()
         progress.num_phases = 1
         progress.current_phase = 0
@@ -88,40 +114,80 @@ class Directory(HasParent):
             self.log.warning(
                 'Disabling database as sqlite :memory: not threadsafe')
             self._disable_database = True
-        with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
-            todo = set(self._search_async(pool, parser, 0))
-            done: Set[futures.Future] = set()
-            while todo and not progress.abort:
-                completed, not_done = futures.wait(
-                    todo,
-                    timeout=0.25,
-                    return_when=futures.FIRST_COMPLETED)
-                todo.update(set(not_done))
-                for future in completed:
-                    if progress.abort:
-                        break
-                    try:
-                        err = future.exception()
-                        if err is not None:
-                            progress.text = f'Error: {err}'
-                        else:
-                            result = future.result()
-                            if isinstance(result, list):
-                                todo.update(set(result))
-                            elif result is not None:
-                                progress.text = result.filename
-                    except (futures.TimeoutError, futures.CancelledError):
-                        pass
-                    except KeyboardInterrupt:
-                        progress.abort = True
-                    todo.remove(future)
-                    done.add(future)
-                num_tasks = len(todo) + len(done)
-                if num_tasks > 0:
-                    progress.pct = 100.0 * len(done) / num_tasks
+        if not self._disable_database:
+            self._song_cache_top = cast(Path, self._fullpath).resolve().as_posix()
+            self._song_cache = self._preload_song_cache()
+        if parse_workers > 1:
+            self._parse_pool = futures.ProcessPoolExecutor(max_workers=parse_workers)
+        try:
+            with futures.ThreadPoolExecutor(max_workers=self.max_workers()) as pool:
+                self._wait_for_tasks(pool, parser, progress)
+        finally:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(cancel_futures=True)
+                self._parse_pool = None
         next_id = max(1, self._max_dir_id(), self._max_song_id())
         next_id = self.assign_dir_ids(next_id)
         self.assign_song_ids(next_id)
+        if index is not None and not progress.abort:
+            index.save()
+        self.log.debug('%s: %s', self.filename, self._scan_changes)
+        return self._scan_changes
+
+    def _wait_for_tasks(self, pool: futures.ThreadPoolExecutor, parser: MP3Parser,
+                        progress: Progress) -> None:
+        """
+        Start searching this directory and wait for all of the tasks
+        that the search creates to complete.
+        """
+        todo = set(self._search_async(pool, parser, 0))
+        done: Set[futures.Future] = set()
+        while todo and not progress.abort:
+            completed, not_done = futures.wait(
+                todo,
+                timeout=0.25,
+                return_when=futures.FIRST_COMPLETED)
+            todo.update(set(not_done))
+            for future in completed:
+                if progress.abort:
+                    break
+                try:
+                    err = future.exception()
+                    if err is not None:
+                        progress.text = f'Error: {err}'
+                    else:
+                        result = future.result()
+                        if isinstance(result, list):
+                            todo.update(set(result))
+                        elif result is not None:
+                            progress.text = result.filename
+                except (futures.TimeoutError, futures.CancelledError):
+                    pass
+                except KeyboardInterrupt:
+                    progress.abort = True
+                todo.remove(future)
+                done.add(future)
+            num_tasks = len(todo) + len(done)
+            if num_tasks > 0:
+                progress.pct = 100.0 * len(done) / num_tasks
+        if progress.abort:
+            # stop any tasks that have not yet started
+            pool.shutdown(wait=False, cancel_futures=True)
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def max_workers() -> int:
+        """
+        Number of threads to use when searching for songs
+        """
+        try:
+            return len(os.sched_getaffinity(0)) + 2  # type: ignore
+        except AttributeError:
+            cpu_count = os.cpu_count()
+            if cpu_count is None:
+                return 2
+            return cpu_count + 2
 
     def _search_async(self, pool: futures.Executor, parser: MP3Parser,
                       depth: int) -> List[futures.Future]:
@@ -147,22 +213,68 @@ class Directory(HasParent):
         assert self._fullpath is not None
         if not self._fullpath.is_dir():
             raise IOError(f'Directory "{self._fullpath}" does not exist')
-        self.log.debug('Search %s', self._fullpath.name)
-        for filename in self._fullpath.iterdir():
-            abs_fname = str(filename)
-            fstats = os.stat(abs_fname)
-            if stat.S_ISDIR(fstats.st_mode):
-                subdir = Directory(self, filename)
-                self.subdirectories.append(subdir)
-                tasks.append(
-                    pool.submit(subdir._search_async, pool, parser, depth + 1))
-            elif (stat.S_ISREG(fstats.st_mode) and
-                  abs_fname.lower().endswith(".mp3") and
-                  fstats.st_size <= self.maxFileSize):
-                task = pool.submit(self._parse_song, parser, cache, filename)
-                tasks.append(task)
+        previous: Optional[DirectoryEntry] = None
+        if self._scan_index is not None:
+            previous = self._scan_index.get(self._fullpath)
+        mtime = os.stat(self._fullpath).st_mtime_ns
+        if previous is not None and previous.mtime == mtime:
+            self.log.debug('Unchanged %s', self._fullpath.name)
+            current = previous
+        else:
+            self.log.debug('Search %s', self._fullpath.name)
+            current = self._list_directory(mtime, previous)
+        if self._scan_index is not None and self._scan_changes is not None:
+            removed = [self._fullpath / name for name in cache
+                       if name not in current.files]
+            if previous is not None:
+                removed += [self._fullpath / name for name in previous.files
+                            if name not in current.files and name not in cache]
+                for name in previous.subdirectories:
+                    if name not in current.subdirectories:
+                        removed += self._scan_index.remove_tree(self._fullpath / name)
+                        self._scan_changes.remove_directory(self._fullpath / name)
+            self._scan_changes.remove(removed)
+            self._scan_index.update(self._fullpath, current)
+        for name in current.subdirectories:
+            subdir = Directory(self, self._fullpath / name)
+            self.subdirectories.append(subdir)
+            self._clear_total_length()
+            tasks.append(
+                pool.submit(subdir._search_async, pool, parser, depth + 1))
+        for name, entry in current.files.items():
+            modified = False
+            if previous is not None and name in previous.files:
+                modified = not entry.same_file(previous.files[name])
+            task = pool.submit(self._parse_song, parser, cache,
+                               self._fullpath / name, modified)
+            tasks.append(task)
         return tasks
 
+    def _list_directory(self, mtime: int,
+                        previous: Optional[DirectoryEntry] = None) -> DirectoryEntry:
+        """
+        Find all the MP3 files and subdirectories in this directory.
+        The content digest of any file that has not changed since the
+        previous search is kept.
+        """
+        files: Dict[str, FileEntry] = {}
+        subdirectories: List[str] = []
+        assert self._fullpath is not None
+        with os.scandir(self._fullpath) as entries:
+            for item in entries:
+                fstats = item.stat()
+                if stat.S_ISDIR(fstats.st_mode):
+                    subdirectories.append(item.name)
+                elif (stat.S_ISREG(fstats.st_mode) and
+                      item.name.lower().endswith(".mp3") and
+                      fstats.st_size <= self.maxFileSize):
+                    entry = FileEntry(
+                        size=fstats.st_size, mtime=fstats.st_mtime_ns, inode=fstats.st_ino)
+                    if previous is not None and entry.same_file(previous.files.get(item.name)):
+                        entry = previous.files[item.name]
+                    files[item.name] = entry
+        return DirectoryEntry(mtime=mtime, files=files, subdirectories=subdirectories)
+
     def toplevel_directory(self) -> Path:
         """
         Get absolute path of the directory at the top of the tree
@@ -194,20 +306,92 @@ class Directory(HasParent):
         name = cast(Path, self._fullpath).resolve().as_posix()
         return cast(Optional[models.Directory], models.Directory.get(session, name=name))
 
-    def save_all(self, session: models.DatabaseSession) -> models.Directory:
+    def save_all(self, session: models.DatabaseSession,
+                 changes: Optional[ScanChanges] = None) -> models.Directory:
+        """
+        Save this directory, its songs and its subdirectories.
+        Songs that are already in the database are not modified.
+        If changes is provided, only the songs that have been added or
+        changed are saved, the songs that have been changed are updated,
+        and the songs and directories that have been removed are deleted.
         """
-        Save this directory, its songs and its subdirectories
+        songs: List[Tuple[int, Song]] = []
+        parent: Optional[models.Directory] = None
+        if self._parent is not None:
+            parent = cast(Directory, self._parent).model(session)
+        db_dir = self._save_tree(session, parent, changes, songs)
+        if changes is None:
+            Song.save_all(session, songs)
+            return db_dir
+        Song.save_all(session, songs, set(changes.changed))
+        self.delete_songs(session, changes.removed)
+        self.delete_directories(session, changes.removed_directories)
+        return db_dir
+
+    def _save_tree(self, session: models.DatabaseSession,
+                   parent: Optional[models.Directory],
+                   changes: Optional[ScanChanges],
+                   songs: List[Tuple[int, Song]]) -> models.Directory:
         """
-        db_dir: models.Directory = self.save(session, True)
+        Save this directory and its subdirectories, adding the songs
+        that need to be saved to "songs".
+        """
+        db_dir = self.save(session, True, parent=parent)
         for song in self.songs:
-            song.save(session, db_dir)
+            if changes is None or song in changes:
+                songs.append((db_dir.pk, song))
         for sub_dir in self.subdirectories:
-            sub_dir.save_all(session)
+            sub_dir._save_tree(session, db_dir, changes, songs)
         return db_dir
 
-    def save(self, session: models.DatabaseSession, flush: bool = False) -> models.Directory:
+    @staticmethod
+    def delete_songs(session: models.DatabaseSession, filenames: Sequence[Path]) -> int:
+        """
+        Remove songs from the database, unless they are used by a game.
+        Returns the number of songs that were deleted.
+        """
+        count = 0
+        for filename in filenames:
+            db_dir = models.Directory.get(session, name=filename.parent.resolve().as_posix())
+            if db_dir is None:
+                continue
+            db_song = cast(Optional[models.Song], models.Song.get(
+                session, directory=db_dir, filename=filename.name))
+            if db_song is None or db_song.tracks:
+                continue
+            session.delete(db_song)
+            count += 1
+        return count
+
+    @staticmethod
+    def delete_directories(session: models.DatabaseSession,
+                           directories: Sequence[Path]) -> int:
+        """
+        Remove directories, and their subdirectories, from the database,
+        unless they still contain songs (e.g. songs used by a game).
+        Returns the number of directories that were deleted.
+        """
+        count = 0
+        for directory in directories:
+            name = directory.resolve().as_posix()
+            query = session.query(models.Directory).filter(
+                (models.Directory.name == name) |
+                models.Directory.name.startswith(name + '/', autoescape=True))
+            # delete subdirectories before their parent directory
+            for db_dir in sorted(query, key=lambda item: len(item.name), reverse=True):
+                if (models.Song.search(session, directory_pk=db_dir.pk).count() or
+                        models.Directory.search(session, parent_pk=db_dir.pk).count()):
+                    continue
+                session.delete(db_dir)
+                session.flush()
+                count += 1
+        return count
+
+    def save(self, session: models.DatabaseSession, flush: bool = False,
+             parent: Optional[models.Directory] = None) -> models.Directory:
         """
         Save directory to database
+        :parent: the database model of the parent directory, if already known
         """
         assert self._fullpath is not None
         name = self._fullpath.resolve().as_posix()
@@ -217,7 +401,9 @@ class Directory(HasParent):
         if db_dir is None:
             db_dir = models.Directory(name=name, title=self.title)
             add = True
-        if self._parent is not None:
+        if parent is not None:
+            db_dir.parent = parent
+        elif self._parent is not None:
             parent_dir: Directory = cast(Directory, self._parent)
             db_dir.parent = parent_dir.model(session)
         if add:
@@ -240,31 +426,73 @@ class Directory(HasParent):
         self.log.debug('fallback to JSON')
         return self._check_json_file()
 
-    def _check_database(self) -> Optional[Dict[str, Dict]]:
+    def _preload_song_cache(self) -> Dict[str, Dict[str, Dict]]:
         """
-        Check database for this directory.
-        If found, load all songs for this directory into the
-        cache
+        Load the songs of every directory in this tree from the database,
+        using one query. Returns a dictionary, keyed by directory name, of
+        the song cache for each directory.
         """
+        assert self._fullpath is not None
+        top = self._fullpath.resolve().as_posix()
+        prefix = top.rstrip('/') + '/'
+        result = self._query_songs(
+            (models.Directory.name == top) |
+            models.Directory.name.startswith(prefix, autoescape=True))
+        self.log.debug('Found %d songs in %d directories in DB',
+                       sum(len(songs) for songs in result.values()), len(result))
+        return result
+
+    @staticmethod
+    def _query_songs(condition) -> Dict[str, Dict[str, Dict]]:
+        """
+        Load the songs of every directory that matches condition from the
+        database. Returns a dictionary, keyed by directory name, of the
+        song cache for each directory.
+        """
+        result: Dict[str, Dict[str, Dict]] = {}
+        exclude = {'pk', 'directory', 'artist', 'album', 'filename', 'classtype'}
         with session_scope() as session:
-            db_dir = self.model(session)
-            if db_dir is None:
-                return None
-            cache: Dict[str, Dict] = {}
-            self.log.debug('Found DB model')
-            exclude = {'pk', 'directory', 'artist', 'album'}
-            # self._model = db_dir
-            for db_song in db_dir.songs:
-                cache[db_song.filename] = db_song.to_dict(exclude=exclude)
-                if db_song.album is not None:
-                    cache[db_song.filename]['album'] = db_song.album.name
-                if db_song.artist is not None:
-                    cache[db_song.filename]['artist'] = db_song.artist.name
-                if 'classtype' in cache[db_song.filename]:
-                    del cache[db_song.filename]['classtype']
-                del cache[db_song.filename]['filename']
-            self.log.debug('Found %d songs in DB', len(cache.keys()))
-            return cache
+            query = session.query(
+                models.Song, models.Directory.name, models.Artist.name, models.Album.name,
+            ).join(
+                models.Directory, models.Song.directory_pk == models.Directory.pk
+            ).outerjoin(
+                models.Artist, models.Song.artist_pk == models.Artist.pk
+            ).outerjoin(
+                models.Album, models.Song.album_pk == models.Album.pk
+            ).filter(condition)
+            for db_song, dir_name, artist, album in query:
+                mdata = db_song.to_dict(exclude=exclude)
+                if album is not None:
+                    mdata['album'] = album
+                if artist is not None:
+                    mdata['artist'] = artist
+                result.setdefault(dir_name, {})[db_song.filename] = mdata
+        return result
+
+    def _check_database(self) -> Optional[Dict[str, Dict]]:
+        """
+        Check the songs that were loaded from the database for this
+        directory. Returns None if the database has no songs for this
+        directory.
+        """
+        if self._song_cache is None:
+            return None
+        assert self._fullpath is not None
+        name = self._fullpath.resolve().as_posix()
+        songs = self._song_cache.get(name)
+        top = cast(str, self._song_cache_top)
+        if songs is None and name != top and not name.startswith(top.rstrip('/') + '/'):
+            # a symbolic link to a directory outside of the tree, which
+            # was not included in the song cache
+            songs = self._query_songs(models.Directory.name == name).get(name)
+        if songs is None:
+            return None
+        # the shared cache must not be modified, as _parse_song() alters
+        # the dictionary that it is given
+        cache = {fname: dict(mdata) for fname, mdata in songs.items()}
+        self.log.debug('Found %d songs in DB', len(cache))
+        return cache
 
     def _check_json_file(self) -> Dict[str, Dict]:
         """
@@ -302,58 +530,122 @@ class Directory(HasParent):
         return cache
 
     def _parse_song(self, parser: MP3Parser, cache: Dict[str, dict],
-                    filename: Path) -> None:
+                    filename: Path, modified: bool = False) -> None:
         """
         Create a Song object for an MP3 file and append to songs list.
         The cache is checked and if that does not contain a match,
-        the file will be parsed.
-        """
-        song: Optional[Song] = None
-        try:
-            mdata = cache[filename.name]
-            for name in self.LEGACY_SONG_ATTRIBUTES:
-                try:
-                    del mdata[name]
-                except KeyError:
-                    pass
-            self.log.debug('Use cache for "%s"', filename.name)
-            self.log.debug('   %s', mdata)
-            if 'ref_id' not in mdata:
-                mdata['ref_id'] = -1
-            for field in ['title', 'album']:
-                if field in mdata:
-                    mdata[field] = utils.clean_string(mdata[field])
-            song = Song(filename.name, parent=self, **mdata)
-        except KeyError:
-            self.log.debug('"%s": Failed to find "%s" in cache', self.filename,
-                           filename.name)
-        if song is None:
+        or the file has been modified, the scan index is checked for
+        a file with the same contents. If neither contains a match,
+        the file will be parsed. A song that is loaded from the cache
+        but is not in the scan index is recorded as a new song.
+        """
+        mdata: Optional[Dict] = None
+        digest: str = ''
+        new_song = False
+        if modified:
+            self.log.debug('"%s": "%s" has been modified', self.filename, filename.name)
+        else:
+            mdata = cache.get(filename.name)
+            if mdata is None:
+                self.log.debug('"%s": Failed to find "%s" in cache', self.filename,
+                               filename.name)
+        from_cache = mdata is not None
+        if self._scan_index is not None:
+            digest = self._scan_index.digest(filename.parent, filename.name)
+            if mdata is None:
+                mdata = self._scan_index.find_song(digest)
+                if mdata is not None:
+                    self.log.debug('Found "%s" using its content digest', filename.name)
+                    new_song = True
+            elif self._scan_index.find_song(digest) is None:
+                self.log.debug('"%s" is not in the scan index', filename.name)
+                new_song = True
+        if mdata is not None:
+            song = self._song_from_cache(filename, mdata)
+        else:
             self.log.info('Parse "%s"', filename.name)
-            metadata = parser.parse(filename).as_dict()
+            if self._parse_pool is not None:
+                metadata = self._parse_pool.submit(parse_song_worker, parser, filename).result()
+            else:
+                metadata = parser.parse(filename).as_dict()
             song = Song(filename.name, parent=self, **metadata)
-        assert song is not None
+            new_song = True
+        if new_song and self._scan_changes is not None:
+            self._scan_changes.add(song, changed=(not from_cache and filename.name in cache))
+        if digest and self._scan_index is not None:
+            self._scan_index.add_song(digest, song)
         with self._lock:
             self.songs.append(song)
+        self._clear_total_length()
+        if song.ref_id > 0:
+            self._songs_by_id[song.ref_id] = song
+
+    def _song_from_cache(self, filename: Path, mdata: Dict) -> Song:
+        """
+        Create a Song object using cached metadata
+        """
+        for name in self.LEGACY_SONG_ATTRIBUTES:
+            try:
+                del mdata[name]
+            except KeyError:
+                pass
+        self.log.debug('Use cache for "%s"', filename.name)
+        self.log.debug('   %s', mdata)
+        if 'ref_id' not in mdata:
+            mdata['ref_id'] = -1
+        for field in ['title', 'album']:
+            if field in mdata:
+                mdata[field] = utils.clean_string(mdata[field])
+        return Song(filename.name, parent=self, **mdata)
 
     def find(self, ref_id: int) -> Optional[Song]:
-        """Find a Song by its ref_id"""
+        """
+        Find a Song by its ref_id.
+        The ref_id index is checked first. If the index does not contain
+        a matching song inside this directory, the directory tree is
+        searched and the index is updated with the song that was found.
+        """
+        song = self._songs_by_id.get(ref_id)
+        if song is not None and song.ref_id == ref_id and self._contains(song):
+            return song
+        song = self._find_in_tree(ref_id)
+        if song is not None:
+            self._songs_by_id[ref_id] = song
+        return song
+
+    def _find_in_tree(self, ref_id: int) -> Optional[Song]:
+        """
+        Find a Song by its ref_id, by searching this directory and
+        all of its subdirectories
+        """
         for song in self.songs:
             if song.ref_id == ref_id:
                 return song
         for sub_dir in self.subdirectories:
-            song2 = sub_dir.find(ref_id)
+            song2 = sub_dir._find_in_tree(ref_id)
             if song2 is not None:
                 return song2
         return None
 
     def total_length(self) -> int:
         """Returns total number of songs.
-        Returns total of songs in this directory plus any subdirectories
+        Returns total of songs in this directory plus any subdirectories.
+        The total is calculated by assign_song_ids()
         """
-        total = len(self.songs)
-        for sub_dir in self.subdirectories:
-            total += len(sub_dir)
-        return total
+        if self._total_songs is None:
+            return len(self.songs) + sum(
+                sub_dir.total_length() for sub_dir in self.subdirectories)
+        return self._total_songs
+
+    def _clear_total_length(self) -> None:
+        """
+        Remove the cached number of songs of this directory and of every
+        directory that contains it
+        """
+        node: Optional[HasParent] = self
+        while isinstance(node, Directory):
+            node._total_songs = None
+            node = node._parent
 
     def get_songs(self, ref_id: int) -> List[Song]:
         """
@@ -361,19 +653,38 @@ class Directory(HasParent):
         Returns a list of all songs that match ref_id or all songs
         in a directory if its ref_id matches
         """
+        directory: Optional[Directory] = self
+        if ref_id != self.ref_id:
+            directory = self._dirs_by_id.get(ref_id)
+        if (directory is not None and directory.ref_id == ref_id and
+                self._contains(directory)):
+            return directory._all_songs()
+        song = self.find(ref_id)
+        if song is None:
+            return []
+        return [song]
+
+    def _all_songs(self) -> List[Song]:
+        """
+        Get every song in this directory and its subdirectories
+        """
         song_list: List[Song] = []
-        if ref_id == self.ref_id:
-            for sub_dir in self.subdirectories:
-                song_list += sub_dir.get_songs(sub_dir.ref_id)
-            song_list += self.songs
-        else:
-            for sub_dir in self.subdirectories:
-                song_list += sub_dir.get_songs(ref_id)
-            for song in self.songs:
-                if ref_id == song.ref_id:
-                    song_list.append(song)
+        for sub_dir in self.subdirectories:
+            song_list += sub_dir._all_songs()
+        song_list += self.songs
         return song_list
 
+    def _contains(self, item: HasParent) -> bool:
+        """
+        Check if item is this directory or is inside this directory
+        """
+        node: Optional[HasParent] = item
+        while node is not None:
+            if node is self:
+                return True
+            node = node._parent
+        return False
+
     def sort(self, key: Union[str, Callable[[HasParent], Any]], reverse: bool = False) -> None:
         """Sort directories and songs within each directory"""
         if isinstance(key, str):
@@ -397,8 +708,7 @@ class Directory(HasParent):
             return
         with session_scope() as session:
             db_dir = self.save(session, flush=True)
-            for song in self.songs:
-                song.save(session, db_dir)
+            Song.save_all(session, [(db_dir.pk, song) for song in self.songs])
         if not self.STORE_LEGACY_JSON:
             return
         songs = [
@@ -453,10 +763,12 @@ class Directory(HasParent):
     def assign_dir_ids(self, next_id: int) -> int:
         """
         Assign a ref_id to any directory that does not have a ref_id
+        and add every directory to the ref_id index
         """
         if self.ref_id < 1:
             self.ref_id = next_id
             next_id += 1
+        self._dirs_by_id[self.ref_id] = self
         for subdir in self.subdirectories:
             if subdir.ref_id < 1:
                 subdir.ref_id = next_id
@@ -467,13 +779,18 @@ class Directory(HasParent):
     def assign_song_ids(self, next_id: int) -> int:
         """
         Assign a ref_id to any song that does not have a ref_id
+        and add every song to the ref_id index
         """
         for song in self.songs:
             if song.ref_id < 1:
                 song.ref_id = next_id
                 next_id += 1
+            self._songs_by_id[song.ref_id] = song
+        total = len(self.songs)
         for subdir in self.subdirectories:
             next_id = subdir.assign_song_ids(next_id)
+            total += subdir.total_length()
+        self._total_songs = total
         return next_id
 
     def _max_dir_id(self) -> int:
@@ -499,6 +816,14 @@ class Directory(HasParent):
         return max_id
 
 
+def parse_song_worker(parser: MP3Parser, filename: Path) -> Dict[str, Any]:
+    """
+    Parse one MP3 file.
+    This function is used by the worker processes of Directory.search()
+    """
+    return parser.parse(filename).as_dict()
+
+
 def main(args: Sequence[str]) -> int:
     """used for testing directory searching from the command line"""
     # pylint: disable=import-outside-toplevel
@@ -512,10 +837,10 @@ def main(args: Sequence[str]) -> int:
         logging.getLogger(__name__).setLevel(logging.DEBUG)
         logging.getLogger(models.db.__name__).setLevel(logging.DEBUG)
     models.db.DatabaseConnection.bind(opts.database, debug=opts.debug)
-    mp3parser = MP3Factory.create_parser()
+    mp3parser = MP3Factory.create_parser(opts.mp3_parser)
     clips = Directory(None, Path(opts.clip_directory))
     progress = TextProgress()
-    clips.search(mp3parser, progress)
+    clips.search(mp3parser, progress, parse_workers=opts.parse_workers)
     clips.sort('filename')
     with session_scope() as session:
         clips.save_all(session)
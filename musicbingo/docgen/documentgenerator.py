@@ -463,3 +463,35 @@ class DocumentGenerator(ABC):
                progress: Progress, debug: bool = False, showBoundary: bool = False) -> None:
         """Render the given document"""
         raise NotImplementedError()
+
+    def render_pages(self, filename: str, document: Document,
+                     pages: Iterable[List[Element]], progress: Progress,
+                     debug: bool = False) -> None:
+        """
+        Render a document where the elements of each page are provided
+        by an iterator. Each page, apart from the last page, must end
+        with a PageBreak.
+        The default implementation adds every page to the document and then
+        calls render(). A generator can override this function to render
+        one page at a time.
+        """
+        for page in pages:
+            for elt in page:
+                document.append(elt)
+        self.render(filename, document, progress, debug=debug)
+
+    @classmethod
+    def supports_merge(cls) -> bool:
+        """
+        Check if this generator is able to merge documents using
+        merge_documents()
+        """
+        return False
+
+    @classmethod
+    def merge_documents(cls, filenames: List[str], destination: str) -> None:
+        """
+        Combine the given documents, in the order they are listed, into
+        one document.
+        """
+        raise NotImplementedError()
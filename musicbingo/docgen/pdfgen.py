@@ -12,6 +12,12 @@ from typing import (
 from reportlab import platypus, lib  # type: ignore
 from reportlab.pdfgen.canvas import Canvas  # type: ignore
 
+try:
+    from pypdf import PdfWriter
+    USE_PYPDF = True
+except ImportError:
+    USE_PYPDF = False
+
 from musicbingo.progress import Progress
 from musicbingo.tests.mixin import TestCaseMixin
 from musicbingo.docgen.colour import Colour
@@ -153,6 +159,8 @@ class DocumentState(TestCaseMixin):
     def __init__(self, doc: DG.Document, show_boundary: bool = False, debug: bool = False):
         self.doc = doc
         self.templates: List[platypus.PageTemplate] = []
+        # number of templates that have been removed using take_templates()
+        self.templates_taken = 0
         self.current_template: Optional[platypus.PageTemplate] = None
         self.elements: List[platypus.Flowable] = []
         self.page_complete: Optional[OnPageComplete] = None
@@ -165,7 +173,7 @@ class DocumentState(TestCaseMixin):
         Add a container to this page, using a platypus frame
         """
         if self.current_template is None:
-            page = len(self.templates) + 1
+            page = self.templates_taken + len(self.templates) + 1
             pagesize = (self.doc.pagesize.width().points(),
                         self.doc.pagesize.height().points())
             if self.page_complete is None:
@@ -232,11 +240,20 @@ class DocumentState(TestCaseMixin):
         self.templates.append(self.current_template)
         self.current_template = None
         if add_next:
-            page = len(self.templates) + 1
+            page = self.templates_taken + len(self.templates) + 1
             self.log.debug('adding NextPageTemplate "page%s"', page)
             return platypus.NextPageTemplate(f'page{page}')
         return None
 
+    def take_templates(self) -> List[platypus.PageTemplate]:
+        """
+        Remove and return the templates of all completed pages
+        """
+        templates = self.templates
+        self.templates_taken += len(templates)
+        self.templates = []
+        return templates
+
     def append_overlay(self, elt: DG.OverlayElement) -> None:
         """
         Add an overlay element to this page
@@ -249,6 +266,53 @@ class DocumentState(TestCaseMixin):
             self.page_complete.append(FixedText(elt))
 
 
+class StreamingDocTemplate(platypus.BaseDocTemplate):
+    """
+    A platypus document that is built incrementally, rather than
+    requiring a list of every flowable in the document.
+    Flowables are laid out as soon as they are added, so the flowables
+    and page templates of finished pages do not need to be kept.
+    The reportlab canvas still keeps every finished page until the
+    document is saved, so the memory used by a document grows with its
+    number of pages. The pages_per_doc option is what limits that, by
+    splitting the tickets across several PDF files.
+    This class uses the BaseDocTemplate._startBuild() and _endBuild()
+    functions of reportlab, which is why reportlab is pinned to a
+    specific version in requirements.txt.
+    """
+
+    def start(self, templates: List[platypus.PageTemplate]) -> None:
+        """
+        Start building the document, using the given page templates
+        """
+        self.addPageTemplates(templates)
+        self._startBuild()
+        self.canv._doctemplate = self
+
+    def add_flowables(self, flowables: List[platypus.Flowable]) -> None:
+        """
+        Lay out the given flowables. The page templates used by these
+        flowables must have already been added to the document.
+        """
+        while flowables:
+            self.clean_hanging()
+            self.handle_flowable(flowables)
+
+    def discard_templates(self, keep: List[platypus.PageTemplate]) -> None:
+        """
+        Remove page templates for pages that have already been written
+        """
+        self.pageTemplates[:] = [tmpl for tmpl in self.pageTemplates
+                                 if tmpl in keep or tmpl is self.pageTemplate]
+
+    def finish(self) -> None:
+        """
+        Complete the document and save the PDF file
+        """
+        del self.canv._doctemplate
+        self._endBuild()
+
+
 # function prototype for each render_something() function
 # pylint: disable=invalid-name, line-too-long
 RENDER_FUNC = Callable[[Union[DG.Element, Iterable[DG.Element]], DocumentState], List[platypus.Flowable]]
@@ -307,9 +371,82 @@ class PDFGenerator(DG.DocumentGenerator):
         doc.build(state.elements)
         progress.pct = 100.0
 
+    def render_pages(self, filename: str, document: DG.Document,
+                     pages: Iterable[List[DG.Element]], progress: Progress,
+                     debug: bool = False) -> None:
+        """
+        Renders a document one page at a time, so that the elements of
+        every page do not need to be created before the document is
+        rendered. The finished pages are kept by reportlab until the
+        file is saved.
+        """
+        state = DocumentState(document, debug=debug)
+        doc = cast(StreamingDocTemplate,
+                   self.render_document(filename, document, StreamingDocTemplate))
+        started = False
+        # The flowables that end a page select the page template of the
+        # next page, so they are held back until the next page has been
+        # translated
+        pending: List[platypus.Flowable] = []
+        for page in pages:
+            state.elements = []
+            if not any(isinstance(elt, DG.Container) for elt in page):
+                state.add_frame(document.available_area())
+            for elt in page:
+                state.elements += self.renderers[type(elt)](elt, state)
+            if state.current_template is not None:
+                state.page_end(False)
+            templates = state.take_templates()
+            if not started:
+                doc.start(templates)
+                started = True
+            else:
+                doc.addPageTemplates(templates)
+            flowables = pending + state.elements
+            pending = []
+            while (flowables and
+                   isinstance(flowables[-1], (platypus.NextPageTemplate, platypus.PageBreak))):
+                pending.insert(0, flowables.pop())
+            doc.add_flowables(flowables)
+            doc.discard_templates(templates)
+        if not started:
+            state.add_frame(document.available_area())
+            state.page_end(False)
+            doc.start(state.take_templates())
+        state.log.debug('doc.finish %s pages=%d', filename, doc.page)
+        doc.finish()
+        progress.pct = 100.0
+
+    @classmethod
+    def supports_merge(cls) -> bool:
+        """
+        Merging PDF files requires the pypdf library
+        """
+        return USE_PYPDF
+
+    @classmethod
+    def merge_documents(cls, filenames: List[str], destination: str) -> None:
+        """
+        Combine the given PDF files, in the order they are listed, into
+        one PDF file. The document properties of the first file are used
+        for the combined file.
+        """
+        if not USE_PYPDF:
+            raise NotImplementedError('Merging PDF files requires the pypdf library')
+        writer = PdfWriter(clone_from=filenames[0])
+        for filename in filenames[1:]:
+            writer.append(filename)
+        # Each file contains its own copy of the images and fonts
+        writer.compress_identical_objects()
+        with open(destination, 'wb') as dest:
+            writer.write(dest)
+        writer.close()
+
     @staticmethod
     def render_document(filename: str,
-                        document: DG.Document) -> platypus.BaseDocTemplate:
+                        document: DG.Document,
+                        doc_class: Type[platypus.BaseDocTemplate] = platypus.BaseDocTemplate
+                        ) -> platypus.BaseDocTemplate:
         """
         Create a platypus document from a Document
         """
@@ -318,7 +455,7 @@ class PDFGenerator(DG.DocumentGenerator):
         pagesize = (document.pagesize.width().points(),
                     document.pagesize.height().points())
         # print('render_document', filename)
-        return platypus.BaseDocTemplate(
+        return doc_class(
             filename,
             _debug=True,
             pagesize=pagesize,
@@ -13,17 +13,23 @@ generated for use in a Bingo game.
 """
 
 from __future__ import print_function
+import collections
+from concurrent import futures
 import copy
 import datetime
+import itertools
 import json
 import logging
 import math
+from pathlib import Path
 import random
 import re
 import secrets
 import statistics
 import sys
-from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, cast
+from typing import (
+    Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type, cast
+)
 
 from . import models
 from .models.db import db_session
@@ -41,13 +47,15 @@ from .docgen.styles import (
     ElementStyle, RowStyle, TableStyle, Padding)
 from .duration import Duration
 from .mp3.editor import MP3Editor, MP3FileWriter
+from .mp3.loudness import LoudnessAnalyser, calculate_gain
 from .options import GameMode, Options, PageSortOrder
-from .primes import PRIME_NUMBERS
 from .progress import Progress, TextProgress
 from .metadata import Metadata
 from .song import Song
+from .ticketkey import MAX_TRACKS, key_to_str, ticket_key
 from .track import Track
 from .utils import flatten
+from .winengine import WinEngine
 
 
 # pylint: disable=too-many-instance-attributes
@@ -131,20 +139,31 @@ class GameGenerator:
         colour='black',
     )
 
+    PDF_PAGES_PER_JOB: int = 32  # max pages rendered by each PDF worker job
     MIN_GENERATED_CARDS: int = 16  # min number of cards required by generator
     MIN_SONGS: int = 17  # 17 songs allows 136 combinations
-    MAX_SONGS: int = len(PRIME_NUMBERS)
+    MAX_SONGS: int = MAX_TRACKS
     DECAY_RATE: float = 0.65
 
     def __init__(self, options: Options, mp3_editor: MP3Editor,
                  doc_gen: DG.DocumentGenerator,
-                 progress: Progress) -> None:
+                 progress: Progress,
+                 rng: Optional[random.Random] = None) -> None:
         self.options = options
         self.mp3_editor = mp3_editor
         self.doc_gen = doc_gen
         self.progress = progress
         #self.game_songs: List[Song] = []
         self.used_fingerprints: Set[int] = set()
+        self.win_engine: Optional[WinEngine] = None
+        # If a random number generator has not been provided and a seed
+        # has not been specified, the secrets library is used for all random
+        # numbers
+        if rng is None and options.seed is not None:
+            rng = random.Random(options.seed)
+        self.rng = rng
+        # tickets created by generate_ticket_pool(), indexed by win point
+        self.ticket_pool: Dict[int, List[BingoTicket]] = {}
         self.log = logging.getLogger('generator')
 
     @db_session
@@ -192,25 +211,52 @@ class GameGenerator:
         else:
             self.progress.num_phases = 2
         self.progress.current_phase = 0
-        tracks = self.generate_mp3(songs)
-        if self.progress.abort:
+        if self.options.crossfade > 0:
+            self.analyse_loudness(songs, session)
+            if self.progress.abort:
+                return
+        if not self.options.background_encode:
+            tracks = self.generate_mp3(songs)
+            if self.progress.abort:
+                return
+            self.generate_from_tracks(game, tracks, session)
             return
+        # The MP3 file is encoded in a background thread, while the
+        # tickets and PDF files are generated
+        with futures.ThreadPoolExecutor(max_workers=1) as pool:
+            tracks, output, encode = self.start_mp3(songs, pool)
+            try:
+                if not self.progress.abort:
+                    self.generate_from_tracks(game, tracks, session)
+            except Exception:
+                output.progress.abort = True
+                raise
+            self.wait_for_mp3(output, encode)
+
+    def analyse_loudness(self, songs: Sequence[Song], session) -> None:
+        """
+        Measure the loudness of any songs that have not already been
+        measured, and store the results in the database so that they
+        do not need to be measured again
+        """
+        analyser = LoudnessAnalyser(self.mp3_editor, self.progress)
+        measured = analyser.analyse(songs)
+        if measured:
+            analyser.save(session, measured)
+
+    def generate_from_tracks(self, game: models.Game, tracks: List[Track], session) -> None:
+        """
+        Save the tracks of a game and generate its Bingo tickets and PDF files
+        """
         self.progress.current_phase = 1
-        db_tracks: List[models.Track] = []
-        for track in tracks:
-            song = track.song.model(session)
-            assert song is not None
-            db_tracks.append(track.save(game=game, song=song, session=session))
-        session.flush()
-        db_cards: List[models.BingoTicket] = []
+        db_tracks = Track.save_all(session, game, tracks)
         if self.options.mode != GameMode.BINGO:
             return
         self.progress.current_phase = 2
         cards = self.generate_all_cards(tracks)
         if self.progress.abort:
             return
-        for card in cards:
-            db_cards.append(card.save(game=game, session=session))
+        db_cards = BingoTicket.save_all(session, game, cards, db_tracks)
         self.progress.current_phase = 3
         self.generate_tickets_pdf(cards)
         if self.progress.abort:
@@ -262,6 +308,48 @@ class GameGenerator:
         of each song set to their positon in the output.
         """
         songs = self.gen_track_order(songs)
+        with self.create_mp3_writer(songs, self.progress) as output:
+            tracks = self.append_songs(output, songs)
+        return tracks
+
+    def start_mp3(self, songs: Sequence[Song],
+                  pool: futures.Executor) -> Tuple[List[Track], MP3FileWriter, futures.Future]:
+        """
+        Start generating the mp3 for the game in the background.
+        The position of each track in the output is known before the
+        MP3 file is encoded, so the tracks can be used straight away.
+        Returns the list of tracks, the output file (which has its own
+        Progress object) and a Future for the encode of the MP3 file.
+        """
+        songs = self.gen_track_order(songs)
+        output = self.create_mp3_writer(songs, Progress())
+        tracks = self.add_songs(output, songs)
+        output.progress.abort = self.progress.abort
+        self.progress.current_phase += 1
+        self.progress.text = 'Generating MP3 file in the background'
+        encode = pool.submit(output.close)
+        if not self.progress.abort:
+            self.generate_track_listing(tracks)
+        return (tracks, output, encode)
+
+    def wait_for_mp3(self, output: MP3FileWriter, encode: futures.Future) -> None:
+        """
+        Wait for an encode started by start_mp3() to complete
+        """
+        self.progress.text = 'Waiting for MP3 file to be generated'
+        while True:
+            if self.progress.abort:
+                output.progress.abort = True
+            try:
+                encode.result(timeout=0.25)
+                return
+            except futures.TimeoutError:
+                self.progress.pct = output.progress.pct
+
+    def create_mp3_writer(self, songs: Sequence[Song], progress: Progress) -> MP3FileWriter:
+        """
+        Create the output file for the MP3 of a game
+        """
         mp3_name = self.options.mp3_output_name()
         album: str = ''
         albums: Set[str] = set()
@@ -286,16 +374,36 @@ class GameGenerator:
             bitrate=self.options.bitrate,
             duration=Duration(0),
         )
-        with self.mp3_editor.create(mp3_name, metadata=metadata,
-                                    progress=self.progress) as output:
-            tracks = self.append_songs(output, songs)
-        return tracks
+        return self.mp3_editor.create(mp3_name, metadata=metadata, progress=progress)
 
     # pylint: disable=too-many-statements
     def append_songs(self, output: MP3FileWriter,
                      songs: List[Song]) -> List[Track]:
         """
-        Append all of the songs to the specified output.
+        Append all of the songs to the specified output and generate
+        the MP3 file.
+        Returns a new song list with the start_time metadata property
+        of each song set to their positon in the output.
+        """
+        tracks = self.add_songs(output, songs)
+        if self.progress.abort:
+            return tracks
+        self.progress.text = 'Generating MP3 file'
+        self.progress.current_phase += 1
+        output.generate()
+        if self.progress.abort:
+            return tracks
+        self.progress.text = 'MP3 Generated, creating track listing PDF'
+        self.generate_track_listing(tracks)
+        self.progress.text = 'MP3 and Track listing PDF generated'
+        self.progress.pct = 100.0
+        return tracks
+
+    def add_songs(self, output: MP3FileWriter,
+                  songs: List[Song]) -> List[Track]:
+        """
+        Append all of the songs to the specified output, without
+        generating the MP3 file.
         Returns a new song list with the start_time metadata property
         of each song set to their positon in the output.
         """
@@ -306,11 +414,19 @@ class GameGenerator:
         else:
             countdown = self.mp3_editor.use(Assets.countdown(sample_rate))
         overlap: Optional[Duration] = None
+        gains: List[Optional[float]] = [None] * len(songs)
         if self.options.crossfade > 0:
             overlap = Duration(self.options.crossfade)
+            gains = [calculate_gain(song) for song in songs]
+        # if the loudness of the songs has been measured, a fixed gain is
+        # applied to each song, rather than normalising the whole output.
+        # A song that is silent or could not be measured is left unchanged
+        use_gains = any(gain is not None for gain in gains)
         if self.options.mode == GameMode.BINGO:
             output.append(countdown)
         tracks: List[Track] = []
+        # index of each track in the list of files added to output
+        positions: List[int] = []
         num_tracks = len(songs)
         for index, song in enumerate(songs, start=1):
             self.log.debug(r'song[%d] = %s', index, song)
@@ -320,6 +436,9 @@ class GameGenerator:
                 output.append(transition, overlap=overlap)
             cur_pos = output.duration
             next_track = self.mp3_editor.use(song)
+            gain = gains[index - 1]
+            if use_gains and gain is not None:
+                next_track = next_track.amplify(gain)
             if self.options.mode == GameMode.QUIZ:
                 try:
                     start, end = Assets.QUIZ_COUNTDOWN_POSITIONS[str(index)]
@@ -330,26 +449,24 @@ class GameGenerator:
                     break
                 output.append(number)
                 output.append(transition)
-            output.append(next_track, overlap=overlap)
+            positions.append(output.append(next_track, overlap=overlap))
             tracks.append(
-                Track(song=song, prime=PRIME_NUMBERS[index - 1],
+                Track(song=song, number=(index - 1),
                       start_time=int(cur_pos)))
             self.progress.text = f'Adding track {index}/{num_tracks}'
             self.progress.pct = 100.0 * float(index) / float(num_tracks)
         output.append(transition, overlap=overlap)
         if self.options.crossfade > 0:
-            # if we need to re-encode the stream anyway, might as well also
-            # do loudness normalisation
-            output.normalize(1)
-        self.progress.text = 'Generating MP3 file'
-        self.progress.current_phase += 1
-        output.generate()
-        if self.progress.abort:
-            return tracks
-        self.progress.text = 'MP3 Generated, creating track listing PDF'
-        self.generate_track_listing(tracks)
-        self.progress.text = 'MP3 and Track listing PDF generated'
-        self.progress.pct = 100.0
+            if not use_gains:
+                # if we need to re-encode the stream anyway, might as well
+                # also do loudness normalisation
+                output.normalize(1)
+        else:
+            # the output might be created without re-encoding, which
+            # can only trim each file to the nearest MPEG audio frame
+            start_times = output.start_times()
+            for track, pos in zip(tracks, positions):
+                track.start_time = start_times[pos]
         return tracks
 
     def select_songs_for_ticket(self, songs: List[Track],
@@ -358,15 +475,15 @@ class GameGenerator:
         valid_card = False
         picked_indices: Set[int] = set()
         card.tracks = []
-        card.fingerprint = 1
+        card.fingerprint = 0
         while not valid_card and not self.progress.abort:
             valid_index = False
             index = 0
             while not valid_index:
-                index = secrets.randbelow(len(songs))
+                index = self.randbelow(len(songs))
                 valid_index = index not in picked_indices
             card.tracks.append(songs[index])
-            card.fingerprint = card.fingerprint * songs[index].prime
+            card.fingerprint |= 1 << songs[index].number
             picked_indices.add(index)
             if len(card.tracks) == num_tracks:
                 valid_card = True
@@ -374,7 +491,35 @@ class GameGenerator:
                     valid_card = False
                     picked_indices = set()
                     card.tracks = []
-                    card.fingerprint = 1
+                    card.fingerprint = 0
+
+    def select_songs_winning_at(self, songs: List[Track], card: BingoTicket,
+                                num_tracks: int, win_point: int) -> None:
+        """
+        select the songs for a bingo ticket that will win at track number
+        "win_point", ensuring that it is unique.
+        The track at win_point is always on the ticket and all of the other
+        tracks are picked from the tracks that are played before it. Every
+        ticket that wins at win_point is equally likely to be selected.
+        """
+        if win_point < num_tracks or win_point > len(songs):
+            raise ValueError(
+                f'A ticket with {num_tracks} tracks cannot win at track {win_point}')
+        earlier = songs[:win_point - 1]
+        last = songs[win_point - 1]
+        while not self.progress.abort:
+            picked_indices: Set[int] = set()
+            card.tracks = []
+            while len(card.tracks) < (num_tracks - 1):
+                index = self.randbelow(len(earlier))
+                if index in picked_indices:
+                    continue
+                picked_indices.add(index)
+                card.tracks.append(earlier[index])
+            card.tracks.insert(self.randbelow(num_tracks), last)
+            card.fingerprint = ticket_key(trk.number for trk in card.tracks)
+            if card.fingerprint not in self.used_fingerprints:
+                return
 
     def should_include_artist(self, track: Track) -> bool:
         """Check if the artist name should be shown"""
@@ -629,30 +774,49 @@ class GameGenerator:
         """generate an 'amount' number of bingo tickets that will win
         at the specified amount from the end
         """
-        count = 0
+        win_point = len(tracks) - from_end
         cards: List[BingoTicket] = []
-        while count < amount:
+        pooled = self.ticket_pool.get(win_point, [])
+        while pooled and len(cards) < amount:
+            cards.append(pooled.pop(0))
+        while len(cards) < amount:
             card = BingoTicket(palette=self.options.palette,
                                columns=self.options.columns)
-            self.select_songs_for_ticket(tracks, card,
-                                         self.options.songs_per_ticket())
+            self.select_songs_winning_at(tracks, card,
+                                         self.options.songs_per_ticket(),
+                                         win_point)
             if self.progress.abort:
                 return cards
-            win_point = self.get_when_ticket_wins(tracks, card)
-            if win_point == (len(tracks) - from_end):
-                self.used_fingerprints.add(card.fingerprint)
-                card.wins_on_track = win_point
-                cards.append(card)
-                count = count + 1
+            self.used_fingerprints.add(card.fingerprint)
+            card.wins_on_track = win_point
+            cards.append(card)
         return cards
 
-    @staticmethod
-    def randrange(start, end):
+    def randbelow(self, max_value: int) -> int:
+        """
+        Return a random int in the range [0, max_value).
+        Uses the secrets library, unless a random number generator
+        has been provided.
+        """
+        if self.rng is not None:
+            return self.rng.randrange(max_value)
+        return secrets.randbelow(max_value)
+
+    def randrange(self, start, end):
         """a version of random.randrange() that uses a better random number generator.
         This version of randrange() uses the secrets library for a better source of
         entropy.
         """
-        return start + secrets.randbelow(end - start)
+        return start + self.randbelow(end - start)
+
+    def shuffle(self, items: List) -> None:
+        """
+        Shuffle a list in place
+        """
+        if self.rng is not None:
+            self.rng.shuffle(items)
+        else:
+            random.shuffle(items)
 
     def generate_all_cards(self, tracks: List[Track]) -> List[BingoTicket]:
         """generate all the bingo tickets in the game"""
@@ -685,6 +849,19 @@ class GameGenerator:
             num_on_last += 1
         if amount_left < amount_to_go or amount_left > amount_to_go:
             num_on_last = num_on_last - (amount_to_go - amount_left)
+        self.ticket_pool = {}
+        if self.options.card_workers > 1:
+            amounts: Dict[int, int] = {
+                0: num_on_last,
+                1: num_second_last,
+                2: num_third_last,
+                3: num_fourth_last,
+            }
+            for idx in range(amount_to_go):
+                amounts[offset + idx] = amounts.get(offset + idx, 0) + 1
+            self.generate_ticket_pool(tracks, amounts)
+            if self.progress.abort:
+                return cards
         cards += self.generate_at_point(tracks, num_on_last, 0)
         if num_second_last != 0:
             self.insert_random_cards(tracks, cards, 1, num_second_last, num_on_last)
@@ -695,7 +872,7 @@ class GameGenerator:
         good_cards = self.generate_winning_cards(tracks, amount_to_go, offset)
         increment: float = self.options.number_of_cards / float(amount_to_go)
         start_point: float = 0
-        random.shuffle(good_cards)
+        self.shuffle(good_cards)
         for card in good_cards:
             rand_point = self.randrange(
                 int(math.ceil(start_point)),
@@ -717,11 +894,68 @@ class GameGenerator:
             cards.pop(worst_index)
         for idx, card in enumerate(cards, start=1):
             card.number = idx
-            card.compute_win_values(tracks)
+        self.get_win_engine(tracks).compute_win_values(cards)
         if self.options.cards_per_page != 1 or not self.options.doc_per_page:
             return self.sort_cards_by_page(cards)
         return cards
 
+    def generate_ticket_pool(self, tracks: List[Track], amounts: Dict[int, int]) -> None:
+        """
+        Use a pool of worker processes to create the tickets needed by
+        generate_all_cards().
+        "amounts" is the number of tickets required at each offset from the
+        end of the game. Each worker process uses its own random number
+        generator, seeded from the random number generator of this
+        GameGenerator, so that the same seed and number of workers will
+        always produce the same tickets. If a seed has not been specified,
+        the seeds of the workers are created from one random seed, which
+        is logged so that the tickets created by the workers can be
+        reproduced.
+        """
+        num_workers = self.options.card_workers
+        rng = self.rng
+        if rng is None:
+            pool_seed = secrets.randbits(64)
+            self.log.info('Ticket pool seed: %d', pool_seed)
+            rng = random.Random(pool_seed)
+        seeds: List[int] = [rng.getrandbits(64) for _ in range(num_workers)]
+        jobs: List[List[Tuple[int, int]]] = [[] for _ in range(num_workers)]
+        for from_end, amount in sorted(amounts.items()):
+            win_point = len(tracks) - from_end
+            for idx in range(num_workers):
+                count = amount // num_workers
+                if idx < (amount % num_workers):
+                    count += 1
+                if count > 0:
+                    jobs[idx].append((win_point, count))
+        self.progress.text = f'Calculating cards using {num_workers} processes'
+        songs_per_ticket = self.options.songs_per_ticket()
+        results: List[List[Tuple[int, List[int]]]] = []
+        with futures.ProcessPoolExecutor(max_workers=num_workers) as pool:
+            tasks = [
+                pool.submit(generate_tickets_worker, songs_per_ticket, job, seed)
+                for job, seed in zip(jobs, seeds)]
+            for done, task in enumerate(tasks, start=1):
+                results.append(task.result())
+                self.progress.pct = 50.0 * done / float(num_workers)
+        self.ticket_pool = {}
+        # the tickets from each worker are unique, but two workers might
+        # have picked the same ticket. Any duplicates are replaced using
+        # the random number generator of this process
+        for result in results:
+            for win_point, indices in result:
+                if self.progress.abort:
+                    return
+                card = BingoTicket(palette=self.options.palette,
+                                   columns=self.options.columns,
+                                   tracks=[tracks[idx] for idx in indices])
+                if card.fingerprint in self.used_fingerprints:
+                    self.select_songs_winning_at(tracks, card, songs_per_ticket,
+                                                 win_point)
+                self.used_fingerprints.add(card.fingerprint)
+                card.wins_on_track = win_point
+                self.ticket_pool.setdefault(win_point, []).append(card)
+
     def generate_winning_cards(self, tracks: List[Track], amount_to_go: int,
                                offset: int) -> List[BingoTicket]:
         """
@@ -787,39 +1021,145 @@ class GameGenerator:
             start_point = start_point + increment
 
     def generate_tickets_pdf(self, cards: List[BingoTicket]) -> None:
-        """generate a PDF file containing all the Bingo tickets"""
-        doc: Optional[DG.Document] = None
-        page: int = 1
-        num_cards: int = len(cards)
-        id_style = self.TEXT_STYLES['ticket-id']
-        title_style = id_style.replace('ticket-title',
-                                       alignment=HorizontalAlignment.CENTER)
+        """
+        generate the PDF file(s) containing all the Bingo tickets.
+        The pages are created and rendered one at a time, which avoids
+        needing to create the elements of every ticket before rendering.
+        The pages_per_doc option limits the number of pages in each PDF
+        file, which is what limits the memory used by reportlab.
+        """
         if self.options.debug:
             self.log.debug(r'cards_per_page=%d page_size=%s %fmm %fmm',
                   self.options.cards_per_page,
                   self.options.page_size, self.options.page_size.width().value,
                   self.options.page_size.height().value)
+        num_pages = int(math.ceil(len(cards) / self.options.cards_per_page))
+        if (self.options.pdf_workers > 1 and num_pages > 1 and
+                self.generate_tickets_pdf_parallel(cards, num_pages)):
+            return
+        if self.options.doc_per_page:
+            pages = self.ticket_pages(cards, self.create_tickets_document())
+            for page, elements in enumerate(pages, start=1):
+                doc = self.create_tickets_document()
+                for elt in elements:
+                    doc.append(elt)
+                filename = str(self.options.bingo_tickets_output_name(page))
+                self.doc_gen.render(filename, doc, Progress(), debug=self.options.debug)
+            return
+        doc = self.create_tickets_document()
+        pages = self.ticket_pages(cards, doc)
+        pages_per_doc = self.options.pages_per_doc
+        if pages_per_doc < 1 or num_pages <= pages_per_doc:
+            filename = str(self.options.bingo_tickets_output_name())
+            self.doc_gen.render_pages(filename, doc, pages, Progress(),
+                                      debug=self.options.debug)
+            return
+        num_docs = int(math.ceil(num_pages / pages_per_doc))
+        for part in range(1, num_docs + 1):
+            filename = str(self.options.bingo_tickets_output_name(part=part))
+            self.doc_gen.render_pages(filename, self.create_tickets_document(),
+                                      itertools.islice(pages, pages_per_doc),
+                                      Progress(), debug=self.options.debug)
+
+    def generate_tickets_pdf_parallel(self, cards: List[BingoTicket],
+                                      num_pages: int) -> bool:
+        """
+        Render the pages of Bingo tickets using a pool of worker processes.
+        Each job renders a contiguous range of pages into its own file. If
+        all of the tickets are to be put into one document, the files from
+        each job are merged, in page order, once every job has completed.
+        Returns False if the tickets need to be rendered by this process.
+        """
+        num_workers = self.options.pdf_workers
+        pages_per_doc = self.options.pages_per_doc
+        filename = str(self.options.bingo_tickets_output_name())
+        parts: List[str] = []
+        if self.options.doc_per_page:
+            pages_per_job = 1
+        elif 0 < pages_per_doc < num_pages:
+            pages_per_job = pages_per_doc
+        elif self.doc_gen.supports_merge():
+            pages_per_job = min(self.PDF_PAGES_PER_JOB,
+                                int(math.ceil(num_pages / num_workers)))
+        else:
+            self.log.warning('Unable to merge documents, tickets will be ' +
+                             'rendered using one process')
+            return False
+        num_jobs = int(math.ceil(num_pages / pages_per_job))
+        pages = self.ticket_pages(cards, self.create_tickets_document(),
+                                  report_progress=False)
+        self.progress.text = f'Rendering tickets using {num_workers} processes'
+        self.progress.pct = 0.0
+        # The number of jobs waiting to be rendered is limited, so that
+        # the elements of every page are not held in memory at once
+        pending: Deque[futures.Future] = collections.deque()
+        with futures.ProcessPoolExecutor(max_workers=num_workers) as pool:
+            for job in range(1, num_jobs + 1):
+                if self.options.doc_per_page:
+                    job_filename = str(self.options.bingo_tickets_output_name(job))
+                elif pages_per_job == pages_per_doc:
+                    job_filename = str(self.options.bingo_tickets_output_name(part=job))
+                else:
+                    job_filename = f'{filename}.part{job}'
+                    parts.append(job_filename)
+                if len(pending) >= 2 * num_workers:
+                    pending.popleft().result()
+                    self.progress.pct = 100.0 * (job - len(pending) - 1) / num_jobs
+                if self.progress.abort:
+                    break
+                pending.append(pool.submit(
+                    render_pages_worker, type(self.doc_gen),
+                    self.create_tickets_document(), job_filename,
+                    list(itertools.islice(pages, pages_per_job)), self.options.debug))
+            if self.progress.abort:
+                for task in pending:
+                    task.cancel()
+                pending.clear()
+            while pending:
+                pending.popleft().result()
+                self.progress.pct = 100.0 * (num_jobs - len(pending)) / num_jobs
+        if parts and not self.progress.abort:
+            self.doc_gen.merge_documents(parts, filename)
+        for part in parts:
+            part_path = Path(part)
+            if part_path.exists():
+                part_path.unlink()
+        return True
+
+    def create_tickets_document(self) -> DG.Document:
+        """
+        Create an empty document to hold Bingo tickets
+        """
         page_size = cast(PageSizeInterface, self.options.page_size)
         if self.options.cards_per_page > 3:
             page_size = page_size.landscape()
-        scale: float = 1.0
+        return DG.Document(
+            pagesize=page_size,
+            title=f'{self.options.game_id} - {self.options.title}',
+            topMargin="0.15in",
+            rightMargin="0.15in",
+            bottomMargin="0.15in",
+            leftMargin="0.15in")
+
+    def ticket_pages(self, cards: List[BingoTicket], doc: DG.Document,
+                     report_progress: bool = True) -> Iterator[List[DG.Element]]:
+        """
+        Create the elements for each page of Bingo tickets.
+        The tickets for a page are only created when that page is requested.
+        "doc" is used to calculate the position of each ticket.
+        """
+        page: int = 1
+        num_cards: int = len(cards)
+        cards_per_page = self.options.cards_per_page
+        scale = self.calculate_text_scale(doc, cards_per_page)
+        elements: List[DG.Element] = []
         for count, card in enumerate(cards, start=1):
-            self.progress.text = f'Card {count}/{num_cards}'
-            self.progress.pct = 100.0 * float(count) / float(num_cards)
-            if doc is None:
-                doc = DG.Document(
-                    pagesize=page_size,
-                    title=f'{self.options.game_id} - {self.options.title}',
-                    topMargin="0.15in",
-                    rightMargin="0.15in",
-                    bottomMargin="0.15in",
-                    leftMargin="0.15in")
+            if report_progress:
+                self.progress.text = f'Card {count}/{num_cards}'
+                self.progress.pct = 100.0 * float(count) / float(num_cards)
             index0 = count - 1
             top, left, ticket_width, ticket_height = self.calculate_ticket_frame(
-                index0, doc, self.options.cards_per_page)
-            scale = self.calculate_text_scale(doc, self.options.cards_per_page)
-            id_style = id_style.scale(scale)
-            title_style = title_style.scale(scale)
+                index0, doc, cards_per_page)
             top += doc.top_margin
             left += doc.left_margin
             self.log.debug(r'frame[%d] id="t%s" top=%fmm left=%fmm width=%fmm height=%fmm',
@@ -828,25 +1168,20 @@ class GameGenerator:
             frame = DG.Container(cid=f't{card.number}', top=top, left=left,
                                  width=ticket_width, height=ticket_height)
             self.render_bingo_ticket_to_container(card, frame, True, scale=scale)
-            doc.append(frame)
-            if count % self.options.cards_per_page == 0:
-                if self.options.doc_per_page:
-                    filename = str(self.options.bingo_tickets_output_name(page))
-                    self.doc_gen.render(filename, doc, Progress(), debug=self.options.debug)
-                    doc = None
-                else:
-                    self.add_cut_here_lines(doc, self.options.cards_per_page)
-                    doc.append(
+            elements.append(frame)
+            if count % cards_per_page == 0:
+                if not self.options.doc_per_page:
+                    elements += self.cut_here_lines(doc, cards_per_page)
+                    elements.append(
                         DG.OverlayText(doc.width / 2.0, doc.bottom_margin,
                                        text=f'Page {page}',
                                        style=self.TEXT_STYLES['page-number']))
-                    doc.append(DG.PageBreak())
+                    elements.append(DG.PageBreak())
+                yield elements
+                elements = []
                 page += 1
-
-        if not self.options.doc_per_page:
-            assert doc is not None
-            filename = str(self.options.bingo_tickets_output_name())
-            self.doc_gen.render(filename, doc, Progress(), debug=self.options.debug)
+        if elements:
+            yield elements
 
     def calculate_ticket_frame(self, index0: int, doc: DG.Document, cards_per_page: int):
         """
@@ -897,13 +1232,16 @@ class GameGenerator:
         self.log.debug(r'font_scale=%f', scale)
         return scale
 
-    def add_cut_here_lines(self, doc: DG.Document, cards_per_page: int) -> None:
+    @staticmethod
+    def cut_here_lines(doc: DG.Document, cards_per_page: int) -> List[DG.Element]:
         """
-        Add dashed lines to a page to indicate where to cut
+        Create dashed lines for a page to indicate where to cut
         """
+        lines: List[DG.Element] = []
+
         # pylint: disable=invalid-name
         def add_line(name, x1, y1, x2, y2):
-            doc.append(DG.OverlayLine(
+            lines.append(DG.OverlayLine(
                 name, x1=x1, y1=y1, x2=x2, y2=y2,
                 thickness="1px", colour=Colour('gray'), dash=[2, 2]))
 
@@ -922,33 +1260,38 @@ class GameGenerator:
             pos = doc.width / 2
             add_line('vline', x1=pos, y1=doc.top_margin,
                      x2=pos, y2=(doc.height - doc.bottom_margin))
+        return lines
 
     def generate_ticket_tracks_file(self, cards: List[BingoTicket]) -> None:
         """store ticketTracks file used by TicketChecker.py"""
         filename = self.options.ticket_checker_output_name()
         with filename.open('wt') as ttf:
             for card in cards:
-                ttf.write(f"{card.number}/{card.fingerprint}\n")
+                ttf.write(f"{card.number}/{key_to_str(card.fingerprint)}\n")
 
     def gen_track_order(self, songs: Sequence[Song]) -> List[Song]:
         """generate a random order of songs for the game"""
         assert len(songs) > 0
         list_copy = copy.copy(list(songs))
         if not self.options.mode == GameMode.QUIZ:
-            random.shuffle(list_copy)
+            self.shuffle(list_copy)
         return list_copy
 
+    def get_win_engine(self, tracks: List[Track]) -> WinEngine:
+        """
+        Get the WinEngine for the given track order. The engine is
+        re-used for as long as the track order is unchanged.
+        """
+        if self.win_engine is None or self.win_engine.tracks is not tracks:
+            self.win_engine = WinEngine(tracks)
+        return self.win_engine
+
     def get_when_ticket_wins(self, tracks: List[Track], ticket: BingoTicket) -> int:
         """
         get the point at which the given ticket will win, given the
         specified order
         """
-        fingerprint: int = 1
-        for count, track in enumerate(tracks, start=1):
-            fingerprint *= track.prime
-            if (fingerprint % ticket.fingerprint) == 0:
-                return count
-        raise ValueError(f'ticket {ticket.number} never wins')
+        return self.get_win_engine(tracks).when_ticket_wins(ticket)
 
     def save_game_info_json(self, game: models.Game, tracks: Iterable[models.Track],
                             cards: Iterable[models.BingoTicket]) -> None:
@@ -993,10 +1336,47 @@ class GameGenerator:
                                             math.factorial(total - select)))
 
 
+def generate_tickets_worker(songs_per_ticket: int, jobs: List[Tuple[int, int]],
+                            seed: int) -> List[Tuple[int, List[int]]]:
+    """
+    Worker process used by GameGenerator.generate_ticket_pool().
+    Each job is a tuple of (win_point, amount). Returns a list of
+    (win_point, track indices) for each generated ticket.
+    """
+    rng = random.Random(seed)
+    used: Set[int] = set()
+    tickets: List[Tuple[int, List[int]]] = []
+    for win_point, amount in jobs:
+        for _ in range(amount):
+            while True:
+                indices = rng.sample(range(win_point - 1), songs_per_ticket - 1)
+                indices.insert(rng.randrange(songs_per_ticket), win_point - 1)
+                key = ticket_key(indices)
+                if key not in used:
+                    break
+            used.add(key)
+            tickets.append((win_point, indices))
+    return tickets
+
+
+def render_pages_worker(doc_gen_class: Type[DG.DocumentGenerator], document: DG.Document,
+                        filename: str, pages: List[List[DG.Element]],
+                        debug: bool) -> str:
+    """
+    Render the given pages into one document.
+    This function is used by the worker processes of
+    GameGenerator.generate_tickets_pdf_parallel()
+    """
+    doc_gen = doc_gen_class()
+    doc_gen.render_pages(filename, document, pages, Progress(), debug=debug)
+    return filename
+
+
 def main(args: Sequence[str]) -> int:
     """used for testing game generation without needing to use the GUI"""
     # pylint: disable=import-outside-toplevel
     from musicbingo.mp3 import MP3Factory
+    from musicbingo.mp3.pcmcache import PCMCache
 
     options = Options.parse(args)
     assert options.database is not None
@@ -1009,10 +1389,10 @@ def main(args: Sequence[str]) -> int:
         logging.getLogger().setLevel(logging.DEBUG)
         logging.getLogger("pdfgen").setLevel(logging.DEBUG)
     progress = TextProgress()
-    mp3parser = MP3Factory.create_parser()
+    mp3parser = MP3Factory.create_parser(options.mp3_parser)
     clips = Directory(None, options.clips())
     progress = TextProgress()
-    clips.search(mp3parser, progress)
+    clips.search(mp3parser, progress, parse_workers=options.parse_workers)
     sys.stdout.write('\n')
     sys.stdout.flush()
     num_songs = options.columns * options.rows * 2
@@ -1030,7 +1410,10 @@ def main(args: Sequence[str]) -> int:
         return 1
     if options.title == '':
         options.title = Song.choose_collection_title(songs)
-    mp3editor = MP3Factory.create_editor(options.mp3_editor)
+    mp3editor = MP3Factory.create_editor(
+        options.mp3_editor,
+        pcm_cache=PCMCache.create(options.pcm_cache, options.pcm_cache_size),
+        encode_workers=options.encode_workers)
     pdf = DocumentFactory.create_generator('pdf')
     gen = GameGenerator(options, mp3editor, pdf, progress)
     #pylint: disable=no-value-for-parameter
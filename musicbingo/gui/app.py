@@ -413,7 +413,7 @@ class MainApp(ActionPanelCallbacks):
         dlg = SettingsDialog(
             self.root, self.options,
             exclude={'create_superuser', 'game_id',
-                     'max_tickets_per_user'})
+                     'max_tickets_per_user', 'seed'})
         if dlg.result is None:
             return
         self.options.save_ini_file()
@@ -25,7 +25,10 @@ class Metadata:
                  channels: int,  # number of audio channels (e.g. 2)
                  sample_rate: int,  # samples per second (e.g. 44100)
                  bitrate: int,  # bitrate, in kilobits per second
-                 album: str = '' # the artist credited with the song
+                 album: str = '', # the artist credited with the song
+                 loudness: Optional[float] = None,  # integrated loudness (LUFS)
+                 true_peak: Optional[float] = None,  # maximum true peak (dBTP)
+                 loudness_range: Optional[float] = None,  # loudness range (LU)
                  ):
         self.title = self._correct_title(title.split('[')[0])
         self.artist = self._correct_title(artist)
@@ -35,6 +38,9 @@ class Metadata:
         self.sample_rate = sample_rate
         self.bitrate = bitrate
         self.album = album
+        self.loudness = loudness
+        self.true_peak = true_peak
+        self.loudness_range = loudness_range
 
     def as_dict(self, exclude: Optional[Set[str]] = None) -> Dict[str, Any]:
         """convert metadata into a dictionary"""
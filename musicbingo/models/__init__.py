@@ -94,8 +94,11 @@ def export_database_to_file(output: TextIO, options: Options,
     opts = options.to_dict(
         exclude={
             'command', 'exists', 'jsonfile', 'database', 'debug', 'game_id',
-            'title', 'mp3_editor', 'mp3_player', 'mode', 'privacy', 'smtp',
-            'secret_key', 'tables'})
+            'title', 'mp3_editor', 'mp3_player', 'mp3_parser', 'mode', 'privacy', 'smtp',
+            'secret_key', 'tables', 'card_workers', 'seed',
+            'pages_per_doc', 'pdf_workers', 'background_encode',
+            'parse_workers', 'encode_workers', 'clip_workers', 'pcm_cache',
+            'pcm_cache_size'})
     for enum in ['colour_scheme', 'sort_order', 'page_size']:
         opts[enum] = opts[enum].name.lower()
     clips = options.clips()
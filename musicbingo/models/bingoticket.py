@@ -3,14 +3,16 @@ Database model for a Bingo ticket
 """
 from typing import AbstractSet, ClassVar, Iterable, List, Optional, cast, TYPE_CHECKING
 
-from sqlalchemy import Column, ForeignKey, Table, MetaData, text
+from sqlalchemy import Column, ForeignKey, Table, MetaData, delete, select, text
 from sqlalchemy.types import BigInteger, String, Integer, JSON
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+from sqlalchemy.orm import relationship, selectinload, Mapped, mapped_column
+from sqlalchemy.orm.query import Query
 from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy.sql.expression import TextClause
 
 from musicbingo.models.base import Base, mapper_registry
 from musicbingo.models.modelmixin import ModelMixin, JsonObject, PrimaryKeyMap
+from musicbingo.ticketkey import FINGERPRINT_LENGTH
 
 from .schemaversion import SchemaVersion
 from .session import DatabaseSession
@@ -97,7 +99,7 @@ class BingoTicket(Base, ModelMixin):  # type: ignore
     """
     __plural__ = 'BingoTickets'
     __tablename__ = 'BingoTicket'
-    __schema_version__ = 3
+    __schema_version__ = 4
 
     pk: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_pk: Mapped[int] = mapped_column("user", Integer, ForeignKey("User.pk"), nullable=True)
@@ -111,8 +113,10 @@ class BingoTicket(Base, ModelMixin):  # type: ignore
                           innerjoin=True,
                           order_by="BingoTicketTrack.order",
                           cascade="all, delete-orphan")
-    # calculated by multiplying the primes of each track on this ticket
-    fingerprint: Mapped[str] = mapped_column(String(128), nullable=False)
+    # bitset of the numbers of the tracks on this ticket (see ticketkey.py).
+    # Tickets from older games use the product of the primes of each track.
+    # Widened from 128 characters in v4
+    fingerprint: Mapped[str] = mapped_column(String(FINGERPRINT_LENGTH), nullable=False)
     checked: Mapped[int] = mapped_column(
         BigInteger, default=0, nullable=False)  # bitmask of track order
     __table_args__ = (
@@ -136,6 +140,11 @@ class BingoTicket(Base, ModelMixin):  # type: ignore
                 print('===========================================')
                 print('Warning: manual database migration required')
                 print('===========================================')
+        # SQLite does not enforce the length of a VARCHAR column
+        if this_tab.version < 4 and sver.options.provider != 'sqlite':
+            cmds.append(text(
+                f'ALTER TABLE `{cls.__tablename__}` MODIFY `fingerprint` ' +
+                f'VARCHAR({FINGERPRINT_LENGTH}) NOT NULL'))
         return cmds
 
     def get_tracks(self, session: DatabaseSession) -> List[Track]:
@@ -153,7 +162,7 @@ class BingoTicket(Base, ModelMixin):  # type: ignore
             if self.pk:
                 card_track = session.query(
                     BingoTicketTrack).filter_by(bingoticket_pk=self.pk,
-                                                track=track)
+                                                track=track).one_or_none()
             if card_track is not None:
                 card_track.order = idx
             else:
@@ -162,6 +171,31 @@ class BingoTicket(Base, ModelMixin):  # type: ignore
                                               order=idx)
                 session.add(card_track)
 
+    @classmethod
+    def delete_items(cls, session: DatabaseSession, **kwargs) -> int:
+        """
+        Delete the selected Bingo tickets, and the links to their tracks.
+        The rows are deleted using set-based DELETE statements, rather
+        than loading every ticket.
+        """
+        session.flush()
+        tickets = select(cls.pk).filter_by(**kwargs)
+        session.execute(
+            delete(BingoTicketTrack)
+            .where(BingoTicketTrack.bingoticket_pk.in_(tickets))
+            .execution_options(synchronize_session='fetch'))
+        result = session.execute(
+            delete(cls).filter_by(**kwargs).execution_options(synchronize_session='fetch'))
+        return cast(int, result.rowcount)  # type: ignore
+
+    @classmethod
+    def search_with_tracks(cls, session: DatabaseSession, **kwargs) -> Query:
+        """
+        Search for Bingo tickets, also loading the tracks of every ticket
+        using one additional query
+        """
+        return cls.search(session, **kwargs).options(selectinload(cls.tracks))
+
     @classmethod
     def lookup(cls, session: DatabaseSession, pk_maps: PrimaryKeyMap,
                item: JsonObject) -> Optional["BingoTicket"]:
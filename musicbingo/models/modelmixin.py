@@ -5,7 +5,7 @@ utility functions.
 from collections.abc import Iterable
 from typing import AbstractSet, Dict, Optional, List, Tuple, cast
 
-from sqlalchemy import select, text
+from sqlalchemy import insert, select, text, update
 from sqlalchemy.orm import class_mapper, ColumnProperty, RelationshipProperty
 from sqlalchemy.orm.query import Query
 from sqlalchemy.engine import Engine
@@ -151,6 +151,26 @@ class ModelMixin:
         session.flush()
         return count
 
+    @classmethod
+    def bulk_insert(cls, session: DatabaseSession, rows: List[JsonObject]) -> None:
+        """
+        Add rows to this table using one batched INSERT statement.
+        Each row is a dictionary of attribute names and values. The
+        primary keys of the new rows are not returned.
+        """
+        if rows:
+            session.execute(insert(cls), rows)
+
+    @classmethod
+    def bulk_update(cls, session: DatabaseSession, rows: List[JsonObject]) -> None:
+        """
+        Modify rows of this table using one batched UPDATE statement.
+        Each row is a dictionary of attribute names and values, which
+        must include the primary key of the row to modify.
+        """
+        if rows:
+            session.execute(update(cls), rows)
+
     def set(self, **kwargs) -> None:
         """
         Set the given attributes on this object
@@ -220,6 +240,28 @@ class ArtistAlbumMixin:
     """
     Common methods used for both Album and Artist objects
     """
+    @classmethod
+    def get_or_create_names(cls, session: DatabaseSession,
+                            names: AbstractSet[str]) -> Dict[str, int]:
+        """
+        Find the primary key of each of the given names, using one query.
+        Any names that are not already in the database are added using
+        one batched INSERT statement.
+        Returns a dictionary mapping each name to its primary key.
+        """
+        if not names:
+            return {}
+        query = select(cls.name, cls.pk).where(cls.name.in_(names))  # type: ignore
+        result: Dict[str, int] = {
+            row.name: row.pk for row in session.execute(query)}  # type: ignore
+        missing = sorted(names - result.keys())
+        if missing:
+            cls.bulk_insert(session, [{'name': name} for name in missing])  # type: ignore
+            query = select(cls.name, cls.pk).where(cls.name.in_(missing))  # type: ignore
+            for name, pk in session.execute(query):  # type: ignore
+                result[name] = pk
+        return result
+
     @classmethod
     def search_for_item(cls, session: DatabaseSession,
                         item: JsonObject) -> Optional["ArtistAlbumMixin"]:
@@ -24,7 +24,7 @@ class DatabaseSession(Protocol):
     def delete(self, model) -> None:
         """Remove item from database"""
 
-    def execute(self, statement: Executable) -> Result:
+    def execute(self, statement: Executable, params=None) -> Result:
         """Execute a raw SQL statement"""
 
     def flush(self) -> None:
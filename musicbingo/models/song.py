@@ -5,7 +5,7 @@ Database model for a song
 from pathlib import Path
 from typing import AbstractSet, Dict, List, Optional, Tuple, cast, TYPE_CHECKING
 
-from sqlalchemy import String, Integer, ForeignKey, text
+from sqlalchemy import Float, String, Integer, ForeignKey, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.event import listen
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -34,7 +34,7 @@ class Song(Base, ModelMixin, UuidMixin):  # type: ignore
     """
     __plural__ = 'Songs'
     __tablename__ = 'Song'
-    __schema_version__ = 4
+    __schema_version__ = 5
 
     pk: Mapped[int] = mapped_column('pk', Integer, primary_key=True)
     directory_pk: Mapped[int] = mapped_column(
@@ -57,6 +57,10 @@ class Song(Base, ModelMixin, UuidMixin):  # type: ignore
     # album table added in v4
     album_pk: Mapped[int] = mapped_column('album_pk', Integer, ForeignKey('Album.pk'))
     album: Mapped["Album"] = relationship("Album", back_populates="songs")
+    # loudness measurements added in v5
+    loudness: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    true_peak: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    loudness_range: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     __table_args__ = (
         UniqueConstraint("directory", "filename"),
     )
@@ -120,7 +124,10 @@ class Song(Base, ModelMixin, UuidMixin):  # type: ignore
                     cmds.append(text('UPDATE `Song` SET artist_pk = ' +
                                 '(SELECT pk FROM `Artist` ' +
                                 'WHERE Song.artist=Artist.name);'))
-
+        if 1 < version < 5:
+            for name in ['loudness', 'true_peak', 'loudness_range']:
+                if name not in existing_columns:
+                    cmds.append(cls.add_column(engine, column_types, name))
         return cmds
 
     @classmethod
@@ -151,6 +158,10 @@ class Song(Base, ModelMixin, UuidMixin):  # type: ignore
             # Use RFC4122 URN encoding in JSON files as the base85 encoded version
             # requires character escaping
             retval['uuid'] = self.str_to_uuid(self.uuid).urn
+        for name in ['loudness', 'true_peak', 'loudness_range']:
+            # songs where the loudness has not been measured
+            if name in retval and retval[name] is None:
+                del retval[name]
         return retval
 
     def absolute_path(self) -> Path:
@@ -4,7 +4,7 @@ Database model for one track in a game
 import datetime
 from typing import AbstractSet, Optional, List, cast, TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, text
+from sqlalchemy import ForeignKey, delete, select, text
 from sqlalchemy.types import Integer
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.schema import UniqueConstraint
@@ -44,6 +44,25 @@ class Track(Base, ModelMixin):
         UniqueConstraint("number", "game"),
     )
 
+    @classmethod
+    def delete_items(cls, session: DatabaseSession, **kwargs) -> int:
+        """
+        Delete the selected tracks, and any links from Bingo tickets to
+        those tracks. The rows are deleted using set-based DELETE
+        statements, rather than loading every track.
+        """
+        # pylint: disable=import-outside-toplevel
+        from .bingoticket import BingoTicketTrack
+        session.flush()
+        tracks = select(cls.pk).filter_by(**kwargs)
+        session.execute(
+            delete(BingoTicketTrack)
+            .where(BingoTicketTrack.track_pk.in_(tracks))
+            .execution_options(synchronize_session='fetch'))
+        result = session.execute(
+            delete(cls).filter_by(**kwargs).execution_options(synchronize_session='fetch'))
+        return cast(int, result.rowcount)  # type: ignore
+
     # pylint: disable=unused-argument, arguments-differ
     @classmethod
     def migrate_schema(cls, engine, sver: SchemaVersion) -> List[TextClause]:
@@ -135,11 +154,3 @@ class Track(Base, ModelMixin):
         #    except KeyError:
         #        track = None
         return track
-
-    @property
-    def prime(self) -> int:
-        """
-        Get the prime number assigned to this track
-        """
-        # pylint: disable=invalid-sequence-index
-        return PRIME_NUMBERS[cast(int, self.number)]
@@ -0,0 +1,242 @@
+"""
+Splits the inputs of an output MP3 file into chunks that can be
+encoded in parallel and then joined, without re-encoding, by copying
+MPEG audio frames.
+
+Each cut is placed inside one input file, away from any cross-fade, so
+that every cross-fade is encoded within one chunk. The chunks overlap
+by a few frames around each cut. When the chunks are joined, the extra
+frames are removed so that the frames either side of the join contain
+(to within a millisecond) consecutive audio. The encoders must not use
+the bit reservoir, so that every frame can be decoded without needing
+the frames before it.
+"""
+
+import math
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .framecopy import FramePlan, FrameSegment, read_frames
+from .mp3file import MP3File
+
+# number of samples between the start of the encoder's input and the
+# start of the decoder's output (LAME encoder delay plus decoder delay)
+ENCODER_DELAY = 576 + 529
+# number of samples in each MPEG-1 layer III frame
+SAMPLES_PER_FRAME = 1152
+# number of frames at the start of a chunk that are removed when joining
+PREROLL_FRAMES = 2
+# extra audio (in milliseconds) encoded after the end of each chunk
+POSTROLL = 100
+# minimum gap (in milliseconds) between a cut and a cross-fade
+MARGIN = 250
+# shortest cross-fade (in milliseconds) used by the ffmpeg filter graph
+MIN_CROSSFADE = 100
+# shortest chunk (in milliseconds) worth encoding in its own process
+MIN_CHUNK_DURATION = 60000
+
+
+class EncodeChunk(NamedTuple):
+    """
+    The inputs of one chunk, and the frames to keep from it
+    """
+    files: List[MP3File]
+    first_frame: int
+    last_frame: Optional[int]  # None == all remaining frames
+
+    @property
+    def duration(self) -> int:
+        """duration (in milliseconds) of the chunk's input"""
+        return sum(int(mp3file.duration) for mp3file in self.files)
+
+
+def file_positions(files: Sequence[MP3File]) -> List[int]:
+    """
+    The position (in milliseconds) in the output of the start of
+    each input file
+    """
+    positions: List[int] = []
+    pos = 0
+    for mp3file in files:
+        positions.append(pos - mp3file.overlap)
+        pos += int(mp3file.duration)
+    return positions
+
+
+def clear_regions(files: Sequence[MP3File]) -> List[Tuple[int, int]]:
+    """
+    The part (as positions in the output) of each input file that is
+    not cross-faded with another file and is far enough away from any
+    cross-fade to be used as a cut. A file with no such part has a
+    region where start >= end.
+    """
+    positions = file_positions(files)
+    crossfade = any(mp3file.overlap > 0 for mp3file in files)
+
+    def fade(index: int) -> int:
+        if not crossfade or index == 0 or index >= len(files):
+            return 0
+        return max(files[index].overlap, MIN_CROSSFADE)
+
+    regions: List[Tuple[int, int]] = []
+    for index, mp3file in enumerate(files):
+        length = mp3file.end - mp3file.start
+        regions.append((positions[index] + fade(index) + MARGIN,
+                        positions[index] + length - fade(index + 1) - MARGIN))
+    return regions
+
+
+def find_cuts(files: Sequence[MP3File], num_chunks: int) -> List[Tuple[int, int]]:
+    """
+    Choose where to split the output into num_chunks chunks of
+    roughly equal duration.
+    Returns the index of the input file and the position (in the output)
+    of each cut.
+    """
+    total = sum(int(mp3file.duration) for mp3file in files)
+    regions = clear_regions(files)
+    cuts: List[Tuple[int, int]] = []
+    for count in range(1, num_chunks):
+        target = total * count // num_chunks
+        best_index = -1
+        best_pos = 0
+        for index in range(cuts[-1][0] + 1 if cuts else 1, len(files)):
+            low, high = regions[index]
+            if low >= high:
+                continue
+            pos = min(max(target, low), high)
+            if best_index < 0 or abs(pos - target) < abs(best_pos - target):
+                best_index = index
+                best_pos = pos
+        if best_index >= 0:
+            cuts.append((best_index, best_pos))
+    return cuts
+
+
+def find_window_cuts(files: Sequence[MP3File], max_files: int) -> List[Tuple[int, int]]:
+    """
+    Choose where to split the output into windows that each contain
+    no more than about max_files input files.
+    Returns the index of the input file and the position (in the output)
+    of each cut.
+    """
+    # each window after the first also contains the end of the file
+    # where the previous window was cut
+    step = max(1, max_files - 1)
+    num_windows = int(math.ceil(len(files) / float(step)))
+    regions = clear_regions(files)
+    cuts: List[Tuple[int, int]] = []
+    for count in range(1, num_windows):
+        target = len(files) * count // num_windows
+        candidates = [(abs(idx - target), idx)
+                      for idx in range(cuts[-1][0] + 1 if cuts else 1, len(files))]
+        for _, index in sorted(candidates):
+            low, high = regions[index]
+            if low < high:
+                cuts.append((index, (low + high) // 2))
+                break
+    return cuts
+
+
+def split_files(files: Sequence[MP3File],
+                cuts: Sequence[Tuple[int, int]]) -> List[List[MP3File]]:
+    """
+    Split the input files at each cut, where each cut is the index of
+    an input file and a position in the output
+    """
+    positions = file_positions(files)
+    windows: List[List[MP3File]] = []
+    first_file = 0
+    first_offset: Optional[int] = None
+    for index, pos in cuts:
+        window = [clip_file(files[first_file], first_offset, None)]
+        window += files[first_file + 1:index]
+        window.append(clip_file(files[index], None, pos - positions[index]))
+        windows.append(window)
+        first_file = index
+        first_offset = pos - positions[index]
+    window = [clip_file(files[first_file], first_offset, None)]
+    window += files[first_file + 1:]
+    windows.append(window)
+    return windows
+
+
+def clip_file(mp3file: MP3File, start: Optional[int], end: Optional[int]) -> MP3File:
+    """
+    Create a section of mp3file, where start and end are relative to
+    the start of mp3file. A file that starts part way through is not
+    cross-faded with the previous file.
+    """
+    new_start = mp3file.start
+    overlap = mp3file.overlap
+    if start is not None:
+        new_start += start
+        overlap = 0
+    new_end = mp3file.end
+    if end is not None:
+        new_end = min(new_end, mp3file.start + end)
+    return MP3File(mp3file.filename, mode=mp3file.mode, metadata=mp3file.metadata,
+                   headroom=mp3file.headroom, start=new_start, end=new_end,
+                   overlap=overlap, gain=mp3file.gain)
+
+
+def plan_chunks(files: Sequence[MP3File], sample_rate: int,
+                num_chunks: int) -> List[EncodeChunk]:
+    """
+    Split files into at most num_chunks chunks
+    """
+    total = sum(int(mp3file.duration) for mp3file in files)
+    num_chunks = min(num_chunks, total // MIN_CHUNK_DURATION)
+    if num_chunks < 2:
+        return [EncodeChunk(list(files), 0, None)]
+    positions = file_positions(files)
+    chunks: List[EncodeChunk] = []
+    # start of the current chunk, in samples from the start of the output
+    chunk_start = 0.0
+    first_file = 0
+    first_offset: Optional[int] = None
+    first_frame = 0
+    for index, pos in find_cuts(files, num_chunks):
+        samples = pos * sample_rate / 1000.0
+        last_frame = int(round((samples - chunk_start + ENCODER_DELAY) / SAMPLES_PER_FRAME))
+        # the position of the join, in samples from the start of the output
+        join = chunk_start + last_frame * SAMPLES_PER_FRAME - ENCODER_DELAY
+        end = int(math.ceil(join * 1000.0 / sample_rate)) + POSTROLL
+        chunk = [clip_file(files[first_file], first_offset, None)]
+        chunk += files[first_file + 1:index]
+        chunk.append(clip_file(files[index], None, end - positions[index]))
+        chunks.append(EncodeChunk(chunk, first_frame, last_frame))
+        # the next chunk starts early enough that the start of its
+        # frame PREROLL_FRAMES lines up with the join
+        start = int(round(
+            (join - PREROLL_FRAMES * SAMPLES_PER_FRAME + ENCODER_DELAY) * 1000.0 / sample_rate))
+        chunk_start = start * sample_rate / 1000.0
+        first_file = index
+        first_offset = start - positions[index]
+        first_frame = PREROLL_FRAMES
+    chunk = [clip_file(files[first_file], first_offset, None)]
+    chunk += files[first_file + 1:]
+    chunks.append(EncodeChunk(chunk, first_frame, None))
+    return chunks
+
+
+def join_chunks(filenames: Sequence[Path], chunks: Sequence[EncodeChunk]) -> FramePlan:
+    """
+    Work out which frames to copy from each encoded chunk
+    """
+    segments: List[FrameSegment] = []
+    plan: Optional[FramePlan] = None
+    for filename, chunk in zip(filenames, chunks):
+        frames = read_frames(filename)
+        if frames is None:
+            raise IOError(f'Failed to find MPEG audio frames in "{filename}"')
+        first = min(chunk.first_frame, frames.num_frames)
+        last = frames.num_frames
+        if chunk.last_frame is not None:
+            last = max(first, min(chunk.last_frame, last))
+        segments.append(FrameSegment(filename=filename, start=frames.offsets[first],
+                                     end=frames.offsets[last], num_frames=(last - first)))
+        if plan is None:
+            plan = FramePlan(frames.first, frames.header, segments)
+    assert plan is not None
+    return plan
@@ -3,7 +3,7 @@
 from abc import ABC, abstractmethod
 from contextlib import AbstractContextManager
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 
 from musicbingo.duration import Duration
 from musicbingo.metadata import Metadata
@@ -13,6 +13,11 @@ from .filemode import FileMode
 from .mp3file import MP3File
 from .uses_mixin import UsesMP3Mixin
 
+if TYPE_CHECKING:
+    from .framecopy import FramePlan
+    from .loudness import Loudness
+    from .pcmcache import PCMCache
+
 class MP3FileWriter(MP3File, AbstractContextManager):
     """Represents one output MP3 file"""
 
@@ -31,15 +36,59 @@ class MP3FileWriter(MP3File, AbstractContextManager):
         if progress is None:
             progress = Progress()
         self.progress = progress
+        self._frame_plan: Optional["FramePlan"] = None
+        self._frame_plan_checked = False
 
     def generate(self) -> "MP3File":
         """generate output file, combining all input files"""
-        self._editor._generate(self, self.progress)
+        plan = self.frame_plan()
+        duration = int(self.duration)
+        if plan is not None:
+            plan.write(self.filename, self._metadata, self.progress)
+            duration = plan.duration
+        else:
+            self._editor._generate(self, self.progress)
         self.mode = FileMode.READ_ONLY
         return MP3File(self.filename, FileMode.READ_ONLY,
-                       start=0, end=int(self.duration),
+                       start=0, end=duration,
                        metadata=self._metadata)
 
+    def frame_plan(self) -> Optional["FramePlan"]:
+        """
+        Check if the output file can be created by copying the MPEG
+        audio frames of the input files, without re-encoding.
+        Returns the frames to copy, or None if the output file needs
+        to be encoded.
+        """
+        if not self._frame_plan_checked:
+            self._frame_plan_checked = True
+            self._frame_plan = None
+            if self._editor.supports_frame_copy:
+                try:
+                    # pylint: disable=import-outside-toplevel
+                    from .framecopy import FramePlan
+                    self._frame_plan = FramePlan.create(
+                        self._files, self._metadata, self.headroom)
+                except ImportError:
+                    pass
+        return self._frame_plan
+
+    def start_times(self) -> List[int]:
+        """
+        Get the position (in milliseconds) of the start of each input
+        file within the output file. If the output file is created by
+        copying frames, these positions are accurate to the frame.
+        """
+        plan = self.frame_plan()
+        if plan is not None:
+            return plan.start_times()
+        times: List[int] = []
+        pos = 0
+        for mp3file in self._files:
+            times.append(pos)
+            pos += int(mp3file.duration)
+        return times
+
     def close(self):
         if self.mode == FileMode.WRITE_ONLY:
             self.generate()
@@ -48,6 +97,7 @@ class MP3FileWriter(MP3File, AbstractContextManager):
 
     def normalize(self, headroom: int) -> "MP3FileWriter":
         self.headroom = headroom
+        self._frame_plan_checked = False
         return self
 
     def clip(self, start: Optional[int], end: Optional[int]) -> "MP3File":
@@ -61,22 +111,28 @@ class MP3FileWriter(MP3File, AbstractContextManager):
         """total duration of the file"""
         return Duration(sum(int(f.duration) for f in self._files))
 
-    def append(self, mp3file: MP3File, overlap: Optional[Duration] = None) -> None:
-        """append an MP3 file to this output"""
+    def append(self, mp3file: MP3File, overlap: Optional[Duration] = None) -> int:
+        """
+        append an MP3 file to this output.
+        Returns the index of mp3file in the list of input files.
+        """
         if self.mode != FileMode.WRITE_ONLY:
             raise IOError(f'Cannot append to a {self.mode.name} MP3File')
         if self.filename == '':
             raise IOError("Output filename is not valid")
+        self._frame_plan_checked = False
         if overlap is None:
             self._files.append(mp3file)
         else:
             self._files.append(mp3file.overlap_with_previous(overlap))
+        return len(self._files) - 1
 
     def set_metadata(self, metadata: Metadata) -> None:
         """set the metadata associated with the output file"""
         if self.mode != FileMode.WRITE_ONLY:
             raise IOError(f'Cannot set metadata on a {self.mode.name} MP3File')
         self._metadata = metadata
+        self._frame_plan_checked = False
 
     def __enter__(self) -> "MP3FileWriter":
         return self
@@ -89,6 +145,12 @@ class MP3Editor(UsesMP3Mixin, ABC):
     """Interface for editing MP3 files"""
 
     debug = False
+    # can an output file be created by copying MPEG audio frames?
+    supports_frame_copy = False
+    # number of processes to use when encoding an output file, for
+    # editors that can encode parts of a file in parallel
+    encode_workers = 0
+    pcm_cache: Optional["PCMCache"] = None
 
     def create(self, filename: Path, metadata: Metadata,
                progress: Optional[Progress] = None) -> MP3FileWriter:
@@ -103,3 +165,33 @@ class MP3Editor(UsesMP3Mixin, ABC):
         public API is MP3FileWriter.generate()
         """
         raise NotImplementedError()
+
+    def decode(self, mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+        """
+        Decode the section of mp3file between its start and end
+        positions, creating a WAV file with the given sample rate and
+        number of channels.
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support decoding')
+
+    def measure_loudness(self, mp3file: MP3File) -> "Loudness":
+        """
+        Measure the integrated loudness, true peak and loudness range
+        of the section of mp3file between its start and end positions.
+        """
+        raise NotImplementedError(
+            f'{self.__class__.__name__} does not support measuring loudness')
+
+    def use_cached_pcm(self, mp3file: MP3File, sample_rate: int, channels: int) -> MP3File:
+        """
+        If there is a PCM cache, get an MP3File that refers to the decoded
+        version of mp3file in that cache. The returned MP3File keeps the
+        headroom, overlap and gain of mp3file.
+        """
+        if self.pcm_cache is None:
+            return mp3file
+        filename = self.pcm_cache.fetch(mp3file, sample_rate, channels, self.decode)
+        return MP3File(filename, mode=FileMode.READ_ONLY, metadata=mp3file.metadata,
+                       start=0, end=(mp3file.end - mp3file.start),
+                       headroom=mp3file.headroom, overlap=mp3file.overlap,
+                       gain=mp3file.gain)
@@ -1,12 +1,15 @@
 """factory method for creating an MP3 engine"""
 
-from typing import Dict, Generic, List, Optional, Tuple, Type, TypeVar
+from typing import Dict, Generic, List, Optional, Tuple, Type, TypeVar, TYPE_CHECKING
 
 from musicbingo.mp3.editor import MP3Editor
 from musicbingo.mp3.mockeditor import MockEditor
 from musicbingo.mp3.parser import MP3Parser
 from musicbingo.mp3.player import MP3Player
 
+if TYPE_CHECKING:
+    from musicbingo.mp3.pcmcache import PCMCache
+
 ETYPE = TypeVar('ETYPE')
 
 class MP3Feature(Generic[ETYPE]):
@@ -75,14 +78,22 @@ class MP3Factory:
         return cls.PLAYER.available_engines()
 
     @classmethod
-    def create_editor(cls, editor: Optional[str] = None) -> MP3Editor:
+    def create_editor(cls, editor: Optional[str] = None,
+                      pcm_cache: Optional["PCMCache"] = None,
+                      encode_workers: int = 0) -> MP3Editor:
         """
         Create an MP3Editor.
         If editor==None, the factory will pick one that is supported.
+        If pcm_cache is not None, the editor will use it to avoid decoding
+        the same input file more than once.
+        If encode_workers > 1, editors that support it will use that
+        number of processes to encode each output file.
         """
         cls._auto_probe()
-        engine = cls.EDITOR.get_engine(editor)
-        return engine()
+        engine = cls.EDITOR.get_engine(editor)()
+        engine.pcm_cache = pcm_cache
+        engine.encode_workers = encode_workers
+        return engine
 
     @classmethod
     def create_parser(cls, parser: Optional[str] = None) -> MP3Parser:
@@ -119,6 +130,14 @@ class MP3Factory:
             cls.PARSER.default_engine = 'mutagen'
         except ImportError as mutagenparser_err:
             cls.PARSER.errors.append(('mutagen', str(mutagenparser_err)))
+        try:
+            # pylint: disable=import-outside-toplevel
+            from musicbingo.mp3.headerparser import HeaderParser
+            cls.PARSER.engines['header'] = HeaderParser
+            if cls.PARSER.default_engine is None:
+                cls.PARSER.default_engine = 'header'
+        except ImportError as headerparser_err:
+            cls.PARSER.errors.append(('header', str(headerparser_err)))
 
         try:
             # pylint: disable=import-outside-toplevel
@@ -2,20 +2,33 @@
 Implementation of the MP3Engine interface using ffmpeg and ffplay
 """
 import math
+import os
+from pathlib import Path
+import shutil
 import subprocess
+import tempfile
 import time
 import socketserver
 import threading
-from typing import Iterable, List, Optional, Tuple, cast
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, cast, TYPE_CHECKING
 
 import psutil # type: ignore
 
 from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.chunks import (
+    EncodeChunk, find_window_cuts, join_chunks, plan_chunks, split_files
+)
+from musicbingo.mp3.filemode import FileMode
 from musicbingo.mp3.mp3file import MP3File
 from musicbingo.mp3.editor import MP3Editor, MP3FileWriter
 from musicbingo.mp3.player import MP3Player
+from musicbingo.mp3.streamplayer import StreamingPlayer
 from musicbingo.progress import Progress
 
+if TYPE_CHECKING:
+    from musicbingo.mp3.loudness import Loudness
+
 
 class ProgressRequestHandler(socketserver.DatagramRequestHandler):
     """
@@ -31,13 +44,16 @@ class ProgressRequestHandler(socketserver.DatagramRequestHandler):
             # 'out_time_ms' is actually in microseconds and was renamed
             # to 'out_time_us'. See https://trac.ffmpeg.org/ticket/7345
             if len(line) == 2 and line[0] in ['out_time_us', 'out_time_ms']:
-                pos = int(line[1], 10) / 1000.0
-                server.progress.pct = 100.0 * pos / float(self.server.total_duration)
+                # each ffmpeg process sends its messages from its own port
+                server.positions[self.client_address] = int(line[1], 10) / 1000.0
+                pos = sum(server.positions.values())
+                server.progress.pct = 100.0 * pos / float(server.total_duration)
 
 
 class ProgressUDPServer(socketserver.UDPServer):
     """
-    UDP server that will receive progress messages from ffmpeg
+    UDP server that will receive progress messages from one or more
+    ffmpeg processes
     """
 
     def __init__(self, server_address: Tuple[str, int], progress: Progress,
@@ -45,11 +61,17 @@ class ProgressUDPServer(socketserver.UDPServer):
         super().__init__(server_address, ProgressRequestHandler)
         self.progress = progress
         self.total_duration = total_duration
+        # the current position of each ffmpeg process, in milliseconds
+        self.positions: Dict[Tuple[str, int], float] = {}
 
 
 class FfmpegEditor(MP3Editor, MP3Player):
     """MP3Editor implementation using ffmpeg"""
 
+    supports_frame_copy = True
+    # maximum number of files that are opened as inputs of one ffmpeg command
+    MAX_INPUTS = 32
+
     @classmethod
     def is_encoding_supported(cls) -> bool:
         """
@@ -63,8 +85,11 @@ class FfmpegEditor(MP3Editor, MP3Player):
     @classmethod
     def is_playback_supported(cls) -> bool:
         """
-        Checks if ffplay is found in the path and appears to be working
+        Checks if pyaudio is available and ffmpeg is working, or if
+        ffplay is found in the path and appears to be working
         """
+        if StreamingPlayer.is_supported() and cls.is_encoding_supported():
+            return True
         try:
             return cls.run_command(["ffplay", "-version"], Progress()) == 0
         except FileNotFoundError:
@@ -78,45 +103,278 @@ class FfmpegEditor(MP3Editor, MP3Player):
         if num_files == 0:
             print('no files to encode')
             return
+        files: List[MP3File] = []
+        for mp3file in destination._files:
+            if progress.abort:
+                return
+            if self.pcm_cache is not None:
+                progress.text = f'Decoding {mp3file.filename.name}'
+            files.append(self.use_cached_pcm(
+                mp3file, destination._metadata.sample_rate, destination._metadata.channels))
+        dest_dir = destination.filename.parent
+        if not dest_dir.exists():
+            dest_dir.mkdir(parents=True)
+        tmpdir = Path(tempfile.mkdtemp(prefix='.encode-', dir=dest_dir))
+        try:
+            if len(files) > self.MAX_INPUTS and not self.can_use_concat_demuxer(files):
+                files = self.mix_windows(files, destination._metadata, tmpdir, progress)
+                if progress.abort:
+                    return
+            # the adaptive filters used to normalise loudness cannot be
+            # split between processes, as each process would start the
+            # filter without the history of the audio before its chunk
+            adaptive = destination.headroom is not None or any(
+                mp3file.headroom is not None for mp3file in files)
+            if (self.encode_workers > 1 and not adaptive and
+                    destination._metadata.sample_rate in {32000, 44100, 48000}):
+                chunks = plan_chunks(files, destination._metadata.sample_rate,
+                                     self.encode_workers)
+                if len(chunks) > 1:
+                    self.encode_chunks(destination, chunks, tmpdir, progress)
+                    return
+            progress.text = f'Encoding MP3 file "{destination.filename.name}"'
+            args = self.build_encode_args(files, destination._metadata, destination.headroom,
+                                          destination.filename, tmpdir=tmpdir)
+            if self.debug:
+                print(args)
+            self.run_command_with_progress(args, progress, duration=int(destination.duration))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def build_encode_args(self, files: Sequence[MP3File], metadata: Metadata,
+                          headroom: Optional[int], filename: Path,
+                          options: Optional[List[str]] = None,
+                          tmpdir: Optional[Path] = None) -> List[str]:
+        """
+        Create the ffmpeg command to combine all input files and encode
+        them as an MP3 file. Any items in options are added to the output
+        options. If tmpdir is provided, it is used for any files needed
+        by the command.
+        """
         args: List[str] = ['ffmpeg', '-hide_banner']
         if not self.debug:
             args += ['-loglevel', 'panic', '-v', 'quiet']
-        concat = self.append_input_files(args, destination._files)
-        progress.text = f'Encoding MP3 file "{destination.filename.name}"'
-        mdata = [f'title={destination._metadata.title}']
-        if destination._metadata.artist:
-            mdata.append(f'artist={destination._metadata.artist}')
-        if destination._metadata.album:
-            mdata.append(f'album={destination._metadata.album}')
-        if num_files > 1:
-            args += [
-                '-filter_complex',
-                self.build_filter_argument(destination, concat)
-            ]
-            if destination.headroom is not None:
-                args[-1] += ';' + self.build_headroom_filter(destination.headroom, 'outa', 'outb')
-                args += ['-map', '[outb]']
-            else:
-                args += ['-map', '[outa]']
-        elif destination.headroom is not None:
-            args += ['-af', f'loudnorm=tp=-{destination.headroom}']
+        self.append_mix_args(args, files, metadata.sample_rate, headroom, tmpdir)
+        mdata = [f'title={metadata.title}']
+        if metadata.artist:
+            mdata.append(f'artist={metadata.artist}')
+        if metadata.album:
+            mdata.append(f'album={metadata.album}')
         for item in mdata:
             args += ['-metadata', item]
         args += [
-            '-ab', f'{destination._metadata.bitrate}k',
-            '-ac', str(destination._metadata.channels),
-            '-ar', str(destination._metadata.sample_rate),
+            '-ab', f'{metadata.bitrate}k',
+            '-ac', str(metadata.channels),
+            '-ar', str(metadata.sample_rate),
             '-acodec', 'mp3',
             '-threads', '0',
+        ]
+        if options is not None:
+            args += options
+        args += [
             '-f', 'mp3',
-            '-y', str(destination.filename),
+            '-y', str(filename),
         ]
+        return args
+
+    def append_mix_args(self, args: List[str], files: Sequence[MP3File], sample_rate: int,
+                        headroom: Optional[int], tmpdir: Optional[Path]) -> None:
+        """
+        Append the inputs and filters that combine all input files to
+        the ffmpeg command arguments.
+        When there are a lot of input files that are not cross-faded,
+        they are listed in a concat demuxer script, rather than opening
+        every file as a separate input.
+        """
+        if (len(files) > self.MAX_INPUTS and tmpdir is not None and
+                self.can_use_concat_demuxer(files)):
+            # the concat demuxer can only start a file at the nearest
+            # packet. If the first file starts part way through, it is
+            # opened as a separate input, so that the output starts at
+            # exactly the right sample (which is needed when joining
+            # chunks that have been encoded separately)
+            first: List[MP3File] = []
+            if files[0].start is not None and files[0].start > 0:
+                first = [files[0]]
+                self.append_input_files(args, first)
+            handle, name = tempfile.mkstemp(prefix='concat-', suffix='.txt', dir=tmpdir)
+            os.close(handle)
+            script = Path(name)
+            self.write_concat_script(script, files[len(first):])
+            args += ['-f', 'concat', '-safe', '0', '-i', str(script)]
+            pad = '0:a'
+            graph: List[str] = []
+            if first:
+                graph.append('[0:a][1:a]concat=n=2:v=0:a=1[outa]')
+                pad = 'outa'
+            if headroom is not None:
+                graph.append(self.build_headroom_filter(headroom, pad, 'outb'))
+                pad = 'outb'
+            if graph:
+                args += ['-filter_complex', ';'.join(graph), '-map', f'[{pad}]']
+            return
+        concat = self.append_input_files(args, files)
+        if len(files) > 1:
+            args += [
+                '-filter_complex',
+                self.build_filter_argument(files, sample_rate, concat)
+            ]
+            if headroom is not None:
+                args[-1] += ';' + self.build_headroom_filter(headroom, 'outa', 'outb')
+                args += ['-map', '[outb]']
+            else:
+                args += ['-map', '[outa]']
+        else:
+            filters: List[str] = []
+            if files and files[0].gain:
+                filters.append(f'volume={files[0].gain:.2f}dB')
+            if headroom is not None:
+                filters.append(f'loudnorm=tp=-{headroom}')
+            if filters:
+                args += ['-af', ','.join(filters)]
+
+    @staticmethod
+    def can_use_concat_demuxer(files: Sequence[MP3File]) -> bool:
+        """
+        Check if files can be joined using the concat demuxer. This
+        requires that there are no cross-fades and that every file
+        uses the same audio format. Files that need their volume
+        changing cannot be joined by the concat demuxer.
+        """
+        if any(mp3file.overlap > 0 for mp3file in files[1:]):
+            return False
+        if any(mp3file.gain for mp3file in files):
+            return False
+        if all(mp3file.filename.suffix.lower() == '.wav' for mp3file in files):
+            # WAV files come from the PCM cache, or from mix_windows(),
+            # which use the sample rate and channels of the output
+            return True
+        first = files[0]
+        return all(
+            mp3file.filename.suffix.lower() == first.filename.suffix.lower() and
+            mp3file.metadata.sample_rate == first.metadata.sample_rate and
+            mp3file.metadata.channels == first.metadata.channels
+            for mp3file in files)
+
+    @staticmethod
+    def write_concat_script(script: Path, files: Iterable[MP3File]) -> None:
+        """
+        Create an ffmpeg concat demuxer script that lists each file.
+        The start and end of a file are used as its in and out points.
+        For a compressed file, ffmpeg can only use these points to the
+        nearest audio frame.
+        """
+        with script.open('wt', encoding='utf-8') as dest:
+            dest.write('ffconcat version 1.0\n')
+            for mp3file in files:
+                filename = str(mp3file.filename.resolve()).replace("'", "'\\''")
+                dest.write(f"file '{filename}'\n")
+                if mp3file.start is not None and mp3file.start > 0:
+                    dest.write(f'inpoint {mp3file.start / 1000.0}\n')
+                if (mp3file.end is not None and
+                        mp3file.end != int(mp3file.metadata.duration)):
+                    dest.write(f'outpoint {mp3file.end / 1000.0}\n')
+
+    def mix_windows(self, files: Sequence[MP3File], metadata: Metadata, tmpdir: Path,
+                    progress: Progress) -> List[MP3File]:
+        """
+        Split the input files into windows, each containing no more than
+        about MAX_INPUTS files, and mix each window into a WAV file.
+        Every cross-fade is contained within one window, and the windows
+        are split within a file, so the WAV files can be joined without
+        any cross-fades.
+        """
+        windows = split_files(files, find_window_cuts(files, self.MAX_INPUTS))
+        results: List[MP3File] = []
+        for index, window in enumerate(windows, 1):
+            if progress.abort:
+                break
+            progress.text = f'Mixing part {index} of {len(windows)}'
+            filename = tmpdir / f'window-{index:03d}.wav'
+            args: List[str] = ['ffmpeg', '-hide_banner']
+            if not self.debug:
+                args += ['-loglevel', 'panic', '-v', 'quiet']
+            self.append_mix_args(args, window, metadata.sample_rate, None, tmpdir)
+            args += [
+                '-ac', str(metadata.channels),
+                '-ar', str(metadata.sample_rate),
+                '-acodec', 'pcm_s16le',
+                '-f', 'wav',
+                '-y', str(filename),
+            ]
+            if self.debug:
+                print(args)
+            duration = sum(int(mp3file.duration) for mp3file in window)
+            rcodes = self.run_commands_with_progress([args], progress, duration=duration)
+            if progress.abort:
+                break
+            if rcodes[0] != 0:
+                raise IOError(f'Failed to mix part {index} of {len(windows)}')
+            mdata = Metadata(title=filename.name, artist='', duration=Duration(duration),
+                             sample_width=16, channels=metadata.channels,
+                             sample_rate=metadata.sample_rate, bitrate=metadata.bitrate)
+            results.append(MP3File(filename, FileMode.READ_ONLY, start=0, end=duration,
+                                   metadata=mdata))
+        return results
+
+    def encode_chunks(self, destination: MP3FileWriter, chunks: Sequence[EncodeChunk],
+                      tmpdir: Path, progress: Progress) -> None:
+        """
+        Encode each chunk in its own ffmpeg process, and then join the
+        chunks by copying their MPEG audio frames
+        """
+        filenames: List[Path] = []
+        commands: List[List[str]] = []
+        for index, chunk in enumerate(chunks):
+            filenames.append(tmpdir / f'chunk-{index:03d}.mp3')
+            # without the bit reservoir, every frame can be decoded
+            # without the frames before it
+            commands.append(self.build_encode_args(
+                chunk.files, destination._metadata, destination.headroom,
+                filenames[-1], options=['-reservoir', '0'], tmpdir=tmpdir))
         if self.debug:
-            print(args)
-        dest_dir = destination.filename.parent
-        if not dest_dir.exists():
-            dest_dir.mkdir(parents=True)
-        self.run_command_with_progress(args, progress, duration=int(destination.duration))
+            print(commands)
+        progress.text = (f'Encoding MP3 file "{destination.filename.name}" ' +
+                         f'using {len(commands)} processes')
+        rcodes = self.run_commands_with_progress(
+            commands, progress, duration=sum(chunk.duration for chunk in chunks))
+        if progress.abort:
+            return
+        if any(rcode != 0 for rcode in rcodes):
+            raise IOError(f'Failed to encode "{destination.filename.name}"')
+        progress.text = f'Joining MP3 file "{destination.filename.name}"'
+        plan = join_chunks(filenames, chunks)
+        plan.write(destination.filename, destination._metadata, Progress())
+        progress.pct = 100.0
+
+    def decode(self, mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+        """
+        Decode the section of mp3file between its start and end
+        positions, creating a WAV file with the given sample rate and
+        number of channels.
+        """
+        args: List[str] = ['ffmpeg', '-hide_banner']
+        if not self.debug:
+            args += ['-loglevel', 'panic', '-v', 'quiet']
+        self.append_input_files(args, [mp3file])
+        args += [
+            '-ac', str(channels),
+            '-ar', str(sample_rate),
+            '-acodec', 'pcm_s16le',
+            '-f', 'wav',
+            '-y', str(dest),
+        ]
+        if self.run_command(args, Progress()) != 0:
+            raise IOError(f'Failed to decode "{mp3file.filename}"')
+
+    def measure_loudness(self, mp3file: MP3File) -> "Loudness":
+        """
+        Measure the integrated loudness, true peak and loudness range
+        of the section of mp3file between its start and end positions.
+        """
+        # pylint: disable=import-outside-toplevel
+        from musicbingo.mp3.loudness import measure
+        return measure('ffmpeg', mp3file)
 
     @staticmethod
     def append_input_files(args: List[str], files: Iterable[MP3File]) -> bool:
@@ -140,29 +398,38 @@ class FfmpegEditor(MP3Editor, MP3Player):
                 concat = False
         return concat
 
-    def build_filter_argument(self, destination: MP3FileWriter, concat: bool) -> str:
+    def build_filter_argument(self, files: Sequence[MP3File], sample_rate: int,
+                              concat: bool) -> str:
         """
         generate the value for the "-filter_complex" ffmpeg command line option.
         """
         filter_complex: List[str] = []
-        num_files = len(destination._files)
-        for index, mp3file in enumerate(destination._files):
-            if concat:
-                filter_complex.append(f'[{index}:a]')
-                continue
+        num_files = len(files)
+        inputs: List[str] = []
+        for index, mp3file in enumerate(files):
+            pad = f'{index}:a' if concat else str(index)
+            if mp3file.gain:
+                filter_complex.append(self.build_gain_filter(mp3file.gain, pad, f'g{index}'))
+                pad = f'g{index}'
+            inputs.append(pad)
+        if concat:
+            filter_complex.append(''.join(f'[{pad}]' for pad in inputs) +
+                                  f'concat=n={num_files}:v=0:a=1[outa]')
+            return ';'.join(filter_complex)
+        for index, mp3file in enumerate(files):
             if index == 0:
                 continue
             first = 'a{0}'.format(index - 1) # pylint: disable=consider-using-f-string
-            second = str(index)
+            second = inputs[index]
             if index == 1:
-                first = '0'
+                first = inputs[0]
             dest = f'a{index}'
             if index == (num_files - 1):
                 dest = 'outa'
             if mp3file.overlap < 100:
-                num_samples = destination._metadata.sample_rate // 10
+                num_samples = sample_rate // 10
             else:
-                num_samples = mp3file.overlap * destination._metadata.sample_rate // 1000
+                num_samples = mp3file.overlap * sample_rate // 1000
             if mp3file.headroom is not None:
                 third = f'n{index}'
                 filter_complex.append(
@@ -170,11 +437,15 @@ class FfmpegEditor(MP3Editor, MP3Player):
                 second = third
             crossfade = f'acrossfade=ns={num_samples}:c1=tri:c2=tri'
             filter_complex.append(f'[{first}][{second}]{crossfade}[{dest}]')
-        if concat:
-            filter_complex.append(f'concat=n={num_files}:v=0:a=1[outa]')
-            return ''.join(filter_complex)
         return ';'.join(filter_complex)
 
+    @staticmethod
+    def build_gain_filter(gain: float, input_pad: str, output_pad: str) -> str:
+        """
+        generate the ffmpeg filter argument for a fixed change in volume
+        """
+        return f'[{input_pad}]volume={gain:.2f}dB[{output_pad}]'
+
     @staticmethod
     def build_headroom_filter(headroom: int, input_pad: str, output_pad: str) -> str:
         """
@@ -192,22 +463,58 @@ class FfmpegEditor(MP3Editor, MP3Player):
         specified command and wait for it to complete.
         Can be terminated by setting progress.abort to True
         """
+        cls.run_commands_with_progress([args], progress, duration)
+
+    @classmethod
+    def run_commands_with_progress(cls, commands: List[List[str]], progress: Progress,
+                                   duration: int) -> List[Optional[int]]:
+        """
+        Start a new thread to monitor progress and start a process for
+        each of the specified commands and wait for all of them to complete.
+        The progress of all the processes is combined, where duration is
+        the total duration of the output of all of the commands.
+        Can be terminated by setting progress.abort to True
+        """
         progress_srv = ProgressUDPServer(
             ('localhost', 0), progress, duration)
         progress_thread = threading.Thread(target=progress_srv.serve_forever, daemon=True)
-        args.insert(1, '-progress')
         hostname: str = cast(str, progress_srv.server_address[0])
         port: int = progress_srv.server_address[1]
-        args.insert(
-            2,
-            f'udp://{hostname}:{port}')
+        for args in commands:
+            args.insert(1, '-progress')
+            args.insert(2, f'udp://{hostname}:{port}')
         try:
             progress_thread.start()
-            cls.run_command(args, progress)
+            return cls.run_commands(commands, progress)
         finally:
             progress_srv.shutdown()
             progress_thread.join()
 
+    @classmethod
+    def run_commands(cls, commands: List[List[str]],
+                     progress: Progress) -> List[Optional[int]]:
+        """
+        Start a process for each of the specified commands and wait for
+        all of them to complete.
+        Can be terminated by setting progress.abort to True
+        """
+        progress.pct = 0.0
+        procs: List[subprocess.Popen] = []
+        try:
+            for args in commands:
+                # the processes are waited for in the finally clause
+                procs.append(subprocess.Popen(  # pylint: disable=consider-using-with
+                    args, shell=False, stdout=subprocess.DEVNULL))
+            while not progress.abort and any(proc.poll() is None for proc in procs):
+                time.sleep(0.25)
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    cls.kill_process(proc.pid)
+                proc.wait()
+        progress.pct = 100.0
+        return [proc.returncode for proc in procs]
+
     @classmethod
     def run_command(cls, args: List[str], progress: Progress, start: int = 0,
                     duration: Optional[int] = None) -> Optional[int]:
@@ -245,7 +552,14 @@ class FfmpegEditor(MP3Editor, MP3Player):
         return rcode
 
     def play(self, mp3file: MP3File, progress: Progress) -> None:
-        """play the specified mp3 file"""
+        """
+        play the specified mp3 file.
+        If pyaudio is available, ffmpeg decodes the file while it is being
+        played, otherwise ffplay is used.
+        """
+        if StreamingPlayer.is_supported():
+            StreamingPlayer('ffmpeg').play(mp3file, progress)
+            return
         args: List[str] = ['ffplay', '-nodisp', '-autoexit', '-hide_banner',
                            '-loglevel', 'panic', '-v', 'quiet']
         duration = int(mp3file.metadata.duration)
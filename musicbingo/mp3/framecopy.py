@@ -0,0 +1,305 @@
+"""
+Creates an MP3 file by copying MPEG audio frames from its input files,
+without decoding or re-encoding the audio.
+
+This is only possible if no input is modified (no cross-fade and no
+loudness normalisation) and every input uses the same sample rate,
+number of channels and bitrate as the output. Each input can only be
+trimmed to the nearest frame (about 26 milliseconds at 44.1kHz), and
+can only start part way through if the first copied frame does not use
+any data from the frames before it (the "bit reservoir").
+"""
+
+import io
+import logging
+from pathlib import Path
+import struct
+from typing import BinaryIO, Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from mutagen.id3 import ID3, TALB, TIT2, TPE1  # type: ignore
+
+from musicbingo.metadata import Metadata
+from musicbingo.progress import Progress
+
+from .headerparser import LAME_ENCODERS, FrameHeader, HeaderParser
+from .mp3file import MP3File
+
+
+class FrameList(NamedTuple):
+    """
+    The position of every audio frame in one MP3 file
+    """
+    first: FrameHeader
+    header: bytes  # the 4 bytes of the header of the first audio frame
+    bitrates: FrozenSet[int]
+    offsets: List[int]  # start of each frame, plus the end of the last frame
+    delay: int  # encoder delay (in samples) from the LAME tag
+    main_data: List[int]  # main_data_begin of each frame
+
+    @property
+    def num_frames(self) -> int:
+        """number of audio frames"""
+        return len(self.offsets) - 1
+
+    def frame_index(self, position: int) -> int:
+        """
+        Find the frame that is closest to the given position (in
+        milliseconds) within the decoded audio
+        """
+        samples = position * self.first.sample_rate // 1000 + self.delay
+        index = int(round(samples / float(self.first.samples)))
+        return max(0, min(index, self.num_frames))
+
+
+class FrameSegment(NamedTuple):
+    """
+    A range of frames copied from one input file
+    """
+    filename: Path
+    start: int  # byte offset of first frame
+    end: int  # byte offset after last frame
+    num_frames: int
+
+
+def is_info_frame(header: FrameHeader, frame: bytes) -> bool:
+    """
+    Check if a frame is a Xing, Info or VBRI frame, rather than audio
+    """
+    pos = header.xing_offset()
+    return frame[pos:pos + 4] in {b'Xing', b'Info'} or frame[36:40] == b'VBRI'
+
+
+def encoder_delay(header: FrameHeader, frame: bytes) -> int:
+    """
+    Get the encoder delay (in samples) from the LAME tag that follows
+    a Xing or Info header
+    """
+    pos = header.xing_offset()
+    if frame[pos:pos + 4] not in {b'Xing', b'Info'}:
+        return 0
+    flags = struct.unpack('>I', frame[pos + 4:pos + 8])[0]
+    pos += 8
+    for flag, size in [(0x01, 4), (0x02, 4), (0x04, 100), (0x08, 4)]:
+        if flags & flag:
+            pos += size
+    if frame[pos:pos + 4] not in LAME_ENCODERS or len(frame) < pos + 24:
+        return 0
+    return (frame[pos + 21] << 4) | (frame[pos + 22] >> 4)
+
+
+def main_data_begin(header: FrameHeader, frame: bytes) -> int:
+    """
+    Get the number of bytes of the audio data of a layer III frame that
+    are stored in the frames before it (the bit reservoir)
+    """
+    # the side information follows the header and the optional CRC
+    pos = 4 if frame[1] & 0x01 else 6
+    if header.mpeg1:
+        return (frame[pos] << 1) | (frame[pos + 1] >> 7)
+    return frame[pos]
+
+
+def read_frames(filename: Path) -> Optional[FrameList]:
+    """
+    Find the position of every audio frame in an MP3 file.
+    Returns None if no frames are found.
+    """
+    parser = HeaderParser()
+    with filename.open('rb') as src:
+        first = parser.find_first_frame(src, parser.skip_id3v2(src))
+        if first is None:
+            return None
+        offset, header = first
+        src.seek(offset)
+        data = src.read()
+    first_header = data[:4]
+    offsets: List[int] = []
+    main_data: List[int] = []
+    bitrates = set()
+    delay = 0
+    pos = 0
+    while pos + 4 <= len(data):
+        frame = FrameHeader.decode(data[pos:pos + 4])
+        if (frame is None or not frame.same_stream(header) or
+                frame.channels != header.channels or pos + frame.length > len(data)):
+            break
+        if not offsets and is_info_frame(frame, data[pos:pos + frame.length]):
+            delay = encoder_delay(frame, data[pos:pos + frame.length])
+            pos += frame.length
+            first_header = data[pos:pos + 4]
+            continue
+        offsets.append(offset + pos)
+        main_data.append(main_data_begin(frame, data[pos:pos + 6]))
+        bitrates.add(frame.bitrate)
+        pos += frame.length
+    if not offsets:
+        return None
+    offsets.append(offset + pos)
+    return FrameList(first=header, header=first_header, bitrates=frozenset(bitrates),
+                     offsets=offsets, delay=delay, main_data=main_data)
+
+
+class FramePlan:
+    """
+    The frames to copy from each input file to create the output file
+    """
+
+    # size of each read when copying frames
+    COPY_SIZE = 1024 * 1024
+
+    def __init__(self, header: FrameHeader, header_bytes: bytes,
+                 segments: List[FrameSegment]) -> None:
+        self.header = header
+        self.header_bytes = header_bytes
+        self.segments = segments
+        self.log = logging.getLogger(__name__)
+
+    @classmethod
+    def create(cls, files: Sequence[MP3File], metadata: Metadata,
+               headroom: Optional[int] = None) -> Optional["FramePlan"]:
+        """
+        Work out which frames to copy from each file. Returns None if
+        the output cannot be created by copying frames.
+        """
+        if not files or headroom is not None:
+            return None
+        if any(mp3file.overlap or mp3file.headroom is not None or mp3file.gain
+               for mp3file in files):
+            return None
+        frame_lists: Dict[Path, Optional[FrameList]] = {}
+        segments: List[FrameSegment] = []
+        first: Optional[FrameList] = None
+        for mp3file in files:
+            if mp3file.filename not in frame_lists:
+                try:
+                    frame_lists[mp3file.filename] = read_frames(mp3file.filename)
+                except IOError:
+                    frame_lists[mp3file.filename] = None
+            frames = frame_lists[mp3file.filename]
+            if frames is None or not cls.is_compatible(frames, metadata):
+                return None
+            if first is None:
+                first = frames
+            start = frames.frame_index(mp3file.start)
+            if 0 < start < frames.num_frames and frames.main_data[start]:
+                # the first frame would decode using data from a frame
+                # that is not copied
+                return None
+            end = frames.num_frames
+            if mp3file.end is not None:
+                end = max(start, frames.frame_index(mp3file.end))
+            segments.append(FrameSegment(filename=mp3file.filename,
+                                         start=frames.offsets[start],
+                                         end=frames.offsets[end],
+                                         num_frames=(end - start)))
+        assert first is not None
+        return FramePlan(first.first, first.header, segments)
+
+    @staticmethod
+    def is_compatible(frames: FrameList, metadata: Metadata) -> bool:
+        """
+        Check if the frames can be copied into an output file with the
+        given audio format
+        """
+        return (frames.first.mpeg1 and frames.first.layer == 3 and
+                frames.first.sample_rate == metadata.sample_rate and
+                frames.first.channels == metadata.channels and
+                frames.bitrates == {metadata.bitrate})
+
+    def frame_duration(self, num_frames: int) -> int:
+        """
+        Duration (in milliseconds) of the given number of frames
+        """
+        return int(round(1000.0 * num_frames * self.header.samples / self.header.sample_rate))
+
+    def start_times(self) -> List[int]:
+        """
+        The position (in milliseconds) of the start of each input in
+        the output file
+        """
+        times: List[int] = []
+        num_frames = 0
+        for segment in self.segments:
+            times.append(self.frame_duration(num_frames))
+            num_frames += segment.num_frames
+        return times
+
+    @property
+    def duration(self) -> int:
+        """
+        Duration (in milliseconds) of the output file
+        """
+        return self.frame_duration(sum(seg.num_frames for seg in self.segments))
+
+    def info_frame(self, num_frames: int, num_bytes: int) -> bytes:
+        """
+        Create the Info frame that is placed before the audio frames.
+        This frame contains the number of frames and the size of the
+        audio, to allow players to calculate the duration.
+        """
+        header = bytearray(self.header_bytes)
+        # no CRC and no padding
+        header[1] |= 0x01
+        header[2] &= 0xFD
+        frame_header = FrameHeader.decode(bytes(header))
+        assert frame_header is not None
+        frame = bytearray(frame_header.length)
+        frame[:4] = header
+        pos = frame_header.xing_offset()
+        # the number of frames does not include this frame, but the
+        # number of bytes does
+        frame[pos:pos + 16] = struct.pack('>4sIII', b'Info', 0x03, num_frames,
+                                          num_bytes + frame_header.length)
+        return bytes(frame)
+
+    def write(self, filename: Path, metadata: Metadata, progress: Progress) -> None:
+        """
+        Create the output file, copying the frames of each input file
+        """
+        total_frames = sum(seg.num_frames for seg in self.segments)
+        total_bytes = sum(seg.end - seg.start for seg in self.segments)
+        if not filename.parent.exists():
+            filename.parent.mkdir(parents=True)
+        self.write_tags(filename, metadata)
+        copied = 0
+        with filename.open('ab') as dest:
+            dest.write(self.info_frame(total_frames, total_bytes))
+            for segment in self.segments:
+                if progress.abort:
+                    return
+                progress.text = f'Adding {segment.filename.name}'
+                with segment.filename.open('rb') as src:
+                    self.copy_bytes(src, dest, segment.start, segment.end)
+                copied += segment.end - segment.start
+                progress.pct = 100.0 * copied / max(1, total_bytes)
+        self.log.debug('Copied %d frames to "%s"', total_frames, filename.name)
+        progress.pct = 100.0
+
+    @staticmethod
+    def write_tags(filename: Path, metadata: Metadata) -> None:
+        """
+        Create filename, containing just the ID3 tags
+        """
+        with filename.open('wb'):
+            pass
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=metadata.title))
+        if metadata.artist:
+            tags.add(TPE1(encoding=3, text=metadata.artist))
+        if metadata.album:
+            tags.add(TALB(encoding=3, text=metadata.album))
+        tags.save(str(filename))
+
+    @classmethod
+    def copy_bytes(cls, src: BinaryIO, dest: BinaryIO, start: int, end: int) -> None:
+        """
+        Copy the bytes between start and end of src
+        """
+        src.seek(start, io.SEEK_SET)
+        todo = end - start
+        while todo > 0:
+            data = src.read(min(todo, cls.COPY_SIZE))
+            if not data:
+                raise IOError(f'Unexpected end of file "{src.name}"')
+            dest.write(data)
+            todo -= len(data)
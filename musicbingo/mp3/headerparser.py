@@ -0,0 +1,278 @@
+"""
+Implementation of the MP3Parser interface that gets the duration and
+audio format from the MPEG frame headers, rather than decoding the
+audio.
+"""
+
+import io
+import logging
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, NamedTuple, Optional, Tuple
+
+from musicbingo.mp3.exceptions import InvalidMP3Exception
+from musicbingo.mp3.mutagenparser import MutagenParser
+from musicbingo.song import Metadata
+
+# bitrates (in Kbps) indexed by [MPEG-1][layer][bitrate index]
+BITRATES: Dict[bool, Dict[int, Tuple[int, ...]]] = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+
+# sample rates (in Hz) indexed by the version bits of the frame header
+SAMPLE_RATES: Dict[int, Tuple[int, ...]] = {
+    0: (11025, 12000, 8000),  # MPEG-2.5
+    2: (22050, 24000, 16000),  # MPEG-2
+    3: (44100, 48000, 32000),  # MPEG-1
+}
+
+# encoders that add a LAME tag after the Xing header. The encoder delay
+# and padding from this tag are removed when the file is decoded
+LAME_ENCODERS = {b'LAME', b'Lavf', b'Lavc'}
+
+
+class FrameHeader(NamedTuple):
+    """
+    The fields of one MPEG audio frame header
+    """
+    mpeg1: bool
+    layer: int
+    bitrate: int  # Kbps
+    sample_rate: int  # Hz
+    channels: int
+    samples: int  # number of samples in this frame
+    length: int  # bytes, including the header
+
+    @classmethod
+    def decode(cls, data: bytes) -> Optional["FrameHeader"]:
+        """
+        Decode the 4 bytes of an MPEG audio frame header.
+        Returns None if data is not a valid frame header.
+        """
+        if len(data) < 4 or data[0] != 0xFF or (data[1] & 0xE0) != 0xE0:
+            return None
+        version = (data[1] >> 3) & 0x03
+        layer = 4 - ((data[1] >> 1) & 0x03)
+        bitrate_index = data[2] >> 4
+        sample_rate_index = (data[2] >> 2) & 0x03
+        if version == 1 or layer == 4 or bitrate_index in {0, 15} or sample_rate_index == 3:
+            # reserved values, or a free format stream
+            return None
+        mpeg1 = version == 3
+        bitrate = BITRATES[mpeg1][layer][bitrate_index]
+        sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        padding = (data[2] >> 1) & 0x01
+        channels = 1 if (data[3] >> 6) == 3 else 2
+        if layer == 1:
+            samples = 384
+            length = (12000 * bitrate // sample_rate + padding) * 4
+        else:
+            samples = 1152 if (mpeg1 or layer == 2) else 576
+            length = (samples // 8) * 1000 * bitrate // sample_rate + padding
+        return FrameHeader(mpeg1=mpeg1, layer=layer, bitrate=bitrate,
+                           sample_rate=sample_rate, channels=channels,
+                           samples=samples, length=length)
+
+    def same_stream(self, other: "FrameHeader") -> bool:
+        """
+        Check if other frame is part of the same stream as this frame
+        """
+        return (self.mpeg1 == other.mpeg1 and self.layer == other.layer and
+                self.sample_rate == other.sample_rate)
+
+    def xing_offset(self) -> int:
+        """
+        Position of a Xing header, from the start of the frame
+        """
+        if self.mpeg1:
+            return 36 if self.channels == 2 else 21
+        return 21 if self.channels == 2 else 13
+
+
+class StreamInfo(NamedTuple):
+    """
+    Duration and audio format of an MPEG audio stream
+    """
+    duration: int  # milliseconds
+    sample_rate: int  # Hz
+    channels: int
+
+
+class HeaderParser(MutagenParser):
+    """
+    MP3Parser implementation that only reads the ID3 tags and the MPEG
+    frame headers of each file.
+
+    The duration is taken from the Xing or VBRI information frame, if
+    present. Otherwise, the frame headers are walked, stopping early if
+    the file has a constant bitrate. Files that cannot be handled this
+    way are decoded using MutagenParser.
+    """
+
+    # number of bytes to search for the first frame after the ID3 tags
+    MAX_SYNC_SEARCH = 64 * 1024
+    # number of frames with the same bitrate to check for constant bitrate
+    CBR_FRAMES = 32
+    # positions in the file (as a fraction of its size) to check for
+    # frames with a different bitrate
+    CBR_CHECK_POINTS = (0.25, 0.5, 0.75, 0.95)
+    # maximum number of frames to walk (about 45 minutes at 44.1kHz)
+    MAX_FRAMES = 100000
+
+    def __init__(self) -> None:
+        self.log = logging.getLogger(__name__)
+
+    def parse(self, filename: Path) -> Metadata:
+        """Extract the metadata from an MP3 file"""
+        with open(filename, 'rb') as src:
+            try:
+                metadata = self.parse_tags(filename, src)
+                info = self.parse_stream(src)
+                src.seek(0, io.SEEK_END)
+                filesize = src.tell()
+            except IOError as err:
+                raise InvalidMP3Exception(err) from err
+        if info is None or info.duration == 0:
+            self.log.debug('Failed to find frame headers in "%s"', filename.name)
+            return super().parse(filename)
+        metadata["duration"] = info.duration
+        # bitrate is in Kbps
+        metadata["bitrate"] = int(round(8.0 * filesize / float(info.duration)))
+        # MP3 files are always decoded to 16 bit samples
+        metadata["sample_width"] = 16
+        metadata["channels"] = info.channels
+        metadata["sample_rate"] = info.sample_rate
+        return Metadata(**metadata)  # type: ignore
+
+    def parse_stream(self, src: BinaryIO) -> Optional[StreamInfo]:
+        """
+        Find the duration and audio format of an MPEG audio stream.
+        Returns None if the stream cannot be parsed without decoding it.
+        """
+        first = self.find_first_frame(src, self.skip_id3v2(src))
+        if first is None:
+            return None
+        offset, header = first
+        src.seek(offset)
+        samples = self.parse_info_frame(header, src.read(header.length))
+        if samples is None:
+            samples = self.walk_frames(src, offset, header)
+        if samples is None:
+            return None
+        duration = int(round(1000.0 * samples / header.sample_rate))
+        return StreamInfo(duration=duration, sample_rate=header.sample_rate,
+                          channels=header.channels)
+
+    def find_first_frame(self, src: BinaryIO,
+                         offset: int) -> Optional[Tuple[int, FrameHeader]]:
+        """
+        Search for the first MPEG audio frame. To avoid false matches in
+        any remaining tag data, the frame header must be followed by the
+        header of another frame from the same stream.
+        """
+        src.seek(offset)
+        data = src.read(self.MAX_SYNC_SEARCH)
+        pos = data.find(b'\xFF')
+        while 0 <= pos < len(data) - 4:
+            header = FrameHeader.decode(data[pos:pos + 4])
+            if header is not None:
+                src.seek(offset + pos + header.length)
+                following = FrameHeader.decode(src.read(4))
+                if following is not None and header.same_stream(following):
+                    return (offset + pos, header)
+            pos = data.find(b'\xFF', pos + 1)
+        return None
+
+    @staticmethod
+    def parse_info_frame(header: FrameHeader, frame: bytes) -> Optional[int]:
+        """
+        Get the number of samples in the stream from a Xing or VBRI
+        information frame, if present. The number of samples does not
+        include the encoder delay and padding listed in a LAME tag.
+        """
+        pos = header.xing_offset()
+        if frame[pos:pos + 4] in {b'Xing', b'Info'}:
+            flags = struct.unpack('>I', frame[pos + 4:pos + 8])[0]
+            if not flags & 0x01:
+                return None
+            num_frames = struct.unpack('>I', frame[pos + 8:pos + 12])[0]
+            samples = num_frames * header.samples
+            pos += 12
+            if flags & 0x02:
+                pos += 4
+            if flags & 0x04:
+                pos += 100
+            if flags & 0x08:
+                pos += 4
+            if frame[pos:pos + 4] in LAME_ENCODERS and len(frame) >= pos + 24:
+                delay = (frame[pos + 21] << 4) | (frame[pos + 22] >> 4)
+                padding = ((frame[pos + 22] & 0x0F) << 8) | frame[pos + 23]
+                samples = max(0, samples - delay - padding)
+            return samples
+        if frame[36:40] == b'VBRI':
+            num_frames = struct.unpack('>I', frame[50:54])[0]
+            return num_frames * header.samples
+        return None
+
+    def walk_frames(self, src: BinaryIO, offset: int, first: FrameHeader) -> Optional[int]:
+        """
+        Count the number of samples in the stream by reading the header
+        of every frame. If the first CBR_FRAMES frames all have the same
+        bitrate, and so do frames from later in the file, the file size
+        is used to calculate the number of samples.
+        """
+        src.seek(0, io.SEEK_END)
+        end = src.tell()
+        src.seek(max(0, end - 128))
+        if src.read(3) == b'TAG':
+            # ID3v1 tag
+            end -= 128
+        samples = 0
+        constant_bitrate = True
+        for count in range(self.MAX_FRAMES):
+            src.seek(offset)
+            header = FrameHeader.decode(src.read(4))
+            if header is None or not header.same_stream(first):
+                return samples
+            if header.bitrate != first.bitrate:
+                constant_bitrate = False
+            elif (constant_bitrate and count == self.CBR_FRAMES and
+                  self.is_constant_bitrate(src, offset, end, first)):
+                audio_bytes = end - offset
+                seconds = (8.0 * audio_bytes) / (1000.0 * first.bitrate)
+                return samples + int(round(seconds * first.sample_rate))
+            samples += header.samples
+            offset += header.length
+        return None
+
+    def is_constant_bitrate(self, src: BinaryIO, start: int, end: int,
+                            first: FrameHeader) -> bool:
+        """
+        Check that frames from later in the stream have the same bitrate
+        as the first frame
+        """
+        for point in self.CBR_CHECK_POINTS:
+            pos = start + int((end - start) * point)
+            src.seek(pos)
+            data = src.read(2 * first.length + 4)
+            idx = data.find(b'\xFF')
+            while 0 <= idx < len(data) - 4:
+                header = FrameHeader.decode(data[idx:idx + 4])
+                if header is not None and header.same_stream(first):
+                    following = FrameHeader.decode(
+                        data[idx + header.length:idx + header.length + 4])
+                    if following is not None and following.same_stream(first):
+                        if first.bitrate not in {header.bitrate, following.bitrate}:
+                            return False
+                        break
+                idx = data.find(b'\xFF', idx + 1)
+        return True
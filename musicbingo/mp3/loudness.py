@@ -0,0 +1,211 @@
+"""
+Measurement of the loudness of songs.
+
+Normalising the loudness of a game while it is being encoded requires
+an adaptive filter that analyses the whole stream, and every game that
+uses a song analyses it again. Instead, the integrated loudness, true
+peak and loudness range (EBU R128) of each song are measured once and
+stored in the database. A fixed gain can then be calculated for each
+song, which moves every song to the same target loudness and which can
+be applied by the editor in the same pass that combines the songs.
+"""
+
+import logging
+import math
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import List, NamedTuple, Optional, Sequence
+
+from musicbingo.metadata import Metadata
+from musicbingo.progress import Progress, TextProgress
+from musicbingo.song import Song
+
+from .editor import MP3Editor
+from .mp3file import MP3File
+
+# the loudness (in LUFS) that every song is moved to
+TARGET_LOUDNESS = -16.0
+# the maximum true peak (in dBTP) of a song after its gain is applied
+MAX_TRUE_PEAK = -1.0
+# the largest change (in dB) that is applied to a song
+MAX_GAIN = 20.0
+# the absolute gate (in LUFS) of EBU R128. The loudness of a song that is
+# silent is stored as this value, so that it is only measured once
+SILENCE = -70.0
+
+
+class Loudness(NamedTuple):
+    """
+    The EBU R128 loudness measurements of one file
+    """
+    loudness: float  # integrated loudness (LUFS)
+    true_peak: float  # maximum true peak (dBTP)
+    loudness_range: float  # loudness range (LU)
+
+
+SUMMARY_RE = {
+    'loudness': re.compile(r'^\s*I:\s+(-?inf|-?[\d.]+) LUFS', re.MULTILINE),
+    'loudness_range': re.compile(r'^\s*LRA:\s+(-?inf|-?[\d.]+) LU$', re.MULTILINE),
+    'true_peak': re.compile(r'^\s*Peak:\s+(-?inf|-?[\d.]+) dBFS', re.MULTILINE),
+}
+
+
+def measure_args(ffmpeg: str, mp3file: MP3File) -> List[str]:
+    """
+    Create the ffmpeg command that measures the loudness of the section
+    of mp3file between its start and end positions
+    """
+    args: List[str] = [ffmpeg, '-hide_banner', '-nostats']
+    if mp3file.start is not None and mp3file.start > 0:
+        args += ['-ss', str(mp3file.start / 1000.0)]
+    if mp3file.end is not None:
+        args += ['-t', str((mp3file.end - mp3file.start) / 1000.0)]
+    args += [
+        '-i', str(mp3file.filename),
+        '-af', 'ebur128=peak=true:framelog=verbose',
+        '-f', 'null', '-',
+    ]
+    return args
+
+
+def parse_summary(output: str) -> Optional[Loudness]:
+    """
+    Find the summary from the ffmpeg "ebur128" filter in the output of
+    ffmpeg. Returns None if the output does not contain a summary.
+    """
+    values = {}
+    for name, pattern in SUMMARY_RE.items():
+        matches = pattern.findall(output)
+        if not matches:
+            return None
+        # only the last summary is for the whole file
+        values[name] = float(matches[-1])
+    return Loudness(**values)
+
+
+def measure(ffmpeg: str, mp3file: MP3File) -> Loudness:
+    """
+    Use ffmpeg to measure the loudness of mp3file
+    """
+    args = measure_args(ffmpeg, mp3file)
+    result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, errors='replace', check=False)
+    loudness = None
+    if result.returncode == 0:
+        loudness = parse_summary(result.stderr)
+    if loudness is None:
+        raise IOError(f'Failed to measure the loudness of "{mp3file.filename}"')
+    return loudness
+
+
+def calculate_gain(metadata: Metadata, target: float = TARGET_LOUDNESS,
+                   max_peak: float = MAX_TRUE_PEAK) -> Optional[float]:
+    """
+    Calculate the gain (in dB) that moves a song to the target loudness,
+    without its true peak going above max_peak.
+    The gain is limited to +/- MAX_GAIN dB.
+    Returns None if the loudness of the song has not been measured, or if
+    the song is silent.
+    """
+    if metadata.loudness is None or metadata.true_peak is None:
+        return None
+    if not (math.isfinite(metadata.loudness) and math.isfinite(metadata.true_peak)):
+        return None
+    if metadata.loudness <= SILENCE:
+        return None
+    gain = min(target - metadata.loudness, max_peak - metadata.true_peak)
+    return round(max(-MAX_GAIN, min(MAX_GAIN, gain)), 2)
+
+
+class LoudnessAnalyser:
+    """
+    Measures the loudness of songs that have not already been measured
+    """
+
+    def __init__(self, editor: MP3Editor, progress: Progress) -> None:
+        self.editor = editor
+        self.progress = progress
+        self.log = logging.getLogger(__name__)
+
+    def analyse(self, songs: Sequence[Song]) -> List[Song]:
+        """
+        Measure the loudness of each song that does not have a loudness.
+        Returns the list of songs that have been measured
+        """
+        todo = [song for song in songs if song.loudness is None]
+        measured: List[Song] = []
+        for index, song in enumerate(todo):
+            if self.progress.abort:
+                break
+            self.progress.text = f'Measuring loudness of {Song.clean(song.title)}'
+            self.progress.pct = 100.0 * index / len(todo)
+            try:
+                result = self.editor.measure_loudness(self.editor.use(song))
+            except NotImplementedError:
+                break
+            except IOError as err:
+                self.log.warning('%s', err)
+                continue
+            if not all(math.isfinite(value) for value in result):
+                # a silent song does not have a loudness that a gain
+                # can be calculated from. Infinite values cannot be
+                # stored in every database, so SILENCE is used instead
+                self.log.warning('Song "%s" is silent', song.filename)
+                result = Loudness(loudness=SILENCE, true_peak=SILENCE, loudness_range=0.0)
+            song.loudness = result.loudness
+            song.true_peak = result.true_peak
+            song.loudness_range = result.loudness_range
+            measured.append(song)
+        if todo:
+            self.progress.pct = 100.0
+        return measured
+
+    @staticmethod
+    def save(session, songs: Sequence[Song]) -> int:
+        """
+        Store the loudness of each song in the database.
+        Returns the number of songs that were found in the database.
+        """
+        count = 0
+        for song in songs:
+            db_song = song.model(session)
+            if db_song is None:
+                continue
+            db_song.set(loudness=song.loudness, true_peak=song.true_peak,
+                        loudness_range=song.loudness_range)
+            count += 1
+        return count
+
+
+def main(args: Sequence[str]) -> int:
+    """
+    Measure the loudness of all of the songs in a directory, e.g.:
+
+        python -m musicbingo.mp3.loudness Clips/Sixties
+    """
+    # pylint: disable=import-outside-toplevel
+    from musicbingo.directory import Directory
+    from musicbingo.options import Options
+    from musicbingo.mp3.factory import MP3Factory
+    from musicbingo import models
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    opts = Options.parse(args)
+    models.db.DatabaseConnection.bind(opts.database, debug=opts.debug)
+    progress = TextProgress()
+    clips = Directory(None, Path(opts.clip_directory))
+    clips.search(MP3Factory.create_parser(opts.mp3_parser), progress,
+                 parse_workers=opts.parse_workers)
+    songs = clips.get_songs(clips.ref_id)
+    editor = MP3Factory.create_editor(opts.mp3_editor)
+    measured = LoudnessAnalyser(editor, progress).analyse(songs)
+    with models.db.session_scope() as session:
+        saved = LoudnessAnalyser.save(session, measured)
+    print(f'\nMeasured {len(measured)} songs, saved {saved} to the database')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
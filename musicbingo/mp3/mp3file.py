@@ -29,6 +29,8 @@ class MP3File:
         below maximum volume
     overlap: int, optional
         If not None, overlap this file with the previous MP3 file (in milliseconds)
+    gain: float, optional
+        If not None, change the volume of this MP3 file by a fixed amount (in dB)
     """
 
     def __init__(self,
@@ -38,13 +40,15 @@ class MP3File:
                  end: int,
                  metadata: Metadata,
                  headroom: Optional[int] = None,
-                 overlap: int = 0):
+                 overlap: int = 0,
+                 gain: Optional[float] = None):
         self.filename = filename
         self.mode = mode
         self.headroom = headroom
         self.start = start
         self.end = end
         self.overlap = overlap
+        self.gain = gain
         self._metadata = metadata
 
     def close(self):
@@ -71,7 +75,19 @@ class MP3File:
         """
         return MP3File(self.filename, self.mode,
                        metadata=self._metadata, start=self.start,
-                       end=self.end, headroom=headroom, overlap=self.overlap)
+                       end=self.end, headroom=headroom, overlap=self.overlap,
+                       gain=self.gain)
+
+    def amplify(self, gain: float) -> "MP3File":
+        """
+        modify volume of MP3 file by "gain" dB.
+        Unlike normalize(), the same change is applied to the whole file,
+        which allows gains that have been calculated in advance to be used
+        """
+        return MP3File(self.filename, self.mode,
+                       metadata=self._metadata, start=self.start,
+                       end=self.end, headroom=self.headroom, overlap=self.overlap,
+                       gain=gain)
 
     def clip(self, start: Optional[int], end: Optional[int]) -> "MP3File":
         """
@@ -85,7 +101,8 @@ class MP3File:
             new_end = min(end, new_end)
         return MP3File(self.filename, mode=self.mode,
                        metadata=self._metadata, headroom=self.headroom,
-                       start=new_start, end=new_end, overlap=self.overlap)
+                       start=new_start, end=new_end, overlap=self.overlap,
+                       gain=self.gain)
 
     def overlap_with_previous(self, overlap: Duration) -> "MP3File":
         """
@@ -93,7 +110,8 @@ class MP3File:
         """
         return MP3File(self.filename, mode=self.mode,
                        metadata=self._metadata, headroom=self.headroom,
-                       start=self.start, end=self.end, overlap=int(overlap))
+                       start=self.start, end=self.end, overlap=int(overlap),
+                       gain=self.gain)
 
     def __len__(self) -> int:
         return int(self.duration) - self.overlap
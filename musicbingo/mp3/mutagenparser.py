@@ -4,6 +4,7 @@ Implementation of the MP3Parser interface using mutagen
 
 import io
 from pathlib import Path
+from typing import Any, BinaryIO, Dict
 
 from mutagen.easyid3 import EasyID3  # type: ignore
 from pydub import AudioSegment  # type: ignore
@@ -24,7 +25,29 @@ class MutagenParser(MP3Parser):
                 mp3_data = io.BytesIO(src.read())
             except IOError as err:
                 raise InvalidMP3Exception(err) from err
-        mp3info = EasyID3(mp3_data)
+        metadata = self.parse_tags(filename, mp3_data)
+        mp3_data.seek(0, io.SEEK_END)
+        filesize = mp3_data.tell()
+        mp3_data.seek(0)
+        seg = AudioSegment.from_mp3(mp3_data)
+        # duration is in milliseconds
+        metadata["duration"] = len(seg)
+        # bitrate is in Kbps
+        metadata["bitrate"] = int(round(8.0 * filesize /
+                                        float(metadata["duration"])))
+        metadata["sample_width"] = seg.sample_width * 8
+        metadata["channels"] = seg.channels
+        # sample rate is in Hz
+        metadata["sample_rate"] = seg.frame_rate
+        return Metadata(**metadata)  # type: ignore
+
+    @staticmethod
+    def parse_tags(filename: Path, src: BinaryIO) -> Dict[str, Any]:
+        """
+        Extract the artist, title and album from the ID3 tags of an MP3 file
+        """
+        src.seek(0)
+        mp3info = EasyID3(src)
         try:
             artist = mp3info["artist"]
             title = mp3info["title"]
@@ -42,18 +65,4 @@ class MutagenParser(MP3Parser):
             metadata["album"] = str(mp3info["album"][0])
         except KeyError:
             metadata["album"] = filename.parent.name
-        del mp3info
-        mp3_data.seek(0, io.SEEK_END)
-        filesize = mp3_data.tell()
-        mp3_data.seek(0)
-        seg = AudioSegment.from_mp3(mp3_data)
-        # duration is in milliseconds
-        metadata["duration"] = len(seg)
-        # bitrate is in Kbps
-        metadata["bitrate"] = int(round(8.0 * filesize /
-                                        float(metadata["duration"])))
-        metadata["sample_width"] = seg.sample_width * 8
-        metadata["channels"] = seg.channels
-        # sample rate is in Hz
-        metadata["sample_rate"] = seg.frame_rate
-        return Metadata(**metadata)  # type: ignore
+        return metadata
@@ -2,6 +2,7 @@
 
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import BinaryIO
 
 from musicbingo.song import Metadata
 
@@ -13,3 +14,23 @@ class MP3Parser(ABC):
     def parse(self, filename: Path) -> Metadata:
         """Extract the metadata from an MP3 file"""
         raise NotImplementedError()
+
+    @staticmethod
+    def skip_id3v2(src: BinaryIO) -> int:
+        """
+        Find the position of the first byte after any ID3v2 tags
+        """
+        offset = 0
+        while True:
+            src.seek(offset)
+            data = src.read(10)
+            if len(data) < 10 or data[:3] != b'ID3':
+                return offset
+            # tag size is stored as a 28 bit "syncsafe" integer
+            size = 0
+            for byte in data[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            offset += size + 10
+            if data[5] & 0x10:
+                # footer present
+                offset += 10
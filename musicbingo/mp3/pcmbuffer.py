@@ -0,0 +1,185 @@
+"""
+Assembles the audio of an output file in one preallocated, memory-mapped
+PCM buffer.
+
+Appending to an AudioSegment creates a copy of all of the audio that has
+already been added, which makes combining n files O(n^2). PCMBuffer
+works out the size of the output from the start, end and overlap of each
+input file, and then copies each decoded file into its place in the
+buffer. Cross-fades are applied in place, so each sample is only copied
+a fixed number of times.
+"""
+
+import mmap
+from pathlib import Path
+import subprocess
+import tempfile
+from typing import List, Optional, Sequence
+
+from pydub import AudioSegment  # type: ignore
+
+from musicbingo.metadata import Metadata
+from musicbingo.progress import Progress
+
+from .mp3file import MP3File
+
+
+class PCMBuffer:
+    """
+    Signed 16 bit little-endian PCM audio, stored in a memory-mapped
+    temporary file
+    """
+
+    SAMPLE_WIDTH = 2
+    # number of bytes written to the encoder at a time
+    WRITE_SIZE = 1024 * 1024
+
+    def __init__(self, sample_rate: int, channels: int, num_frames: int,
+                 directory: Optional[Path] = None) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = self.SAMPLE_WIDTH * channels
+        # number of frames of audio that have been added
+        self.length = 0
+        # pylint: disable=consider-using-with
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._capacity = max(1, num_frames)
+        self._file.truncate(self._capacity * self.frame_size)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity * self.frame_size)
+
+    @classmethod
+    def num_frames(cls, files: Sequence[MP3File], sample_rate: int) -> int:
+        """
+        Calculate the number of frames of audio in the combination of
+        the given files
+        """
+        total = 0
+        for index, mp3file in enumerate(files):
+            total += (mp3file.end - mp3file.start) * sample_rate // 1000
+            if index > 0:
+                total -= mp3file.overlap * sample_rate // 1000
+        return total
+
+    def close(self) -> None:
+        """
+        Release the memory map and delete the temporary file
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "PCMBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        """length (in milliseconds) of the audio in the buffer"""
+        return self.length * 1000 // self.sample_rate
+
+    def conform(self, seg: AudioSegment) -> AudioSegment:
+        """
+        Convert seg to the sample rate, number of channels and sample
+        width of this buffer
+        """
+        if seg.frame_rate != self.sample_rate:
+            seg = seg.set_frame_rate(self.sample_rate)
+        if seg.channels != self.channels:
+            seg = seg.set_channels(self.channels)
+        if seg.sample_width != self.SAMPLE_WIDTH:
+            seg = seg.set_sample_width(self.SAMPLE_WIDTH)
+        return seg
+
+    def segment(self, start: int, end: int) -> AudioSegment:
+        """
+        Create an AudioSegment from the frames between start and end
+        """
+        data = self._map[start * self.frame_size:end * self.frame_size]
+        return AudioSegment(data=data, sample_width=self.SAMPLE_WIDTH,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+    def append(self, seg: AudioSegment, crossfade: int = 0) -> None:
+        """
+        Add seg to the end of the buffer, cross-fading the first
+        "crossfade" milliseconds of seg with the end of the buffer.
+        This matches the behaviour of AudioSegment.append().
+        """
+        seg = self.conform(seg)
+        data = seg.raw_data
+        crossfade = min(crossfade, len(self), len(seg))
+        pos = self.length
+        if crossfade > 0:
+            # the length of the fade is calculated in the same way as the
+            # slicing of an AudioSegment
+            fade_frames = int(seg.frame_count(ms=crossfade))
+            pos -= fade_frames
+            fade_out = self.segment(pos, self.length).fade(
+                to_gain=-120, start=0, end=float('inf'))
+            fade_in = seg[:crossfade].fade(from_gain=-120, start=0, end=float('inf'))
+            data = (fade_out * fade_in).raw_data + data[fade_frames * self.frame_size:]
+        self.write(pos, data)
+
+    def write(self, pos: int, data: bytes) -> None:
+        """
+        Write data to the buffer, starting at frame "pos"
+        """
+        end = pos + len(data) // self.frame_size
+        if end > self._capacity:
+            # the decoded files were longer than expected
+            self._capacity = max(end, self._capacity + self._capacity // 4)
+            self._file.truncate(self._capacity * self.frame_size)
+            self._map.resize(self._capacity * self.frame_size)
+        self._map[pos * self.frame_size:end * self.frame_size] = data
+        self.length = end
+
+    def encode_args(self, filename: Path, metadata: Metadata) -> List[str]:
+        """
+        Create the command that encodes PCM audio from stdin into an MP3 file
+        """
+        args = [
+            AudioSegment.converter, '-hide_banner', '-loglevel', 'panic', '-v', 'quiet',
+            '-f', f's{8 * self.SAMPLE_WIDTH}le',
+            '-ar', str(self.sample_rate),
+            '-ac', str(self.channels),
+            '-i', 'pipe:0',
+            '-metadata', f'title={metadata.title}',
+        ]
+        if metadata.artist:
+            args += ['-metadata', f'artist={metadata.artist}']
+        if metadata.album:
+            args += ['-metadata', f'album={metadata.album}']
+        args += [
+            '-ab', f'{metadata.bitrate}k',
+            '-ar', str(metadata.sample_rate),
+            '-ac', str(metadata.channels),
+            '-acodec', 'libmp3lame',
+            '-f', 'mp3',
+            '-y', str(filename),
+        ]
+        return args
+
+    def encode(self, filename: Path, metadata: Metadata, progress: Progress,
+               start_pct: float = 0.0) -> None:
+        """
+        Encode the contents of the buffer as an MP3 file, by piping the
+        audio into the encoder. Progress is reported from start_pct to 100%.
+        Can be terminated by setting progress.abort to True
+        """
+        args = self.encode_args(filename, metadata)
+        total = self.length * self.frame_size
+        with subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL) as proc:
+            assert proc.stdin is not None
+            try:
+                for pos in range(0, total, self.WRITE_SIZE):
+                    if progress.abort:
+                        proc.kill()
+                        return
+                    proc.stdin.write(self._map[pos:min(total, pos + self.WRITE_SIZE)])
+                    progress.pct = start_pct + (100.0 - start_pct) * pos / total
+                proc.stdin.close()
+            except BrokenPipeError:
+                # the encoder has exited, which is reported below
+                pass
+            if proc.wait() != 0:
+                raise IOError(f'Failed to encode "{filename.name}"')
+        progress.pct = 100.0
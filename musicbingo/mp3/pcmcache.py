@@ -0,0 +1,254 @@
+"""
+On-disk cache of decoded audio.
+
+Every game decodes each of its clips, plus the transition and countdown
+assets. As the same clips are used by many games, the decoded, trimmed
+and resampled audio is stored as a WAV file, so that it only needs to
+be decoded once. The cache is limited in size, with the least recently
+used files removed first.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from musicbingo.assets import Assets
+from musicbingo.options import GameMode
+from musicbingo.progress import Progress, TextProgress
+from musicbingo.scanindex import content_digest
+from musicbingo.song import Song
+
+from .editor import MP3Editor
+from .mp3file import MP3File
+
+# function that decodes an MP3 file into a WAV file with the given
+# sample rate and number of channels
+Decoder = Callable[[MP3File, Path, int, int], None]
+
+
+class PCMCache:
+    """
+    Stores decoded audio, keyed by the content digest of the source
+    file, the start and end position within that file and the sample
+    rate and number of channels of the decoded audio.
+    The modification time of each cached file is updated every time it
+    is used, so that the least recently used files are removed once the
+    cache is larger than max_size.
+    """
+
+    SUFFIX = '.wav'
+
+    def __init__(self, directory: Path, max_size: int) -> None:
+        """
+        max_size is in bytes. A max_size of zero disables eviction.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.log = logging.getLogger(__name__)
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory: str, max_size_mb: int) -> Optional["PCMCache"]:
+        """
+        Create a cache, or return None if the cache is disabled
+        """
+        if not directory:
+            return None
+        return PCMCache(Path(directory), max_size_mb * 1024 * 1024)
+
+    def key(self, mp3file: MP3File, sample_rate: int, channels: int) -> str:
+        """
+        Get the key used to store the decoded version of mp3file
+        """
+        stat = mp3file.filename.stat()
+        ident = (str(mp3file.filename), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(ident)
+        if digest is None:
+            digest = content_digest(mp3file.filename)
+            with self._lock:
+                self._digests[ident] = digest
+        item = f'{digest}:{mp3file.start}:{mp3file.end}:{sample_rate}:{channels}'
+        return hashlib.sha256(item.encode('utf-8')).hexdigest()
+
+    def get(self, mp3file: MP3File, sample_rate: int, channels: int) -> Optional[Path]:
+        """
+        Get the filename of the decoded version of mp3file, if it is
+        in the cache.
+        """
+        filename = self.directory / f'{self.key(mp3file, sample_rate, channels)}{self.SUFFIX}'
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def fetch(self, mp3file: MP3File, sample_rate: int, channels: int,
+              decoder: Decoder) -> Path:
+        """
+        Get the filename of the decoded version of mp3file. If it is not
+        already in the cache, decoder is used to create it.
+        """
+        key = self.key(mp3file, sample_rate, channels)
+        filename = self.directory / f'{key}{self.SUFFIX}'
+        try:
+            os.utime(filename)
+            return filename
+        except FileNotFoundError:
+            pass
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmpfile = self.directory / f'{key}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            decoder(mp3file, tmpfile, sample_rate, channels)
+            os.replace(tmpfile, filename)
+        finally:
+            if tmpfile.exists():
+                tmpfile.unlink()
+        self.log.debug('Added %s to PCM cache', mp3file.filename.name)
+        self._added(filename)
+        return filename
+
+    def _added(self, filename: Path) -> None:
+        """
+        Update the size of the cache after adding filename, removing the
+        least recently used files if the cache is too large.
+        """
+        if self.max_size < 1:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += filename.stat().st_size
+                if self._size <= self.max_size:
+                    return
+        self.evict(keep={filename})
+
+    def entries(self) -> List[Tuple[int, int, Path]]:
+        """
+        Get the modification time, size and filename of every file in the
+        cache, least recently used first.
+        """
+        entries: List[Tuple[int, int, Path]] = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for item in scan:
+                    if not item.name.endswith(self.SUFFIX):
+                        continue
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, Path(item.path)))
+        except FileNotFoundError:
+            pass
+        entries.sort()
+        return entries
+
+    def evict(self, keep: Optional[Set[Path]] = None) -> int:
+        """
+        Remove the least recently used files until the cache is no larger
+        than max_size. Returns the number of files that were removed.
+        """
+        if keep is None:
+            keep = set()
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, filename in entries:
+                if self.max_size < 1 or total <= self.max_size:
+                    break
+                if filename in keep:
+                    continue
+                try:
+                    filename.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._size = total
+        if removed:
+            self.log.debug('Removed %d files from PCM cache', removed)
+        return removed
+
+    def size(self) -> int:
+        """
+        Total size (in bytes) of the cache
+        """
+        return sum(size for _, size, _ in self.entries())
+
+
+def prewarm(cache: PCMCache, editor: MP3Editor, songs: Sequence[Song],
+            progress: Progress, mode: GameMode = GameMode.BINGO) -> int:
+    """
+    Add the decoded audio of each song to the cache, plus the transition
+    and countdown assets that a game using these songs would need.
+    Returns the number of files that were decoded.
+    """
+    items: List[Tuple[MP3File, int, int]] = []
+    formats: Set[Tuple[int, int]] = set()
+    for song in songs:
+        items.append((editor.use(song), song.sample_rate, song.channels))
+        formats.add((song.sample_rate, song.channels))
+    for sample_rate, channels in sorted(formats):
+        items.append((editor.use(Assets.transition(sample_rate)), sample_rate, channels))
+        if mode == GameMode.QUIZ:
+            countdown = editor.use(Assets.quiz_countdown(sample_rate))
+            for start, end in Assets.QUIZ_COUNTDOWN_POSITIONS.values():
+                items.append((countdown.clip(start, end), sample_rate, channels))
+        else:
+            items.append((editor.use(Assets.countdown(sample_rate)), sample_rate, channels))
+    decoded = 0
+    for index, (mp3file, sample_rate, channels) in enumerate(items):
+        if progress.abort:
+            break
+        progress.text = f'Decoding {mp3file.filename.name}'
+        progress.pct = 100.0 * index / len(items)
+        if cache.get(mp3file, sample_rate, channels) is not None:
+            continue
+        cache.fetch(mp3file, sample_rate, channels, editor.decode)
+        decoded += 1
+    progress.pct = 100.0
+    return decoded
+
+
+def main(args: Sequence[str]) -> int:
+    """
+    Fill the PCM cache using all of the songs in a directory, e.g.:
+
+        python -m musicbingo.mp3.pcmcache --pcm-cache "PCM Cache" Clips/Sixties
+    """
+    # pylint: disable=import-outside-toplevel
+    from musicbingo.directory import Directory
+    from musicbingo.options import Options
+    from musicbingo.mp3.factory import MP3Factory
+    from musicbingo import models
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    opts = Options.parse(args)
+    if opts.debug:
+        logging.getLogger(__name__).setLevel(logging.DEBUG)
+    cache = PCMCache.create(opts.pcm_cache, opts.pcm_cache_size)
+    if cache is None:
+        print('Error: the PCM cache directory has not been set, use --pcm-cache')
+        return 1
+    models.db.DatabaseConnection.bind(opts.database, debug=opts.debug)
+    progress = TextProgress()
+    clips = Directory(None, Path(opts.clip_directory))
+    clips.search(MP3Factory.create_parser(opts.mp3_parser), progress,
+                 parse_workers=opts.parse_workers)
+    songs = clips.get_songs(clips.ref_id)
+    editor = MP3Factory.create_editor(opts.mp3_editor, pcm_cache=cache)
+    decoded = prewarm(cache, editor, songs, progress, opts.mode)
+    cache.evict()
+    print(f'\nDecoded {decoded} files, PCM cache size {cache.size() // (1024 * 1024)}MB')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,131 +2,114 @@
 Implementation of the MP3Engine interface using mutagen and pydub
 """
 
-from typing import Any, Dict, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from pydub import AudioSegment, playback, utils  # type: ignore
-
-try:
-    import pyaudio  # type: ignore
-    USE_PYAUDIO = True
-except ImportError:
-    USE_PYAUDIO = False
+from pydub import AudioSegment, playback  # type: ignore
 
 from musicbingo.mp3.editor import MP3Editor, MP3File, MP3FileWriter
+from musicbingo.mp3.pcmbuffer import PCMBuffer
 from musicbingo.mp3.player import MP3Player
+from musicbingo.mp3.streamplayer import StreamingPlayer
 from musicbingo.progress import Progress
 
+if TYPE_CHECKING:
+    from musicbingo.mp3.loudness import Loudness
+
 
 class PydubEditor(MP3Editor, MP3Player):
     """MP3Editor implementation using pydub"""
 
+    supports_frame_copy = True
+
     @classmethod
     def is_playback_supported(cls) -> bool:
         """
         Checks if pyaudio is available
         """
-        global USE_PYAUDIO  # pylint: disable=global-statement, global-variable-not-assigned
-        return USE_PYAUDIO
+        return StreamingPlayer.is_supported()
 
     def _generate(self, destination: MP3FileWriter,
                   progress: Progress) -> None:
         """generate output file, combining all input files"""
         assert destination._metadata is not None
-        output: Optional[AudioSegment] = None
+        sample_rate = destination._metadata.sample_rate
+        channels = destination._metadata.channels
         num_files = float(len(destination._files))
-        for index, mp3file in enumerate(destination._files, 1):
-            progress.pct = 50.0 * index / num_files
-            progress.text = f'Adding {mp3file.filename.name}'
-            if progress.abort:
-                return
-            seg = AudioSegment.from_mp3(str(mp3file.filename))
-            if mp3file.start is not None and mp3file.start > 0:
-                if mp3file.end is not None:
-                    seg = seg[mp3file.start:mp3file.end]
-                else:
-                    seg = seg[mp3file.start:]
-            elif mp3file.end is not None:
-                seg = seg[:mp3file.end]
-            if mp3file.headroom is not None:
-                seg = seg.normalize(mp3file.headroom)
-            if output is None:
-                output = seg
-            else:
-                output = output.append(seg, crossfade=int(mp3file.overlap))
-        tags: Dict[str, Any] = {
-            "artist": destination._metadata.artist,
-            "title": destination._metadata.title
-        }
-        if destination._metadata.album:
-            tags["album"] = destination._metadata.album
-        assert output is not None
-        progress.text = f'Encoding MP3 file "{destination.filename.name}"'
-        progress.pct = 50.0
-        if progress.abort:
-            return
         dest_dir = destination.filename.parent
         if not dest_dir.exists():
             dest_dir.mkdir(parents=True)
-        parameters = [
-            '-ar', str(destination._metadata.sample_rate),
-            '-ac', str(destination._metadata.channels),
-        ]
-        #parameters.append(f'-acodec copy')
-        output.export(str(destination.filename), format="mp3",
-                      bitrate=f'{destination._metadata.bitrate}k',
-                      parameters=parameters, tags=tags)
-        progress.pct = 100.0
-
-    def play(self, mp3file: MP3File, progress: Progress) -> None:
-        """play the specified mp3 file"""
-        global USE_PYAUDIO  # pylint: disable=global-statement, global-variable-not-assigned
+        num_frames = PCMBuffer.num_frames(destination._files, sample_rate)
+        with PCMBuffer(sample_rate, channels, num_frames, dest_dir) as output:
+            for index, mp3file in enumerate(destination._files):
+                progress.pct = 50.0 * (index + 1) / num_files
+                progress.text = f'Adding {mp3file.filename.name}'
+                if progress.abort:
+                    return
+                seg = self.load_segment(self.use_cached_pcm(mp3file, sample_rate, channels))
+                if mp3file.gain:
+                    seg = seg.apply_gain(mp3file.gain)
+                if mp3file.headroom is not None:
+                    seg = seg.normalize(mp3file.headroom)
+                output.append(seg, crossfade=(int(mp3file.overlap) if index > 0 else 0))
+            progress.text = f'Encoding MP3 file "{destination.filename.name}"'
+            if progress.abort:
+                return
+            output.encode(destination.filename, destination._metadata, progress,
+                          start_pct=50.0)
 
-        seg = AudioSegment.from_mp3(str(mp3file.filename))
-        start = 0
-        if mp3file.start is not None:
-            start = mp3file.start
+    @staticmethod
+    def load_segment(mp3file: MP3File) -> AudioSegment:
+        """
+        Load the section of mp3file between its start and end positions.
+        mp3file might refer to a WAV file from the PCM cache.
+        """
+        if mp3file.filename.suffix.lower() == '.wav':
+            seg = AudioSegment.from_wav(str(mp3file.filename))
+        else:
+            seg = AudioSegment.from_mp3(str(mp3file.filename))
+        if mp3file.start is not None and mp3file.start > 0:
             if mp3file.end is not None:
                 seg = seg[mp3file.start:mp3file.end]
             else:
                 seg = seg[mp3file.start:]
         elif mp3file.end is not None:
             seg = seg[:mp3file.end]
-        if mp3file.headroom is not None:
-            seg = seg.normalize(mp3file.headroom)
-        if USE_PYAUDIO:
-            self.play_with_pyaudio(seg, start, progress)
-        else:
-            # pydub has multiple playback fallbacks, but does not
-            # provide an easy way to abort playback
-            playback.play(seg)
+        return seg
 
-    @staticmethod
-    def play_with_pyaudio(seg: AudioSegment, pos: int, progress: Progress) -> None:
-        """use pyaudio library to play audio segment"""
-        pya = pyaudio.PyAudio()
-        stream = pya.open(format=pya.get_format_from_width(seg.sample_width),
-                          channels=seg.channels,
-                          rate=seg.frame_rate,
-                          output=True)
+    def decode(self, mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+        """
+        Decode the section of mp3file between its start and end
+        positions, creating a WAV file with the given sample rate and
+        number of channels.
+        """
+        seg = self.load_segment(mp3file)
+        seg = seg.set_frame_rate(sample_rate).set_channels(channels)
+        seg.export(str(dest), format="wav")
 
-        progress.set_num_phases(1)
-        progress.set_current_phase(0)
-        try:
-            chunks = utils.make_chunks(seg, 500)
-            scale: float = 1.0
-            if chunks:
-                scale = 100.0 / float(len(chunks))
-            for index, chunk in enumerate(chunks):
-                if progress.abort:
-                    break
-                progress.pct = index * scale
-                secs = pos // 1000
-                mins = secs // 60
-                secs %= 60
-                progress.set_percentage_text(f'{mins:02d}:{secs:02d}')
-                stream.write(chunk._data)
-                pos += len(chunk)
-        finally:
-            stream.stop_stream()
-            stream.close()
-            pya.terminate()
+    def measure_loudness(self, mp3file: MP3File) -> "Loudness":
+        """
+        Measure the integrated loudness, true peak and loudness range
+        of the section of mp3file between its start and end positions.
+        """
+        # pylint: disable=import-outside-toplevel
+        from musicbingo.mp3.loudness import measure
+        return measure(AudioSegment.converter, mp3file)
+
+    def play(self, mp3file: MP3File, progress: Progress) -> None:
+        """
+        play the specified mp3 file.
+        If pyaudio is available, the file is decoded while it is being
+        played, so that playback starts straight away.
+        """
+        if StreamingPlayer.is_supported():
+            StreamingPlayer(AudioSegment.converter).play(mp3file, progress)
+            return
+        seg = self.load_segment(mp3file)
+        if mp3file.gain:
+            seg = seg.apply_gain(mp3file.gain)
+        if mp3file.headroom is not None:
+            seg = seg.normalize(mp3file.headroom)
+        # pydub has multiple playback fallbacks, but does not
+        # provide an easy way to abort playback
+        playback.play(seg)
@@ -0,0 +1,259 @@
+"""
+Playback of MP3 files that starts as soon as the first audio is decoded.
+
+ffmpeg seeks to the start position of the file and decodes it into a
+pipe. A background thread copies the decoded audio into a small ring
+buffer, which is written to the audio output in short chunks. Only a
+few seconds of audio are decoded ahead of playback, so playback starts
+straight away, even for long files, and it can be stopped within one
+chunk of progress.abort being set.
+"""
+
+import subprocess
+import threading
+from typing import List, Optional
+
+try:
+    import pyaudio  # type: ignore
+    USE_PYAUDIO = True
+except ImportError:
+    USE_PYAUDIO = False
+
+from musicbingo.duration import Duration
+from musicbingo.progress import Progress
+
+from .mp3file import MP3File
+
+
+class RingBuffer:
+    """
+    Fixed size queue of bytes, written by one thread and read by another.
+    Writes wait while the buffer is full, reads wait until enough data
+    is available.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        # no more data will be written
+        self.finished = False
+        # the reader has stopped, any more data is discarded
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return self._size
+
+    def write(self, data: bytes) -> bool:
+        """
+        Add data to the end of the buffer, waiting while it is full.
+        Returns False if the buffer was closed before all of the data
+        was added.
+        """
+        view = memoryview(data)
+        while view:
+            with self._cond:
+                while self._size == self.capacity and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return False
+                end = (self._start + self._size) % self.capacity
+                count = min(len(view), self.capacity - self._size, self.capacity - end)
+                self._data[end:end + count] = view[:count]
+                self._size += count
+                self._cond.notify_all()
+            view = view[count:]
+        return True
+
+    def read(self, size: int, timeout: Optional[float] = None) -> bytes:
+        """
+        Remove "size" bytes from the start of the buffer, waiting until
+        that much data is available. Returns less than "size" bytes once
+        the writer has finished, and returns an empty string if the data
+        is not available within "timeout" seconds.
+        """
+        size = min(size, self.capacity)
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self._size >= size or self.finished or self.closed,
+                    timeout=timeout):
+                return b''
+            count = min(size, self._size)
+            end = self._start + count
+            if end <= self.capacity:
+                result = bytes(self._data[self._start:end])
+            else:
+                result = (bytes(self._data[self._start:]) +
+                          bytes(self._data[:end - self.capacity]))
+            self._start = end % self.capacity
+            self._size -= count
+            self._cond.notify_all()
+            return result
+
+    def finish(self) -> None:
+        """
+        Signal that no more data will be written
+        """
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """
+        Signal that no more data will be read
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class AudioStream:
+    """
+    Audio output device, using pyaudio
+    """
+
+    def __init__(self, sample_rate: int, channels: int, sample_width: int) -> None:
+        self._pya = pyaudio.PyAudio()
+        self._stream = self._pya.open(format=self._pya.get_format_from_width(sample_width),
+                                      channels=channels, rate=sample_rate, output=True)
+
+    def write(self, data: bytes) -> None:
+        """
+        play data, waiting until it has been queued by the audio device
+        """
+        self._stream.write(data)
+
+    def close(self) -> None:
+        """
+        stop playback and release the audio device
+        """
+        try:
+            self._stream.stop_stream()
+            self._stream.close()
+        finally:
+            self._pya.terminate()
+
+
+class StreamingPlayer:
+    """
+    Plays MP3 files by decoding them with ffmpeg into a ring buffer
+    that feeds the audio output
+    """
+
+    SAMPLE_WIDTH = 2
+    # duration (in milliseconds) of audio written to the output at a time
+    CHUNK_SIZE = 50
+    # duration (in milliseconds) of audio that is decoded ahead of playback
+    BUFFER_SIZE = 2000
+    # number of bytes read from the decoder at a time
+    READ_SIZE = 16384
+
+    def __init__(self, converter: str = 'ffmpeg') -> None:
+        self.converter = converter
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        """
+        Checks if pyaudio is available
+        """
+        global USE_PYAUDIO  # pylint: disable=global-statement, global-variable-not-assigned
+        return USE_PYAUDIO
+
+    def decode_args(self, mp3file: MP3File, sample_rate: int, channels: int) -> List[str]:
+        """
+        Create the command that decodes the section of mp3file between
+        its start and end positions into PCM audio on stdout.
+        The start position is given before the input file, so that
+        ffmpeg seeks to it rather than decoding from the start of the file.
+        """
+        args: List[str] = [self.converter, '-hide_banner', '-loglevel', 'panic',
+                           '-v', 'quiet', '-nostdin']
+        if mp3file.start is not None and mp3file.start > 0:
+            args += ['-ss', str(mp3file.start / 1000.0)]
+        if mp3file.end is not None:
+            args += ['-t', str((mp3file.end - mp3file.start) / 1000.0)]
+        args += ['-i', str(mp3file.filename)]
+        filters: List[str] = []
+        if mp3file.gain:
+            filters.append(f'volume={mp3file.gain:.2f}dB')
+        if mp3file.headroom is not None:
+            filters.append(f'loudnorm=tp=-{mp3file.headroom}')
+        if filters:
+            args += ['-af', ','.join(filters)]
+        args += [
+            '-f', f's{8 * self.SAMPLE_WIDTH}le',
+            '-acodec', f'pcm_s{8 * self.SAMPLE_WIDTH}le',
+            '-ar', str(sample_rate),
+            '-ac', str(channels),
+            'pipe:1',
+        ]
+        return args
+
+    def open_output(self, sample_rate: int, channels: int) -> AudioStream:
+        """
+        Open the audio output device
+        """
+        return AudioStream(sample_rate, channels, self.SAMPLE_WIDTH)
+
+    def play(self, mp3file: MP3File, progress: Progress) -> None:
+        """
+        Play the section of mp3file between its start and end positions.
+        Can be terminated by setting progress.abort to True
+        """
+        sample_rate = mp3file.metadata.sample_rate
+        channels = mp3file.metadata.channels
+        frame_size = self.SAMPLE_WIDTH * channels
+        chunk_size = frame_size * (sample_rate * self.CHUNK_SIZE // 1000)
+        buf = RingBuffer(frame_size * (sample_rate * self.BUFFER_SIZE // 1000))
+        start = mp3file.start if mp3file.start is not None else 0
+        duration = max(1, int(mp3file.end) - start)
+        progress.set_num_phases(1)
+        progress.set_current_phase(0)
+        progress.pct = 0.0
+        progress.pct_text = Duration(start).format()
+        with subprocess.Popen(self.decode_args(mp3file, sample_rate, channels),
+                              stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL) as proc:
+            reader = threading.Thread(target=self.read_decoder, args=(proc, buf), daemon=True)
+            reader.start()
+            output: Optional[AudioStream] = None
+            try:
+                output = self.open_output(sample_rate, channels)
+                played = 0
+                while not progress.abort:
+                    data = buf.read(chunk_size, timeout=0.25)
+                    if not data:
+                        if buf.finished and len(buf) == 0:
+                            break
+                        continue
+                    output.write(data)
+                    played += len(data) // frame_size
+                    pos = played * 1000 // sample_rate
+                    progress.pct = min(100.0, 100.0 * pos / duration)
+                    progress.pct_text = Duration(start + pos).format()
+            finally:
+                buf.close()
+                if proc.poll() is None:
+                    proc.kill()
+                reader.join()
+                if output is not None:
+                    output.close()
+        if not progress.abort:
+            progress.pct = 100.0
+
+    def read_decoder(self, proc: subprocess.Popen, buf: RingBuffer) -> None:
+        """
+        Copy the output of the decoder into the ring buffer, until the
+        decoder exits or the ring buffer is closed
+        """
+        assert proc.stdout is not None
+        try:
+            while True:
+                data = proc.stdout.read1(self.READ_SIZE)  # type: ignore
+                if not data or not buf.write(data):
+                    break
+        finally:
+            buf.finish()
@@ -62,12 +62,41 @@ class Options(argparse.Namespace):
         OptionField('crossfade', int, 'Audio cross-fade (milliseconds)', 500, 0, 2000, None),
         OptionField('mp3_editor', str, 'MP3 editor engine', None, None, None, None),
         OptionField('mp3_player', str, 'MP3 player engine', None, None, None, None),
+        OptionField('mp3_parser', str, 'MP3 parser engine', None, None, None, None),
         OptionField('checkbox', bool, 'Add a checkbox to each Bingo ticket cell?',
                     False, None, None, None),
         OptionField('cards_per_page', int, 'Bingo cards per page', 3, 1, 6,
                     [1, 2, 3, 4, 6]),
         OptionField('doc_per_page', bool, 'Put each page in its own PDF document?',
                     False, None, None, None),
+        OptionField('pages_per_doc', int,
+                    'Maximum number of pages in each Bingo tickets PDF document (0=unlimited)',
+                    0, 0, 10000, None),
+        OptionField('pdf_workers', int,
+                    'Number of worker processes used to render Bingo ticket PDF documents',
+                    0, 0, 64, None),
+        OptionField('background_encode', bool,
+                    'Encode the MP3 file while generating Bingo tickets?',
+                    False, None, None, None),
+        OptionField('card_workers', int,
+                    'Number of worker processes used to generate Bingo tickets',
+                    0, 0, 64, None),
+        OptionField('parse_workers', int,
+                    'Number of worker processes used to parse MP3 files when searching for clips',
+                    0, 0, 64, None),
+        OptionField('encode_workers', int,
+                    'Number of processes used to encode the MP3 file of a game',
+                    0, 0, 64, None),
+        OptionField('clip_workers', int,
+                    'Number of clips that are created at the same time',
+                    0, 0, 64, None),
+        OptionField('pcm_cache', str,
+                    'Directory used to cache decoded audio (empty to disable the cache)',
+                    '', None, None, None),
+        OptionField('pcm_cache_size', int, 'Maximum size of the decoded audio cache (MB)',
+                    4096, 0, 1000000, None),
+        OptionField('seed', int, 'Random number seed used to generate a game',
+                    None, None, None, None),
         OptionField('max_tickets_per_user', int, 'Maximum tickets per user', 2, 1, 100, None),
         OptionField('debug', bool, 'Enable debug', False, None, None, None),
         OptionField('create_superuser', bool, 'Create a super user account?',
@@ -103,9 +132,20 @@ class Options(argparse.Namespace):
                  crossfade: int = 500,
                  mp3_editor: Optional[str] = None,
                  mp3_player: Optional[str] = None,
+                 mp3_parser: Optional[str] = None,
                  checkbox: bool = False,
                  cards_per_page: int = 3,
                  doc_per_page: bool = False,
+                 pages_per_doc: int = 0,
+                 pdf_workers: int = 0,
+                 background_encode: bool = False,
+                 card_workers: int = 0,
+                 parse_workers: int = 0,
+                 encode_workers: int = 0,
+                 clip_workers: int = 0,
+                 pcm_cache: str = '',
+                 pcm_cache_size: int = 4096,
+                 seed: Optional[int] = None,
                  page_size: Union[PageSizes, str] = 'a4',
                  secret_key: Optional[str] = None,
                  max_tickets_per_user: int = 2,
@@ -149,9 +189,20 @@ class Options(argparse.Namespace):
         self.crossfade = crossfade
         self.mp3_editor = mp3_editor
         self.mp3_player = mp3_player
+        self.mp3_parser = mp3_parser
         self.checkbox = checkbox
         self.cards_per_page = cards_per_page
         self.doc_per_page = doc_per_page
+        self.pages_per_doc = pages_per_doc
+        self.pdf_workers = pdf_workers
+        self.background_encode = background_encode
+        self.card_workers = card_workers
+        self.parse_workers = parse_workers
+        self.encode_workers = encode_workers
+        self.clip_workers = clip_workers
+        self.pcm_cache = pcm_cache
+        self.pcm_cache_size = pcm_cache_size
+        self.seed = seed
         self.secret_key = secret_key
         self.max_tickets_per_user = max_tickets_per_user
         self.debug = debug
@@ -208,14 +259,21 @@ class Options(argparse.Namespace):
         filename = f'{self.game_id} Game Audio.mp3'
         return self.game_destination_dir() / filename
 
-    def bingo_tickets_output_name(self, page: int = 0) -> Path:
-        """Filename of document containing all Bingo tickets in a game"""
+    def bingo_tickets_output_name(self, page: int = 0, part: int = 0) -> Path:
+        """
+        Filename of document containing all Bingo tickets in a game.
+        If the tickets are split across multiple documents, "part" is the
+        number of the document (starting from 1).
+        """
         if self.doc_per_page:
             if self.cards_per_page == 1:
                 filename = f'{self.game_id} Bingo Ticket {page}.pdf'
             else:
                 filename = (f'{self.game_id} Bingo Tickets - ' +
                             f'({self.number_of_cards} Tickets) page {page}.pdf')
+        elif part > 0:
+            filename = (f'{self.game_id} Bingo Tickets - ' +
+                        f'({self.number_of_cards} Tickets) part {part}.pdf')
         else:
             filename = (f'{self.game_id} Bingo Tickets - ' +
                         f'({self.number_of_cards} Tickets).pdf')
@@ -368,6 +426,7 @@ class Options(argparse.Namespace):
             section = config['musicbingo']
         skip_items: Set[str] = set(self.EXTRA_OPTIONS_NAMES)
         skip_items.add('game_id')
+        skip_items.add('seed')
         skip_items.add('jsonfile')
         skip_items.add('tables')
         skip_items.add('title')
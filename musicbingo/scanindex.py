@@ -0,0 +1,272 @@
+"""
+Persistent index of the files found when searching for songs, used to
+only re-check directories and files that have changed since the
+previous search.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from .mp3.parser import MP3Parser
+from .song import Song
+
+# number of bytes read from each part of a file to create its digest
+DIGEST_BLOCK_SIZE = 4096
+
+
+def content_digest(filename: Path) -> str:
+    """
+    Create a digest of an MP3 file that is cheap to calculate, using
+    the size of the file, the start of the file (that contains the ID3
+    tags), the start of the audio frames and the end of the file.
+    The digest does not depend upon the name or location of the file.
+    """
+    sha = hashlib.sha256()
+    with filename.open('rb') as src:
+        audio_start = MP3Parser.skip_id3v2(src)
+        src.seek(0, 2)
+        size = src.tell()
+        sha.update(str(size).encode('ascii'))
+        for offset in [0, audio_start, size - DIGEST_BLOCK_SIZE]:
+            src.seek(max(0, offset))
+            sha.update(src.read(DIGEST_BLOCK_SIZE))
+    return sha.hexdigest()
+
+
+class FileEntry(NamedTuple):
+    """
+    Information about one MP3 file, used to detect when it has changed
+    """
+    size: int
+    mtime: int  # nanoseconds
+    inode: int
+    digest: str = ''  # from content_digest(), if known
+
+    def same_file(self, other: Optional["FileEntry"]) -> bool:
+        """
+        Check if other describes the same, unmodified, file
+        """
+        if other is None:
+            return False
+        return (self.size, self.mtime, self.inode) == (other.size, other.mtime, other.inode)
+
+
+class DirectoryEntry(NamedTuple):
+    """
+    Contents of one directory when it was last searched
+    """
+    mtime: int  # nanoseconds
+    files: Dict[str, FileEntry]
+    subdirectories: List[str]
+
+
+class ScanChanges:
+    """
+    The songs that have been added, changed or removed since the
+    previous search of a directory tree.
+    """
+
+    def __init__(self) -> None:
+        self.added: List[Song] = []
+        self.changed: List[Song] = []
+        self.removed: List[Path] = []
+        self.removed_directories: List[Path] = []
+        self._songs: Set[Song] = set()
+        self._lock = threading.Lock()
+
+    def add(self, song: Song, changed: bool) -> None:
+        """
+        Record a song that was parsed during the search
+        """
+        with self._lock:
+            self._songs.add(song)
+            if changed:
+                self.changed.append(song)
+            else:
+                self.added.append(song)
+
+    def remove(self, filenames: List[Path]) -> None:
+        """
+        Record songs that no longer exist
+        """
+        with self._lock:
+            self.removed += filenames
+
+    def remove_directory(self, directory: Path) -> None:
+        """
+        Record a directory that no longer exists
+        """
+        with self._lock:
+            self.removed_directories.append(directory)
+
+    def merge(self, other: "ScanChanges") -> None:
+        """
+        Add the changes from another search to this object
+        """
+        with self._lock:
+            self.added += other.added
+            self.changed += other.changed
+            self.removed += other.removed
+            self.removed_directories += other.removed_directories
+            self._songs.update(other._songs)
+
+    def __contains__(self, song: object) -> bool:
+        return song in self._songs
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def __repr__(self) -> str:
+        return (f'ScanChanges(added={len(self.added)}, changed={len(self.changed)}, ' +
+                f'removed={len(self.removed)})')
+
+
+class ScanIndex:
+    """
+    Stores the size, modification time and inode of every MP3 file and
+    the modification time of every directory from the previous search.
+    It also stores the metadata of every song, keyed by the content
+    digest of its file, so that a file that has been moved or renamed
+    does not need to be parsed again.
+
+    A directory whose modification time has not changed still contains
+    the same files and subdirectories, so it does not need to be listed
+    again. Note that modifying a file in place does not change the
+    modification time of its directory, so that change is only found
+    the next time that its directory is listed.
+    """
+
+    VERSION = 2
+    FILENAME = '.musicbingo-index.json'
+
+    def __init__(self, filename: Optional[Path] = None) -> None:
+        self.filename = filename
+        self.directories: Dict[str, DirectoryEntry] = {}
+        self.songs: Dict[str, Dict[str, Any]] = {}
+        self.log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filename: Path) -> "ScanIndex":
+        """
+        Load an index from a JSON file. If the file does not exist or
+        cannot be used, an empty index is returned.
+        """
+        index = ScanIndex(filename)
+        try:
+            with filename.open('rt', encoding='utf-8') as src:
+                contents = json.load(src)
+        except (IOError, ValueError) as err:
+            index.log.debug('Failed to load scan index %s: %s', filename, err)
+            return index
+        if contents.get('version') != cls.VERSION:
+            return index
+        for name, item in contents['directories'].items():
+            files = {fname: FileEntry(*value) for fname, value in item['files'].items()}
+            index.directories[name] = DirectoryEntry(
+                mtime=item['mtime'], files=files, subdirectories=item['subdirectories'])
+        index.songs = contents['songs']
+        return index
+
+    def save(self) -> None:
+        """
+        Write this index to its JSON file.
+        Songs whose digest does not match any file are not saved.
+        """
+        if self.filename is None:
+            return
+        with self._lock:
+            digests = {
+                entry.digest for item in self.directories.values()
+                for entry in item.files.values()}
+            songs = {
+                digest: mdata for digest, mdata in self.songs.items() if digest in digests}
+            directories = {
+                name: {
+                    'mtime': entry.mtime,
+                    'files': {fname: list(value) for fname, value in entry.files.items()},
+                    'subdirectories': entry.subdirectories,
+                } for name, entry in self.directories.items()}
+        try:
+            with self.filename.open('wt', encoding='utf-8') as dest:
+                json.dump({'version': self.VERSION, 'directories': directories,
+                           'songs': songs}, dest)
+        except IOError as err:
+            self.log.warning('Failed to save scan index %s: %s', self.filename, err)
+
+    def get(self, directory: Path) -> Optional[DirectoryEntry]:
+        """
+        Get the contents of a directory from the previous search
+        """
+        with self._lock:
+            return self.directories.get(str(directory))
+
+    def update(self, directory: Path, entry: DirectoryEntry) -> None:
+        """
+        Store the current contents of a directory
+        """
+        with self._lock:
+            self.directories[str(directory)] = entry
+
+    def invalidate(self, directory: Path) -> None:
+        """
+        Force a directory to be listed again by the next search, even
+        if its modification time has not changed. This is needed to find
+        files that have been modified in place.
+        """
+        with self._lock:
+            entry = self.directories.get(str(directory))
+            if entry is not None:
+                self.directories[str(directory)] = entry._replace(mtime=-1)
+
+    def digest(self, directory: Path, name: str) -> str:
+        """
+        Get the content digest of a file in a directory that has been
+        stored using update(). The digest is calculated if it is not
+        already known.
+        """
+        with self._lock:
+            entry = self.directories[str(directory)].files[name]
+        if entry.digest:
+            return entry.digest
+        digest = content_digest(directory / name)
+        with self._lock:
+            self.directories[str(directory)].files[name] = entry._replace(digest=digest)
+        return digest
+
+    def find_song(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the metadata of the song with the given content digest
+        """
+        with self._lock:
+            mdata = self.songs.get(digest)
+        if mdata is None:
+            return None
+        return dict(mdata)
+
+    def add_song(self, digest: str, song: Song) -> None:
+        """
+        Store the metadata of a song, using the content digest of its file
+        """
+        mdata = song.to_dict(exclude={'fullpath', 'ref_id', 'filename'})
+        mdata['duration'] = int(song.duration)
+        with self._lock:
+            self.songs[digest] = mdata
+
+    def remove_tree(self, directory: Path) -> List[Path]:
+        """
+        Remove a directory, and all of its subdirectories, from the index.
+        Returns the names of all the files that were in those directories.
+        """
+        with self._lock:
+            entry = self.directories.pop(str(directory), None)
+        if entry is None:
+            return []
+        removed = [directory / fname for fname in entry.files]
+        for subdir in entry.subdirectories:
+            removed += self.remove_tree(directory / subdir)
+        return removed
@@ -26,6 +26,7 @@ from musicbingo.palette import Palette
 from musicbingo.mp3 import MP3Factory
 from musicbingo.progress import Progress
 from musicbingo.song import Song
+from musicbingo.ticketkey import parse_fingerprint
 from musicbingo.track import Track
 
 from .decorators import (
@@ -83,14 +84,14 @@ class DownloadTicketView(MethodView):
         options.title = g.current_game.title  # type: ignore
         options.game_id = g.current_game.id  # type: ignore
         card = BingoTicket(columns=options.columns, palette=options.palette,
-                           fingerprint=g.current_ticket.fingerprint,
+                           fingerprint=parse_fingerprint(g.current_ticket.fingerprint),
                            number=g.current_ticket.number)
         for track in g.current_ticket.get_tracks(db_session):
             trk = track.song.to_dict(exclude={'pk', 'directory_pk', 'artist', 'album'})
             trk['artist'] = track.song.artist.name if track.song.artist is not None else ''
             trk['album'] = track.song.album.name if track.song.album is not None else ''
             song = Song(parent=None, ref_id=track.pk, **trk)
-            card.tracks.append(Track(prime=track.prime, song=song,
+            card.tracks.append(Track(number=track.number, song=song,
                                      start_time=track.start_time))
 
         with tempfile.TemporaryDirectory() as tmpdirname:
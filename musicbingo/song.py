@@ -2,9 +2,11 @@
 class to represent a song
 """
 from typing import (
-    cast, Any, AbstractSet, Dict, Iterable, Optional, Set, Tuple
+    cast, Any, AbstractSet, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 )
 
+from sqlalchemy import select
+
 from .hasparent import HasParent
 from .metadata import Metadata
 from .uuidmixin import UuidMixin
@@ -93,6 +95,48 @@ class Song(Metadata, HasParent, UuidMixin):
             session.flush()
         return cast(models.Song, db_song)
 
+    @staticmethod
+    def save_all(session, songs: Sequence[Tuple[int, "Song"]],
+                 changed: Optional[AbstractSet["Song"]] = None) -> int:
+        """
+        save many songs to database, using batched statements.
+        Each item in "songs" is the primary key of the database directory
+        that contains the song and the song. The artists and albums are
+        found (or added) using one query per table, and then the songs
+        that are not already in the database are inserted, using
+        (directory, filename) to find any existing songs. Existing songs
+        are only updated if they are in "changed".
+        Returns the number of songs that were added.
+        """
+        if not songs:
+            return 0
+        artists = models.Artist.get_or_create_names(
+            session, {song.artist for _, song in songs})
+        albums = models.Album.get_or_create_names(
+            session, {song.album for _, song in songs})
+        query = select(models.Song.pk, models.Song.directory_pk, models.Song.filename).where(
+            models.Song.directory_pk.in_({dir_pk for dir_pk, _ in songs}))
+        existing: Dict[Tuple[int, str], int] = {
+            (dir_pk, filename): pk for pk, dir_pk, filename in session.execute(query)}
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        for dir_pk, song in songs:
+            row = song.to_dict(exclude={'fullpath', 'ref_id', 'album', 'artist'})
+            row['duration'] = int(song.duration)
+            row['directory_pk'] = dir_pk
+            row['artist_pk'] = artists[song.artist]
+            row['album_pk'] = albums[song.album]
+            try:
+                row['pk'] = existing[(dir_pk, song.filename)]
+            except KeyError:
+                inserts.append(row)
+                continue
+            if changed is not None and song in changed:
+                updates.append(row)
+        models.Song.bulk_insert(session, inserts)
+        models.Song.bulk_update(session, updates)
+        return len(inserts)
+
     @staticmethod
     def clean(text: str) -> str:
         """remove all non-ascii characters from a string"""
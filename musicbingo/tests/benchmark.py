@@ -0,0 +1,272 @@
+"""
+Reproducible benchmark of Bingo game generation.
+
+Measures the time taken by the main phases of GameGenerator (track
+order and MP3 generation, card generation, database persistence and
+PDF rendering) across a matrix of song counts, ticket grid sizes and
+number of tickets. A seeded random number generator is used so that
+each run generates exactly the same games.
+
+Start using
+
+python3 -m musicbingo.tests.benchmark --output results.json
+
+The results of a previous run can be compared with the current run
+using the --compare argument.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+from pathlib import Path
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from musicbingo import models
+from musicbingo.bingoticket import BingoTicket
+from musicbingo.directory import Directory
+from musicbingo.docgen import documentgenerator as DG
+from musicbingo.docgen.factory import DocumentFactory
+from musicbingo.generator import GameGenerator
+from musicbingo.options import DatabaseOptions, Options
+from musicbingo.progress import Progress
+from musicbingo.song import Song
+from musicbingo.track import Track
+
+from .mock_docgen import MockDocumentGenerator
+from .mock_editor import MockMP3Editor
+
+PHASES = ['mp3', 'cards', 'database', 'pdf']
+
+
+def synthetic_songs(parent: Optional[Directory], num_songs: int) -> List[Song]:
+    """
+    Create a list of songs, each with a unique title and filename
+    """
+    songs: List[Song] = []
+    for index in range(num_songs):
+        songs.append(
+            Song(f'{index + 1:03d} Song {index + 1}.mp3', parent=parent,
+                 ref_id=(index + 1), title=f'Song {index + 1}',
+                 artist=f'Artist {index % 37}', album='Benchmark',
+                 duration=30000, bitrate=256, sample_rate=44100,
+                 sample_width=16, channels=2))
+    return songs
+
+
+class GameBenchmark:
+    """
+    Runs GameGenerator using the mock MP3 editor and a seeded random
+    number generator, recording the time taken by each phase.
+    """
+
+    def __init__(self, tmpdir: Path, seed: int, repeats: int,
+                 docgen_name: Optional[str] = None) -> None:
+        self.tmpdir = tmpdir
+        self.seed = seed
+        self.repeats = repeats
+        self.docgen_name = docgen_name
+        self.log = logging.getLogger('benchmark')
+
+    def create_songs(self, num_songs: int) -> List[Song]:
+        """
+        Create a directory of synthetic songs and save it to the database
+        """
+        clips = Directory(None, self.tmpdir / 'Clips')
+        directory = Directory(clips, clips._fullpath / 'Benchmark')
+        directory.title = 'Benchmark'
+        directory.songs = synthetic_songs(directory, num_songs)
+        with models.db.session_scope() as session:
+            clips.save(session)
+            db_dir = directory.save(session, flush=True)
+            Song.save_all(session, [(db_dir.pk, song) for song in directory.songs])
+        return directory.songs
+
+    def create_docgen(self) -> DG.DocumentGenerator:
+        """
+        Create the document generator used for rendering tickets
+        """
+        if self.docgen_name is None:
+            return MockDocumentGenerator()
+        return DocumentFactory.create_generator(self.docgen_name)
+
+    def run_game(self, options: Options, songs: List[Song]) -> Dict[str, float]:
+        """
+        Generate one game, returning the time taken by each phase
+        """
+        timings: Dict[str, float] = {}
+        progress = Progress()
+        progress.num_phases = 4
+        gen = GameGenerator(options, MockMP3Editor(), self.create_docgen(),
+                            progress, rng=random.Random(self.seed))
+        dest_directory = options.game_destination_dir()
+        if not dest_directory.exists():
+            dest_directory.mkdir(parents=True)
+
+        def timed(name: str, func: Callable):
+            start = time.perf_counter()
+            result = func()
+            timings[name] = time.perf_counter() - start
+            return result
+
+        tracks = timed('mp3', lambda: gen.generate_mp3(songs))
+        cards = timed('cards', lambda: gen.generate_all_cards(tracks))
+
+        def save_game() -> None:
+            with models.db.session_scope() as session:
+                game = models.Game(id=options.game_id, title=options.title,
+                                   start=datetime.datetime.now(),
+                                   end=datetime.datetime.now(), options={})
+                session.add(game)
+                db_tracks = Track.save_all(session, game, tracks)
+                BingoTicket.save_all(session, game, cards, db_tracks)
+
+        timed('database', save_game)
+        timed('pdf', lambda: gen.generate_tickets_pdf(cards))
+        return timings
+
+    def run_case(self, num_songs: int, columns: int, rows: int,
+                 number_of_cards: int) -> Dict:
+        """
+        Run one entry of the benchmark matrix, using a new database
+        """
+        options = Options(
+            games_dest=str(self.tmpdir / 'games'),
+            game_id=f'bench-{num_songs}-{columns}x{rows}-{number_of_cards}',
+            title='Benchmark', columns=columns, rows=rows,
+            number_of_cards=number_of_cards, crossfade=0, seed=self.seed,
+            database=DatabaseOptions(database_provider='sqlite',
+                                     database_name=':memory:'))
+        samples: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        for _ in range(self.repeats):
+            models.db.DatabaseConnection.bind(options.database, create_tables=True)
+            try:
+                songs = self.create_songs(num_songs)
+                for phase, value in self.run_game(options, songs).items():
+                    samples[phase].append(value)
+            finally:
+                models.db.DatabaseConnection.close()
+        result: Dict = {
+            'songs': num_songs,
+            'columns': columns,
+            'rows': rows,
+            'number_of_cards': number_of_cards,
+            'phases': {},
+        }
+        for phase, values in samples.items():
+            result['phases'][phase] = {
+                'min': min(values),
+                'median': statistics.median(values),
+                'max': max(values),
+            }
+        return result
+
+    def run(self, song_counts: Sequence[int], grids: Sequence[str],
+            card_counts: Sequence[int]) -> List[Dict]:
+        """
+        Run every entry of the benchmark matrix that is a valid game
+        """
+        results: List[Dict] = []
+        for grid in grids:
+            columns, rows = [int(v) for v in grid.lower().split('x')]
+            for num_songs in song_counts:
+                for number_of_cards in card_counts:
+                    opts = Options(columns=columns, rows=rows, game_id='check',
+                                   number_of_cards=number_of_cards)
+                    try:
+                        GameGenerator.check_options(opts, synthetic_songs(None, num_songs))
+                    except ValueError as err:
+                        self.log.warning('Skipping %d songs %s %d tickets: %s',
+                                         num_songs, grid, number_of_cards, err)
+                        continue
+                    self.log.info('%d songs %s %d tickets', num_songs, grid,
+                                  number_of_cards)
+                    results.append(self.run_case(num_songs, columns, rows,
+                                                 number_of_cards))
+        return results
+
+
+def case_name(case: Dict) -> str:
+    """
+    Name used to match benchmark cases between two runs
+    """
+    return f'{case["songs"]}/{case["columns"]}x{case["rows"]}/{case["number_of_cards"]}'
+
+
+def compare_results(previous: Dict, current: Dict) -> None:
+    """
+    Print the change in median time of each phase between two runs
+    """
+    before = {case_name(case): case for case in previous['results']}
+    for case in current['results']:
+        name = case_name(case)
+        if name not in before:
+            continue
+        line = [f'{name:>16}']
+        for phase in PHASES:
+            old = before[name]['phases'][phase]['median']
+            new = case['phases'][phase]['median']
+            if old > 0:
+                line.append(f'{phase}: {100.0 * (new - old) / old:+6.1f}%')
+        print('  '.join(line))
+
+
+def main(args: Sequence[str]) -> int:
+    """
+    Entry point for running the benchmark
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark of Bingo game generation')
+    parser.add_argument('--songs', nargs='+', type=int, default=[40, 100, 250],
+                        help='Number of songs in each game')
+    parser.add_argument('--grids', nargs='+', default=['5x3', '4x4'],
+                        help='Ticket grid sizes (columns x rows)')
+    parser.add_argument('--cards', nargs='+', type=int, default=[24, 100, 400],
+                        help='Number of tickets in each game')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of times to run each benchmark')
+    parser.add_argument('--seed', type=int, default=1234,
+                        help='Random number seed')
+    parser.add_argument('--pdf', action='store_true',
+                        help='Render PDF files, rather than using mock document generator')
+    parser.add_argument('--output', help='Filename for JSON results')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    opts = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    tmpdir = Path(tempfile.mkdtemp())
+    try:
+        bench = GameBenchmark(tmpdir, seed=opts.seed, repeats=opts.repeats,
+                              docgen_name=('pdf' if opts.pdf else None))
+        results = bench.run(opts.songs, opts.grids, opts.cards)
+    finally:
+        shutil.rmtree(str(tmpdir), ignore_errors=True)
+    report = {
+        'created': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': opts.seed,
+        'repeats': opts.repeats,
+        'pdf': opts.pdf,
+        'results': results,
+    }
+    if opts.output:
+        with open(opts.output, 'wt', encoding='utf-8') as dest:
+            json.dump(report, dest, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print('')
+    if opts.compare:
+        with open(opts.compare, 'rt', encoding='utf-8') as src:
+            compare_results(json.load(src), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,252 @@
+"""
+Unit tests for encoding an MP3 file in parallel chunks
+"""
+import math
+from pathlib import Path
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from typing import List, Optional
+import unittest
+
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.chunks import (
+    ENCODER_DELAY, MARGIN, MIN_CHUNK_DURATION, PREROLL_FRAMES, SAMPLES_PER_FRAME,
+    file_positions, plan_chunks
+)
+from musicbingo.mp3.ffmpegeditor import FfmpegEditor, ProgressUDPServer
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.headerparser import HeaderParser
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.progress import Progress
+from musicbingo.tests.mixin import TestCaseMixin
+
+from .test_framecopy import FRAME_HEADER, FRAME_LENGTH
+
+
+class ChunkEditor(FfmpegEditor):
+    """
+    FfmpegEditor that creates a fake MP3 file instead of running ffmpeg.
+    Every frame of the file for a chunk is filled with the chunk number.
+    """
+
+    commands: List[List[str]] = []
+
+    @classmethod
+    def run_commands_with_progress(cls, commands: List[List[str]], progress: Progress,
+                                   duration: int) -> List[Optional[int]]:
+        cls.commands = commands
+        for index, args in enumerate(commands):
+            # ffmpeg adds the encoder delay, and pads the last frame
+            num_frames = int(math.ceil(
+                (cls.input_duration(args) * 44.1 + ENCODER_DELAY) / SAMPLES_PER_FRAME))
+            with open(args[-1], 'wb') as dest:
+                for _ in range(num_frames):
+                    dest.write(FRAME_HEADER + bytes([index]) * (FRAME_LENGTH - 4))
+        return [0] * len(commands)
+
+    @staticmethod
+    def input_duration(args: List[str]) -> float:
+        """
+        The duration (in milliseconds) of the inputs to an ffmpeg command,
+        ignoring any cross-fades
+        """
+        duration = 0.0
+        for pos, arg in enumerate(args):
+            if arg == '-t':
+                duration += 1000.0 * float(args[pos + 1])
+        return duration
+
+
+class TestChunks(TestCaseMixin, unittest.TestCase):
+    """tests of encoding an MP3 file in parallel chunks"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.metadata = Metadata(title='Game', artist='', album='',
+                                 duration=Duration(0), sample_width=16, channels=2,
+                                 sample_rate=44100, bitrate=256)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def game_files(self, num_songs: int, overlap: int) -> List[MP3File]:
+        """
+        Create the input files of a game, with a transition between
+        each song
+        """
+        # an end that is not the full duration of the file makes ffmpeg
+        # use the "-t" option for every input
+        transition = MP3File(self.tmpdir / 'transition.mp3', FileMode.READ_ONLY,
+                             start=0, end=1000, metadata=self.metadata)
+        files: List[MP3File] = []
+        for index in range(num_songs):
+            if index > 0:
+                files.append(transition.overlap_with_previous(Duration(overlap)))
+            song = MP3File(self.tmpdir / f'song-{index}.mp3', FileMode.READ_ONLY,
+                           start=index * 100, end=30000, metadata=self.metadata)
+            files.append(song.overlap_with_previous(Duration(overlap)))
+        files[0].overlap = 0
+        return files
+
+    def test_plan_chunks(self) -> None:
+        """
+        Check splitting a game into chunks
+        """
+        files = self.game_files(20, 500)
+        total = sum(int(mp3file.duration) for mp3file in files)
+        chunks = plan_chunks(files, 44100, 4)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0].first_frame, 0)
+        self.assertIsNone(chunks[-1].last_frame)
+        self.assertEqual(chunks[0].files[0].start, files[0].start)
+        self.assertEqual(chunks[-1].files[-1].end, files[-1].end)
+        for chunk in chunks:
+            self.assertAlmostEqual(chunk.duration, total // 4, delta=16000)
+        for before, after in zip(chunks, chunks[1:]):
+            # each chunk is cut within a song, away from any cross-fade
+            last = before.files[-1]
+            first = after.files[0]
+            self.assertEqual(last.filename, first.filename)
+            self.assertTrue(first.filename.name.startswith('song-'))
+            self.assertEqual(first.overlap, 0)
+            self.assertGreater(first.start, last.start + MARGIN)
+            self.assertLess(last.end, 30000 - MARGIN)
+            self.assertEqual(after.first_frame, PREROLL_FRAMES)
+            # the chunks overlap by the pre-roll and post-roll
+            preroll = (PREROLL_FRAMES * SAMPLES_PER_FRAME - ENCODER_DELAY) / 44.1
+            self.assertAlmostEqual(last.end - first.start, preroll + 100, delta=15)
+        # only whole chunks of at least a minute are used
+        self.assertEqual(len(plan_chunks(files, 44100, 64)), total // MIN_CHUNK_DURATION)
+        self.assertEqual(len(plan_chunks(self.game_files(2, 500), 44100, 4)), 1)
+
+    def test_cuts_are_aligned(self) -> None:
+        """
+        Check that the frames either side of each join contain
+        consecutive audio
+        """
+        files = self.game_files(20, 0)
+        positions = file_positions(files)
+        chunks = plan_chunks(files, 44100, 3)
+        self.assertEqual(len(chunks), 3)
+        # position (in samples) of the start of each chunk in the output
+        starts = [0.0]
+        for chunk in chunks[1:]:
+            first = chunk.files[0]
+            index = next(idx for idx, mp3file in enumerate(files)
+                         if mp3file.filename == first.filename)
+            starts.append((positions[index] + first.start - files[index].start) * 44.1)
+        for index, chunk in enumerate(chunks[:-1]):
+            assert chunk.last_frame is not None
+            join = starts[index] + chunk.last_frame * SAMPLES_PER_FRAME - ENCODER_DELAY
+            next_start = (starts[index + 1] + chunks[index + 1].first_frame *
+                          SAMPLES_PER_FRAME - ENCODER_DELAY)
+            # start of a chunk is rounded to the nearest millisecond
+            self.assertAlmostEqual(join, next_start, delta=22.05)
+
+    def test_encode_chunks(self) -> None:
+        """
+        Check that the encoded chunks are joined into one file
+        """
+        editor = ChunkEditor()
+        editor.encode_workers = 3
+        files = self.game_files(10, 500)
+        chunks = plan_chunks(files, 44100, 3)
+        filename = self.tmpdir / 'game.mp3'
+        with editor.create(filename, self.metadata) as output:
+            for mp3file in files:
+                output.append(mp3file)
+        self.assertEqual(len(editor.commands), 3)
+        for args in editor.commands:
+            self.assertIn('-reservoir', args)
+        with filename.open('rb') as src:
+            parser = HeaderParser()
+            src.seek(parser.skip_id3v2(src))
+            data = src.read()
+        chunk_ids = [data[pos + 4] for pos in range(FRAME_LENGTH, len(data), FRAME_LENGTH)]
+        counts = [chunk_ids.count(index) for index in range(3)]
+        assert chunks[0].last_frame is not None
+        assert chunks[1].last_frame is not None
+        self.assertEqual(counts[0], chunks[0].last_frame)
+        self.assertEqual(counts[1], chunks[1].last_frame - PREROLL_FRAMES)
+        self.assertEqual(chunk_ids, sorted(chunk_ids))
+        self.assertEqual(list(self.tmpdir.glob('.encode-*')), [])
+
+    def test_normalised_game(self) -> None:
+        """
+        Check that only fixed gains are used when encoding in chunks
+        """
+        editor = ChunkEditor()
+        editor.encode_workers = 3
+        files = [mp3file.amplify(-2.0) for mp3file in self.game_files(10, 500)]
+        filename = self.tmpdir / 'game.mp3'
+        with editor.create(filename, self.metadata) as output:
+            for mp3file in files:
+                output.append(mp3file)
+        self.assertEqual(len(editor.commands), 3)
+        for args in editor.commands:
+            filters = args[args.index('-filter_complex') + 1]
+            self.assertIn('volume=-2.00dB', filters)
+            self.assertNotIn('dynaudnorm', filters)
+            self.assertNotIn('loudnorm', ' '.join(args))
+        # normalising the whole game needs one process
+        ChunkEditor.commands = []
+        with editor.create(filename, self.metadata) as output:
+            for mp3file in self.game_files(10, 500):
+                output.append(mp3file)
+            output.normalize(1)
+        self.assertEqual(len(editor.commands), 1)
+        self.assertNotIn('-reservoir', editor.commands[0])
+
+    def test_chunk_starts_exactly(self) -> None:
+        """
+        Check that a chunk with a lot of files does not use the concat
+        demuxer to start part way through its first file
+        """
+        editor = FfmpegEditor()
+        files = self.game_files(60, 0)
+        chunks = plan_chunks(files, 44100, 3)
+        self.assertEqual(len(chunks), 3)
+        for chunk in chunks[1:]:
+            self.assertGreater(len(chunk.files), FfmpegEditor.MAX_INPUTS)
+            self.assertGreater(chunk.files[0].start, 0)
+            args = editor.build_encode_args(chunk.files, self.metadata, None,
+                                            self.tmpdir / 'chunk.mp3', tmpdir=self.tmpdir)
+            self.assertEqual(args.index('-ss'), args.index('-i') - 4)
+            self.assertEqual(args[args.index('-i') + 1], str(chunk.files[0].filename))
+            self.assertEqual(args[args.index('-filter_complex') + 1],
+                             '[0:a][1:a]concat=n=2:v=0:a=1[outa]')
+            script = Path(args[args.index('concat') + 4])
+            with script.open('rt', encoding='utf-8') as src:
+                lines = src.read().splitlines()
+            self.assertNotIn(chunk.files[0].filename.name, lines[1])
+
+    def test_progress_server(self) -> None:
+        """
+        Check that progress from every ffmpeg process is combined
+        """
+        progress = Progress()
+        server = ProgressUDPServer(('localhost', 0), progress, 4000)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for pos in [1000, 2000]:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.sendto(f'frame=1\nout_time_us={pos * 1000}\n'.encode('ascii'),
+                                server.server_address)
+            for _ in range(50):
+                if progress.pct >= 75.0:
+                    break
+                time.sleep(0.01)
+            self.assertAlmostEqual(progress.pct, 75.0)
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
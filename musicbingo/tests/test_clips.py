@@ -0,0 +1,180 @@
+"""
+Unit tests for creating clips from songs
+"""
+import contextlib
+import io
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List
+import unittest
+
+from musicbingo.clips import ClipGenerator
+from musicbingo.directory import Directory
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.editor import MP3FileWriter
+from musicbingo.mp3.mockeditor import MockEditor
+from musicbingo.options import Options
+from musicbingo.progress import Progress
+from musicbingo.song import Song
+from musicbingo.tests.mixin import TestCaseMixin
+from musicbingo.tests.mock_parser import MockMP3Parser
+
+
+class SlowEditor(MockEditor):
+    """
+    Mock editor that takes a different amount of time to create each
+    clip, and records how many clips are created at the same time
+    """
+
+    def __init__(self) -> None:
+        self.created: List[str] = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def _generate(self, destination: MP3FileWriter, progress: Progress) -> None:
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            delay = 0.01 * (len(destination.filename.name) % 4)
+            for pct in [25.0, 50.0, 75.0]:
+                time.sleep(delay)
+                progress.pct = pct
+            with destination.filename.open('wb') as dest:
+                dest.write(b'clip')
+            with self.lock:
+                self.created.append(destination.filename.name)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class RecordingProgress(Progress):
+    """
+    Progress that records every change of percentage
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.history: List[float] = []
+
+    def on_change_phase_percent(self, pct: float) -> None:
+        self.history.append(pct)
+
+
+class TestClipGenerator(TestCaseMixin, unittest.TestCase):
+    """tests of the ClipGenerator class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.options = Options(new_clips_dest=str(self.tmpdir / 'NewClips'),
+                               clip_start='00:10', clip_duration=20, clip_workers=3)
+        self.clips = Directory(None, self.tmpdir / 'Clips')
+        self.album = Directory(self.clips, self.tmpdir / 'Clips' / 'Album')
+        self.testcases: Dict[str, Metadata] = {}
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def create_songs(self, count: int) -> List[Song]:
+        """
+        Create songs that are each 2 minutes long
+        """
+        songs: List[Song] = []
+        for index in range(count):
+            songs.append(Song(f'song{index:02d}{"x" * index}.mp3', parent=self.album,
+                              title=f'Song {index}', artist='Artist',
+                              album='Album', duration=Duration(120000), sample_width=16,
+                              channels=2, sample_rate=44100, bitrate=256))
+        return songs
+
+    def test_generate(self) -> None:
+        """
+        Check creating clips in parallel
+        """
+        songs = self.create_songs(10)
+        # a song that is too short to create a clip
+        songs[4].duration = Duration(5000)
+        editor = SlowEditor()
+        progress = RecordingProgress()
+        gen = ClipGenerator(self.options, editor, progress, MockMP3Parser(self.testcases))
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            with contextlib.redirect_stderr(io.StringIO()):
+                clips = gen.generate(songs)
+        self.assertIn('Error generating clip: Song 4', out.getvalue())
+        dest = self.tmpdir / 'NewClips' / 'Album'
+        expected = [dest / song.filename for song in songs if song != songs[4]]
+        self.assertEqual(clips, expected)
+        self.assertEqual(sorted(editor.created), sorted(path.name for path in expected))
+        self.assertGreater(editor.max_active, 1)
+        self.assertLessEqual(editor.max_active, 3)
+        self.assertEqual(progress.pct, 100.0)
+        self.assertEqual(progress.history, sorted(progress.history))
+        self.assertEqual(progress.text, 'Finished generating 10 clips')
+        self.assertEqual(gen.jobs, {})
+
+    def test_one_at_a_time(self) -> None:
+        """
+        Check creating one clip at a time
+        """
+        self.options.clip_workers = 0
+        songs = self.create_songs(4)
+        editor = SlowEditor()
+        gen = ClipGenerator(self.options, editor, Progress(), MockMP3Parser(self.testcases))
+        clips = gen.generate(songs)
+        self.assertEqual([clip.name for clip in clips], [song.filename for song in songs])
+        self.assertEqual(editor.max_active, 1)
+
+    def test_skip_existing(self) -> None:
+        """
+        Check that clips that already exist are not created again
+        """
+        songs = self.create_songs(3)
+        dest = self.tmpdir / 'NewClips' / 'Album'
+        dest.mkdir(parents=True)
+        for song in songs:
+            with (dest / song.filename).open('wb') as out:
+                out.write(b'old clip')
+        # existing clip with matching metadata
+        self.testcases[songs[0].filename] = Metadata(
+            title='Song 0', artist='Artist', album='Album', duration=Duration(20026),
+            sample_width=16, channels=2, sample_rate=44100, bitrate=256)
+        # existing clip with the wrong duration
+        self.testcases[songs[1].filename] = Metadata(
+            title='Song 1', artist='Artist', album='Album', duration=Duration(30000),
+            sample_width=16, channels=2, sample_rate=44100, bitrate=256)
+        # songs[2] cannot be parsed
+        editor = SlowEditor()
+        gen = ClipGenerator(self.options, editor, Progress(), MockMP3Parser(self.testcases))
+        clips = gen.generate(songs)
+        self.assertEqual(clips, [dest / song.filename for song in songs])
+        self.assertEqual(sorted(editor.created), [songs[1].filename, songs[2].filename])
+
+    def test_abort(self) -> None:
+        """
+        Check that clips that have not started are not created after
+        generation is aborted
+        """
+        songs = self.create_songs(20)
+        editor = SlowEditor()
+        progress = Progress()
+        gen = ClipGenerator(self.options, editor, progress, MockMP3Parser(self.testcases))
+        original = gen.update_progress
+
+        def update_progress(index: int, pct: float) -> None:
+            progress.abort = True
+            original(index, pct)
+
+        gen.update_progress = update_progress  # type: ignore
+        clips = gen.generate(songs)
+        self.assertLess(len(clips), 20)
+        self.assertLessEqual(len(editor.created), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,383 @@
+"""
+Unit tests for searching directories of songs
+"""
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Dict, List, Optional, cast
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from musicbingo import models
+from musicbingo.directory import Directory
+from musicbingo.metadata import Metadata
+from musicbingo.options import DatabaseOptions
+from musicbingo.progress import Progress
+from musicbingo.scanindex import ScanChanges, ScanIndex
+from musicbingo.tests.mixin import TestCaseMixin
+from musicbingo.tests.mock_parser import MockMP3Parser
+
+
+class CountingParser(MockMP3Parser):
+    """
+    Mock MP3 parser that records the name of each file that is parsed
+    """
+
+    def __init__(self, testcases: Dict[str, Metadata]) -> None:
+        super().__init__(testcases)
+        self.parsed: List[str] = []
+
+    def parse(self, filename: Path) -> Metadata:
+        self.parsed.append(filename.name)
+        return super().parse(filename)
+
+
+def create_mp3(testcases: Dict[str, Metadata], filename: Path, title: str,
+               size: int = 100) -> None:
+    """
+    Create a fake MP3 file and add the metadata the mock parser returns
+    for that file to testcases
+    """
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with filename.open('wb') as dest:
+        # each file needs different contents, to give it a unique digest
+        data = title.encode('utf-8')
+        dest.write(data + bytes(size - len(data)))
+    # parsers return the duration in milliseconds
+    metadata = {
+        'title': title,
+        'artist': 'Artist',
+        'album': filename.parent.name,
+        'duration': 30000,
+        'sample_width': 16,
+        'channels': 2,
+        'sample_rate': 44100,
+        'bitrate': 256,
+    }
+    testcases[filename.name] = Metadata(**metadata)  # type: ignore
+
+
+class TestDirectory(TestCaseMixin, unittest.TestCase):
+    """tests of the Directory class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        # a file based database is used, as an in-memory database
+        # is not used by Directory.search()
+        models.db.DatabaseConnection.bind(
+            DatabaseOptions(database_provider='sqlite',
+                            database_name=str(self.tmpdir / 'bingo.db3')),
+            create_tables=True)
+        self.clips = self.tmpdir / 'Clips'
+        self.testcases: Dict[str, Metadata] = {}
+        self.create_mp3(self.clips / 'Fifties' / 'one.mp3', 'One')
+        self.create_mp3(self.clips / 'Fifties' / 'two.mp3', 'Two')
+        self.create_mp3(self.clips / 'Sixties' / 'three.mp3', 'Three')
+
+    def tearDown(self) -> None:
+        models.db.DatabaseConnection.close()
+        shutil.rmtree(self.tmpdir)
+
+    def create_mp3(self, filename: Path, title: str, size: int = 100) -> None:
+        """
+        Create a fake MP3 file and the metadata the mock parser returns
+        """
+        create_mp3(self.testcases, filename, title, size)
+
+    @staticmethod
+    def touch_directory(directory: Path, offset: int) -> None:
+        """
+        Change the modification time of a directory, as the file system
+        might not have a fine enough resolution to see the change.
+        """
+        mtime = os.stat(directory).st_mtime_ns + offset * 1000000000
+        os.utime(directory, ns=(mtime, mtime))
+
+    def search(self, parser: CountingParser) -> ScanChanges:
+        """
+        Search the clips directory and save the changes to the database
+        """
+        index = ScanIndex.load(self.clips / ScanIndex.FILENAME)
+        clips = Directory(None, self.clips)
+        changes = clips.search(parser, Progress(), index)
+        with models.db.session_scope() as session:
+            clips.save_all(session, changes)
+        return changes
+
+    def test_incremental_search(self) -> None:
+        """
+        Check that only changed files are parsed when searching a
+        directory again
+        """
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(len(changes.added), 3)
+        self.assertEqual(len(changes.changed), 0)
+        self.assertEqual(len(changes.removed), 0)
+        self.assertEqual(sorted(parser.parsed), ['one.mp3', 'three.mp3', 'two.mp3'])
+        self.assertTrue((self.clips / ScanIndex.FILENAME).exists())
+
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(len(changes), 0)
+        self.assertEqual(parser.parsed, [])
+
+        self.create_mp3(self.clips / 'Fifties' / 'four.mp3', 'Four')
+        self.create_mp3(self.clips / 'Fifties' / 'two.mp3', 'Two Again', size=200)
+        (self.clips / 'Sixties' / 'three.mp3').unlink()
+        self.touch_directory(self.clips / 'Fifties', 1)
+        self.touch_directory(self.clips / 'Sixties', 1)
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(sorted(parser.parsed), ['four.mp3', 'two.mp3'])
+        self.assertEqual([song.filename for song in changes.added], ['four.mp3'])
+        self.assertEqual([song.filename for song in changes.changed], ['two.mp3'])
+        self.assertEqual(changes.removed, [self.clips / 'Sixties' / 'three.mp3'])
+        with models.db.session_scope() as session:
+            titles = sorted(song.title for song in models.Song.search(session))
+        self.assertEqual(titles, ['Four', 'One', 'Two Again'])
+
+    def test_cache_without_index(self) -> None:
+        """
+        Check that songs loaded from the cache are reported as new
+        when the scan index does not contain them
+        """
+        clips = Directory(None, self.clips)
+        clips.search(MockMP3Parser(self.testcases), Progress())
+        with models.db.session_scope() as session:
+            clips.save_all(session)
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(sorted(song.filename for song in changes.added),
+                         ['one.mp3', 'three.mp3', 'two.mp3'])
+        self.assertEqual(changes.changed, [])
+        changes = self.search(CountingParser(self.testcases))
+        self.assertEqual(len(changes), 0)
+
+    def test_removed_directory(self) -> None:
+        """
+        Check that the songs of a directory that has been deleted are
+        reported as removed
+        """
+        self.search(CountingParser(self.testcases))
+        shutil.rmtree(self.clips / 'Sixties')
+        self.touch_directory(self.clips, 1)
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(changes.removed, [self.clips / 'Sixties' / 'three.mp3'])
+        with models.db.session_scope() as session:
+            self.assertEqual(models.Song.total_items(session), 2)
+
+    def test_moved_files(self) -> None:
+        """
+        Check that files that have been moved or renamed are found using
+        their content digest, rather than being parsed again
+        """
+        self.search(CountingParser(self.testcases))
+        moved = self.clips / 'Moved'
+        moved.mkdir()
+        (self.clips / 'Sixties' / 'three.mp3').rename(moved / 'renamed.mp3')
+        (self.clips / 'Fifties' / 'one.mp3').rename(moved / 'one.mp3')
+        self.touch_directory(self.clips, 1)
+        self.touch_directory(self.clips / 'Fifties', 1)
+        self.touch_directory(self.clips / 'Sixties', 1)
+        parser = CountingParser(self.testcases)
+        changes = self.search(parser)
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(sorted(song.filename for song in changes.added),
+                         ['one.mp3', 'renamed.mp3'])
+        self.assertEqual(sorted(changes.removed), [
+            self.clips / 'Fifties' / 'one.mp3', self.clips / 'Sixties' / 'three.mp3'])
+        with models.db.session_scope() as session:
+            self.assertEqual(models.Song.total_items(session), 3)
+            song = cast(Optional[models.Song],
+                        models.Song.get(session, filename='renamed.mp3'))
+            assert song is not None
+            self.assertEqual(song.title, 'Three')
+            self.assertEqual(song.directory.title, 'Moved')
+        index = ScanIndex.load(self.clips / ScanIndex.FILENAME)
+        self.assertEqual(len(index.songs), 3)
+
+    def test_song_cache_query(self) -> None:
+        """
+        Check that the songs for the whole tree are loaded from the
+        database using one query, rather than one per directory
+        """
+        for decade in ['Seventies', 'Eighties', 'Nineties']:
+            for idx in range(3):
+                self.create_mp3(self.clips / decade / f'{decade}-{idx}.mp3', f'{decade} {idx}')
+        clips = Directory(None, self.clips)
+        clips.search(CountingParser(self.testcases), Progress())
+        with models.db.session_scope() as session:
+            clips.save_all(session)
+        statements: List[str] = []
+
+        def record_statement(conn, cursor, statement, *args):
+            # pylint: disable=unused-argument
+            statements.append(statement)
+
+        parser = CountingParser(self.testcases)
+        clips = Directory(None, self.clips)
+        event.listen(Engine, 'before_cursor_execute', record_statement)
+        try:
+            clips.search(parser, Progress())
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record_statement)
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(clips.total_length(), 12)
+        self.assertEqual(len(statements), 1)
+        with models.db.session_scope() as session:
+            self.assertEqual(models.Song.total_items(session), 12)
+        song = clips.subdirectories[0].songs[0]
+        self.assertEqual(song.artist, 'Artist')
+        self.assertEqual(song.album, clips.subdirectories[0].filename)
+
+    def test_song_cache_symlink(self) -> None:
+        """
+        Check that the songs of a symbolic link to a directory outside of
+        the clips directory are loaded from the database
+        """
+        elsewhere = self.tmpdir / 'Elsewhere'
+        self.create_mp3(elsewhere / 'four.mp3', 'Four')
+        self.create_mp3(elsewhere / 'five.mp3', 'Five')
+        (self.clips / 'Linked').symlink_to(elsewhere, target_is_directory=True)
+        clips = Directory(None, self.clips)
+        clips.search(CountingParser(self.testcases), Progress())
+        with models.db.session_scope() as session:
+            clips.save_all(session)
+        statements: List[str] = []
+
+        def record_statement(conn, cursor, statement, *args):
+            # pylint: disable=unused-argument
+            statements.append(statement)
+
+        parser = CountingParser(self.testcases)
+        clips = Directory(None, self.clips)
+        event.listen(Engine, 'before_cursor_execute', record_statement)
+        try:
+            clips.search(parser, Progress())
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record_statement)
+        self.assertEqual(parser.parsed, [])
+        self.assertEqual(clips.total_length(), 5)
+        # one query for the clips directory, one for the linked directory
+        self.assertEqual(len(statements), 2)
+
+    def test_save_all_statements(self) -> None:
+        """
+        Check that songs, artists and albums are saved using batched
+        statements, rather than one or more statements per song
+        """
+        for decade in ['Seventies', 'Eighties', 'Nineties']:
+            for idx in range(4):
+                self.create_mp3(self.clips / decade / f'{decade}-{idx}.mp3', f'{decade} {idx}')
+        clips = Directory(None, self.clips)
+        clips.search(MockMP3Parser(self.testcases), Progress())
+        statements: List[str] = []
+
+        def record_statement(conn, cursor, statement, *args):
+            # pylint: disable=unused-argument
+            statements.append(statement)
+
+        for _ in range(2):
+            # the second save finds the existing songs and does not modify them
+            statements.clear()
+            event.listen(Engine, 'before_cursor_execute', record_statement)
+            try:
+                with models.db.session_scope() as session:
+                    clips.save_all(session)
+            finally:
+                event.remove(Engine, 'before_cursor_execute', record_statement)
+            for table in ['"Song"', '"Artist"', '"Album"']:
+                queries = [stmt for stmt in statements if table in stmt]
+                self.assertLess(len(queries), 4, table)
+            updates = [stmt for stmt in statements if stmt.startswith('UPDATE "Song"')]
+            self.assertEqual(updates, [])
+        with models.db.session_scope() as session:
+            self.assertEqual(models.Song.total_items(session), 15)
+            self.assertEqual(models.Artist.total_items(session), 1)
+            self.assertEqual(models.Album.total_items(session), 5)
+            song = cast(Optional[models.Song],
+                        models.Song.get(session, filename='Eighties-2.mp3'))
+            assert song is not None
+            self.assertEqual(song.title, 'Eighties 2')
+            self.assertEqual(song.album.name, 'Eighties')
+            self.assertEqual(song.directory.title, 'Eighties')
+
+    def test_find_by_ref_id(self) -> None:
+        """
+        Check finding songs and directories using their ref_id
+        """
+        self.create_mp3(self.clips / 'Sixties' / 'Beat' / 'four.mp3', 'Four')
+        clips = Directory(None, self.clips)
+        clips.search(MockMP3Parser(self.testcases), Progress())
+        clips.sort('filename')
+        fifties = clips.subdirectories[0]
+        sixties = clips.subdirectories[1]
+        beat = sixties.subdirectories[0]
+        self.assertEqual(clips.total_length(), 4)
+        self.assertEqual(sixties.total_length(), 2)
+        self.assertEqual(beat.total_length(), 1)
+        for song in clips.get_songs(clips.ref_id):
+            self.assertIs(clips.find(song.ref_id), song)
+        one = fifties.songs[0]
+        self.assertIs(fifties.find(one.ref_id), one)
+        self.assertIsNone(sixties.find(one.ref_id))
+        self.assertIsNone(clips.find(10000))
+        self.assertEqual(clips.get_songs(one.ref_id), [one])
+        self.assertEqual(sixties.get_songs(one.ref_id), [])
+        self.assertEqual([song.title for song in clips.get_songs(sixties.ref_id)],
+                         ['Four', 'Three'])
+        self.assertEqual([song.title for song in sixties.get_songs(beat.ref_id)], ['Four'])
+        self.assertEqual(beat.get_songs(sixties.ref_id), [])
+        self.assertEqual(clips.get_songs(10000), [])
+        four = beat.songs[0]
+        four.ref_id = 10000
+        self.assertIs(clips.find(10000), four)
+        self.assertIs(sixties.find(10000), four)
+        self.assertIsNone(fifties.find(10000))
+        self.create_mp3(self.clips / 'Sixties' / 'Beat' / 'five.mp3', 'Five')
+        beat._parse_song(MockMP3Parser(self.testcases), {},
+                         self.clips / 'Sixties' / 'Beat' / 'five.mp3')
+        self.assertEqual(beat.total_length(), 2)
+        self.assertEqual(sixties.total_length(), 3)
+        self.assertEqual(clips.total_length(), 5)
+
+    def test_parse_workers(self) -> None:
+        """
+        Check searching a directory using a pool of processes to parse
+        MP3 files
+        """
+        clips = Directory(None, self.clips)
+        changes = clips.search(MockMP3Parser(self.testcases), Progress(), parse_workers=2)
+        self.assertEqual(len(changes.added), 3)
+        self.assertEqual(clips.total_length(), 3)
+        clips.sort('filename')
+        songs = [song.to_dict(only={'filename', 'title', 'album', 'duration'})
+                 for song in clips.get_songs(clips.ref_id)]
+        self.assertEqual(songs, [
+            {'filename': 'one.mp3', 'title': 'One', 'album': 'Fifties', 'duration': 30000},
+            {'filename': 'two.mp3', 'title': 'Two', 'album': 'Fifties', 'duration': 30000},
+            {'filename': 'three.mp3', 'title': 'Three', 'album': 'Sixties', 'duration': 30000},
+        ])
+
+    def test_parse_workers_abort(self) -> None:
+        """
+        Check that aborting a search stops the pool of parser processes
+        """
+        progress = Progress()
+        progress.abort = True
+        clips = Directory(None, self.clips)
+        changes = clips.search(MockMP3Parser(self.testcases), progress, parse_workers=2)
+        self.assertLessEqual(len(changes.added), 3)
+        # pylint: disable=protected-access
+        self.assertIsNone(clips._parse_pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
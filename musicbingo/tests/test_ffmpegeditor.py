@@ -0,0 +1,179 @@
+"""
+Unit tests for the ffmpeg commands used to create games with a lot of tracks
+"""
+from pathlib import Path
+import shutil
+import tempfile
+from typing import List, Optional
+import unittest
+
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.ffmpegeditor import FfmpegEditor
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.progress import Progress
+from musicbingo.tests.mixin import TestCaseMixin
+
+
+class RecordingEditor(FfmpegEditor):
+    """
+    FfmpegEditor that records each ffmpeg command, and the concat
+    demuxer scripts that they use, instead of running ffmpeg
+    """
+
+    commands: List[List[str]] = []
+    scripts: List[str] = []
+
+    @classmethod
+    def run_commands_with_progress(cls, commands: List[List[str]], progress: Progress,
+                                   duration: int) -> List[Optional[int]]:
+        for args in commands:
+            cls.commands.append(args)
+            if 'concat' in args:
+                script = Path(args[args.index('concat') + 4])
+                with script.open('rt', encoding='utf-8') as src:
+                    cls.scripts.append(src.read())
+            with open(args[-1], 'wb'):
+                pass
+        return [0] * len(commands)
+
+
+class TestFfmpegEditor(TestCaseMixin, unittest.TestCase):
+    """tests of combining a large number of files using ffmpeg"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.metadata = Metadata(title='Game', artist='', album='',
+                                 duration=Duration(30000), sample_width=16, channels=2,
+                                 sample_rate=44100, bitrate=256)
+        RecordingEditor.commands = []
+        RecordingEditor.scripts = []
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def game_files(self, num_songs: int, overlap: int) -> List[MP3File]:
+        """
+        Create the input files of a game, with a transition between
+        each song
+        """
+        transition = MP3File(self.tmpdir / "it's.mp3", FileMode.READ_ONLY,
+                             start=0, end=30000, metadata=self.metadata)
+        files: List[MP3File] = []
+        for index in range(num_songs):
+            if index > 0:
+                files.append(transition.overlap_with_previous(Duration(overlap)))
+            song = MP3File(self.tmpdir / f'song-{index}.mp3', FileMode.READ_ONLY,
+                           start=1000, end=21000, metadata=self.metadata)
+            files.append(song.overlap_with_previous(Duration(overlap)))
+        files[0].overlap = 0
+        return files
+
+    def test_concat_demuxer(self) -> None:
+        """
+        Check that a concat demuxer script is used for a lot of files
+        that are not cross-faded
+        """
+        editor = RecordingEditor()
+        files = self.game_files(30, 0)
+        args = editor.build_encode_args(files[:5], self.metadata, None, self.tmpdir / 'a.mp3',
+                                        tmpdir=self.tmpdir)
+        self.assertEqual(args.count('-i'), 5)
+        self.assertTrue(args[args.index('-filter_complex') + 1].endswith(
+            'concat=n=5:v=0:a=1[outa]'))
+        filename = self.tmpdir / 'game.mp3'
+        with editor.create(filename, self.metadata) as output:
+            for mp3file in files:
+                output.append(mp3file)
+        self.assertEqual(len(editor.commands), 1)
+        args = editor.commands[0]
+        # the first song starts part way through, so it is a separate input
+        self.assertEqual(args.count('-i'), 2)
+        self.assertEqual(args[args.index('-ss') + 1], '1.0')
+        self.assertLess(args.index('-ss'), args.index('concat'))
+        self.assertEqual(args[args.index('-filter_complex') + 1],
+                         '[0:a][1:a]concat=n=2:v=0:a=1[outa]')
+        self.assertEqual(args[args.index('-map') + 1], '[outa]')
+        self.assertEqual(len(editor.scripts), 1)
+        lines = editor.scripts[0].splitlines()
+        self.assertEqual(lines[0], 'ffconcat version 1.0')
+        self.assertEqual(lines[1], f"file '{self.tmpdir.resolve()}/it'\\''s.mp3'")
+        self.assertEqual(lines[2], f"file '{self.tmpdir.resolve()}/song-1.mp3'")
+        self.assertEqual(lines[3:5], ['inpoint 1.0', 'outpoint 21.0'])
+        self.assertEqual(len(lines), 1 + 29 * 3 + 29)
+        self.assertEqual(list(self.tmpdir.glob('.encode-*')), [])
+
+    def test_can_use_concat_demuxer(self) -> None:
+        """
+        Check the files that can be joined by the concat demuxer
+        """
+        files = self.game_files(3, 0)
+        self.assertTrue(FfmpegEditor.can_use_concat_demuxer(files))
+        self.assertFalse(FfmpegEditor.can_use_concat_demuxer(self.game_files(3, 500)))
+        mono = Metadata(title='Mono', artist='', duration=Duration(30000), sample_width=16,
+                        channels=1, sample_rate=44100, bitrate=128)
+        other = MP3File(self.tmpdir / 'mono.mp3', FileMode.READ_ONLY, start=0, end=1000,
+                        metadata=mono)
+        self.assertFalse(FfmpegEditor.can_use_concat_demuxer(files + [other]))
+        wav = MP3File(self.tmpdir / 'mono.wav', FileMode.READ_ONLY, start=0, end=1000,
+                      metadata=mono)
+        self.assertTrue(FfmpegEditor.can_use_concat_demuxer([wav, wav]))
+
+    def test_gain(self) -> None:
+        """
+        Check that a fixed gain is applied to each file that has one
+        """
+        editor = RecordingEditor()
+        files = self.game_files(2, 0)
+        files[0] = files[0].amplify(-3.5)
+        files[2] = files[2].amplify(2.0)
+        self.assertFalse(FfmpegEditor.can_use_concat_demuxer(files))
+        args = editor.build_encode_args(files, self.metadata, None, self.tmpdir / 'a.mp3')
+        self.assertEqual(args[args.index('-filter_complex') + 1],
+                         '[0:a]volume=-3.50dB[g0];[2:a]volume=2.00dB[g2];' +
+                         '[g0][1:a][g2]concat=n=3:v=0:a=1[outa]')
+        files = [mp3file.amplify(1.0) for mp3file in self.game_files(2, 500)]
+        args = editor.build_encode_args(files, self.metadata, None, self.tmpdir / 'a.mp3')
+        self.assertIn('[g0][g1]acrossfade', args[args.index('-filter_complex') + 1])
+        args = editor.build_encode_args(files[:1], self.metadata, 1, self.tmpdir / 'a.mp3')
+        self.assertEqual(args[args.index('-af') + 1], 'volume=1.00dB,loudnorm=tp=-1')
+
+    def test_mix_windows(self) -> None:
+        """
+        Check that a lot of cross-faded files are mixed in windows
+        """
+        editor = RecordingEditor()
+        files = self.game_files(40, 500)
+        filename = self.tmpdir / 'game.mp3'
+        with editor.create(filename, self.metadata) as output:
+            for mp3file in files:
+                output.append(mp3file)
+        windows = editor.commands[:-1]
+        self.assertEqual(len(windows), 3)
+        for args in windows:
+            self.assertLessEqual(args.count('-i'), FfmpegEditor.MAX_INPUTS)
+            self.assertEqual(args[-1][-4:], '.wav')
+            self.assertIn('-filter_complex', args)
+        # each window starts part way through the song that ends the
+        # previous window
+        for before, after in zip(windows, windows[1:]):
+            last = before[len(before) - before[::-1].index('-i')]
+            first = after[after.index('-i') + 1]
+            self.assertEqual(last, first)
+            self.assertIn('song-', first)
+            self.assertEqual(after[after.index('-i') - 4], '-ss')
+        durations = [float(args[args.index('-t') + 1]) for args in windows]
+        self.assertNotIn(0.0, durations)
+        # the mixed windows are joined without any cross-fades
+        final = editor.commands[-1]
+        inputs = [final[pos + 1] for pos, arg in enumerate(final) if arg == '-i']
+        self.assertEqual([Path(name).name for name in inputs],
+                         ['window-001.wav', 'window-002.wav', 'window-003.wav'])
+        self.assertTrue(final[final.index('-filter_complex') + 1].endswith(
+            'concat=n=3:v=0:a=1[outa]'))
+        self.assertNotIn('-t', final)
+
+
+if __name__ == "__main__":
+    unittest.main()
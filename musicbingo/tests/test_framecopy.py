@@ -0,0 +1,182 @@
+"""
+Unit tests for creating MP3 files by copying MPEG audio frames
+"""
+from pathlib import Path
+import shutil
+import tempfile
+from typing import List
+import unittest
+
+from mutagen.easyid3 import EasyID3  # type: ignore
+
+from musicbingo.assets import Assets
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.editor import MP3Editor, MP3FileWriter
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.framecopy import FramePlan, read_frames
+from musicbingo.mp3.headerparser import FrameHeader, HeaderParser
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.progress import Progress
+from musicbingo.tests.mixin import TestCaseMixin
+
+# MPEG-1 layer III, no CRC, 256Kbps, 44.1kHz, stereo
+FRAME_HEADER = b'\xFF\xFB\xD0\x00'
+FRAME_LENGTH = 835
+
+
+def create_mp3(filename: Path, num_frames: int, header: bytes = FRAME_HEADER,
+               main_data_begin: int = 0) -> None:
+    """
+    Create an MP3 file with ID3 tags, where each audio frame is filled with
+    the number of that frame, after the main_data_begin field
+    """
+    frame_header = FrameHeader.decode(header)
+    assert frame_header is not None
+    side_info = bytes([main_data_begin >> 1, (main_data_begin & 0x01) << 7])
+    with filename.open('wb') as dest:
+        dest.write(b'ID3\x04\x00\x00\x00\x00\x00\x0A' + bytes(10))
+        for index in range(num_frames):
+            dest.write(header + side_info + bytes([index % 256]) * (frame_header.length - 6))
+
+
+class FrameCopyEditor(MP3Editor):
+    """
+    Editor that can only create files by copying frames
+    """
+
+    supports_frame_copy = True
+
+    def __init__(self) -> None:
+        self.generated: List[MP3FileWriter] = []
+
+    def _generate(self, destination: MP3FileWriter, progress: Progress) -> None:
+        self.generated.append(destination)
+
+
+class TestFrameCopy(TestCaseMixin, unittest.TestCase):
+    """tests of creating MP3 files by copying MPEG audio frames"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.metadata = Metadata(title='Game', artist='', album='Album',
+                                 duration=Duration(0), sample_width=16, channels=2,
+                                 sample_rate=44100, bitrate=256)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def input_file(self, name: str, num_frames: int, start: int = 0,
+                   end: int = 0, main_data_begin: int = 0) -> MP3File:
+        """
+        Create an input MP3 file
+        """
+        filename = self.tmpdir / name
+        create_mp3(filename, num_frames, main_data_begin=main_data_begin)
+        duration = num_frames * 1152 * 1000 // 44100
+        if end == 0:
+            end = duration
+        return MP3File(filename, FileMode.READ_ONLY, start=start, end=end,
+                       metadata=self.metadata)
+
+    def test_read_frames(self) -> None:
+        """
+        Check finding the audio frames of an MP3 file
+        """
+        one = self.input_file('one.mp3', 10)
+        frames = read_frames(one.filename)
+        assert frames is not None
+        self.assertEqual(frames.num_frames, 10)
+        self.assertEqual(frames.offsets[0], 20)
+        self.assertEqual(frames.offsets[-1], 20 + 10 * FRAME_LENGTH)
+        self.assertEqual(frames.bitrates, {256})
+        self.assertEqual(frames.main_data, [0] * 10)
+        # the Xing frame and the LAME encoder delay in the asset are skipped
+        asset = read_frames(Assets.transition(44100).fullpath)
+        assert asset is not None
+        self.assertEqual(asset.num_frames, 40)
+        self.assertEqual(asset.delay, 576)
+        self.assertEqual(asset.frame_index(300), 12)
+        self.assertEqual(asset.main_data[0], 0)
+
+    def test_generate(self) -> None:
+        """
+        Check creating an output file by copying frames
+        """
+        editor = FrameCopyEditor()
+        one = self.input_file('one.mp3', 100)
+        two = self.input_file('two.mp3', 50)
+        filename = self.tmpdir / 'output' / 'game.mp3'
+        with editor.create(filename, self.metadata) as output:
+            # start and end are rounded to the nearest frame
+            self.assertEqual(output.append(one.clip(530, 1000)), 0)
+            self.assertEqual(output.append(two), 1)
+            self.assertEqual(output.append(one.clip(None, 100)), 2)
+            self.assertEqual(output.start_times(), [0, 470, 1776])
+        self.assertEqual(editor.generated, [])
+        tags = EasyID3(str(filename))
+        self.assertEqual(tags['title'], ['Game'])
+        self.assertEqual(tags['album'], ['Album'])
+        self.assertNotIn('artist', tags)
+        with filename.open('rb') as src:
+            parser = HeaderParser()
+            info = parser.parse_stream(src)
+            assert info is not None
+            # duration is read from the Info frame
+            self.assertEqual(info.duration, 1881)
+            src.seek(parser.skip_id3v2(src))
+            data = src.read()
+        self.assertEqual(len(data), (1 + 18 + 50 + 4) * FRAME_LENGTH)
+        frames = [data[pos + 6] for pos in range(FRAME_LENGTH, len(data), FRAME_LENGTH)]
+        self.assertEqual(frames, list(range(20, 38)) + list(range(50)) + list(range(4)))
+
+    def test_needs_encoding(self) -> None:
+        """
+        Check that the editor is used if frames cannot be copied
+        """
+        one = self.input_file('one.mp3', 100)
+        low_bitrate = self.tmpdir / 'low.mp3'
+        create_mp3(low_bitrate, 10, b'\xFF\xFB\x90\x00')
+        low = MP3File(low_bitrate, FileMode.READ_ONLY, start=0, end=100,
+                      metadata=self.metadata)
+        not_mp3 = self.tmpdir / 'not.mp3'
+        with not_mp3.open('wb') as dest:
+            dest.write(bytes(1000))
+        other = MP3File(not_mp3, FileMode.READ_ONLY, start=0, end=100,
+                        metadata=self.metadata)
+        self.assertIsNotNone(FramePlan.create([one, one], self.metadata))
+        self.assertIsNone(FramePlan.create([], self.metadata))
+        self.assertIsNone(FramePlan.create([one, one.overlap_with_previous(Duration(500))],
+                                           self.metadata))
+        self.assertIsNone(FramePlan.create([one, one.normalize(1)], self.metadata))
+        self.assertIsNone(FramePlan.create([one], self.metadata, headroom=1))
+        self.assertIsNone(FramePlan.create([one, low], self.metadata))
+        self.assertIsNone(FramePlan.create([one, other], self.metadata))
+        editor = FrameCopyEditor()
+        with editor.create(self.tmpdir / 'game.mp3', self.metadata) as output:
+            output.append(one)
+            output.append(one, overlap=Duration(500))
+            self.assertEqual(output.start_times(), [0, 2612])
+        self.assertEqual(len(editor.generated), 1)
+
+    def test_bit_reservoir(self) -> None:
+        """
+        Check that a file that uses the bit reservoir is only copied if
+        it starts at the first frame
+        """
+        one = self.input_file('one.mp3', 100)
+        two = self.input_file('two.mp3', 100, main_data_begin=300)
+        frames = read_frames(two.filename)
+        assert frames is not None
+        self.assertEqual(frames.main_data, [300] * 100)
+        self.assertIsNotNone(FramePlan.create([one, two, one.clip(530, 1000)], self.metadata))
+        self.assertIsNotNone(FramePlan.create([one, two.clip(None, 1000)], self.metadata))
+        self.assertIsNone(FramePlan.create([one, two.clip(530, 1000)], self.metadata))
+        editor = FrameCopyEditor()
+        with editor.create(self.tmpdir / 'clip.mp3', self.metadata) as output:
+            output.append(two.clip(530, 1000))
+        self.assertEqual(len(editor.generated), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
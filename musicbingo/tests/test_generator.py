@@ -3,7 +3,9 @@ Unit tests for GameGenerator
 """
 import json
 import logging
+import math
 from pathlib import Path, PurePosixPath
+import re
 import shutil
 import tempfile
 from typing import Dict, List, Optional
@@ -11,6 +13,8 @@ import unittest
 from unittest import mock
 
 from freezegun import freeze_time  # type: ignore
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from musicbingo.assets import Assets
 from musicbingo.bingoticket import BingoTicket
@@ -20,10 +24,11 @@ from musicbingo.options import DatabaseOptions, Options, PageSortOrder
 from musicbingo.palette import Palette
 from musicbingo.primes import PRIME_NUMBERS
 from musicbingo.progress import Progress
+from musicbingo.docgen import pdfgen
 from musicbingo.docgen.sizes.pagesize import PageSizes
 from musicbingo.song import Song
 from musicbingo.track import Track
-from musicbingo import models
+from musicbingo import models, winengine
 
 from .mock_editor import MockMP3Editor
 from .mock_docgen import MockDocumentGenerator
@@ -162,6 +167,87 @@ class TestGameGenerator(ModelsUnitTest):
         # pylint: disable=no-value-for-parameter
         self.check_bingo_game_pipeline(PageSizes.A5, 6, 'orange')
 
+    def test_generate_bingo_game_background_encode(self):
+        """
+        Test of Bingo game generation, with the MP3 file encoded in the
+        background
+        """
+        # pylint: disable=no-value-for-parameter
+        self.check_bingo_game_pipeline(PageSizes.A4, 3, 'blue', background_encode=True)
+
+    def test_save_game_statements(self) -> None:
+        """
+        Check that saving a game uses batched database statements, rather
+        than one query for every track and every square of every ticket
+        """
+        opts = Options(
+            game_id='test-statements',
+            games_dest=str(self.tmpdir),
+            number_of_cards=60,
+            title='Game title',
+            crossfade=0,
+            seed=1234,
+        )
+        statements: List[str] = []
+
+        def record_statement(conn, cursor, statement, *args):
+            # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', record_statement)
+        try:
+            # the second game replaces the tracks and tickets of the first
+            for _ in range(2):
+                statements.clear()
+                gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(),
+                                    Progress())
+                # pylint: disable=no-value-for-parameter
+                gen.generate(self.directory.songs[:40])
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record_statement)
+        with models.db.session_scope() as session:
+            game = models.Game.get(session, id='test-statements')
+            self.assertIsNotNone(game)
+            tickets = list(models.BingoTicket.search(session, game=game))
+            self.assertEqual(len(tickets), 60)
+            for ticket in tickets:
+                self.assertEqual(len(ticket.tracks), 15)
+            self.assertEqual(models.Track.search(session, game=game).count(), 40)
+            self.assertEqual(models.BingoTicketTrack.total_items(session), 60 * 15)
+        writes = [stmt for stmt in statements if not stmt.startswith('SELECT')]
+        self.assertLess(len(writes), 10)
+        for table in ['"BingoTicket"', '"BingoTicket_Track"', '"Track"', '"Song"']:
+            queries = [stmt for stmt in statements if f'FROM {table}' in stmt]
+            self.assertLess(len(queries), 5, table)
+
+    def test_loudness_gains(self) -> None:
+        """
+        Check that a fixed gain is applied to every song that has a
+        measured loudness, even if other songs have not been measured
+        """
+        opts = Options(game_id='test-gains', games_dest=str(self.tmpdir),
+                       crossfade=500)
+        gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(), Progress())
+        songs = self.directory.songs[:4]
+        songs[0].loudness = -12.0
+        songs[0].true_peak = -3.0
+        songs[0].loudness_range = 5.0
+        songs[2].loudness = -20.0
+        songs[2].true_peak = -6.0
+        songs[2].loudness_range = 5.0
+        output = gen.create_mp3_writer(songs, Progress())
+        gen.add_songs(output, songs)
+        self.assertIsNone(output.headroom)
+        gains = {mp3file.filename.name: mp3file.gain for mp3file in output._files}
+        self.assertEqual(gains[songs[0].filename], -4.0)
+        self.assertIsNone(gains[songs[1].filename])
+        self.assertEqual(gains[songs[2].filename], 4.0)
+        self.assertIsNone(gains[songs[3].filename])
+        # without any measurements, the whole output is normalised
+        output = gen.create_mp3_writer(self.directory.songs[4:8], Progress())
+        gen.add_songs(output, self.directory.songs[4:8])
+        self.assertEqual(output.headroom, 1)
+
     def test_card_sorting(self) -> None:
         """
         Check each of the card sorting methods
@@ -170,7 +256,7 @@ class TestGameGenerator(ModelsUnitTest):
         tracks: List[Track] = []
         start_time = 0
         for index, song in enumerate(self.directory.songs):
-            trk = Track(song, PRIME_NUMBERS[index], start_time)
+            trk = Track(song, index, start_time)
             start_time += song.duration
             tracks.append(trk)
         for index in range(len(tracks) - 15):
@@ -230,11 +316,209 @@ class TestGameGenerator(ModelsUnitTest):
             self.assertGreaterThanOrEqual(card.wins_on_track, first_win)
             first_win = card.wins_on_track
 
+    def test_win_engine_matches_prime_fingerprints(self) -> None:
+        """
+        Check that the WinEngine gives the same answers as the
+        prime number fingerprint calculation
+        """
+        mrand = MockRandom()
+        tracks: List[Track] = []
+        start_time = 0
+        for index, song in enumerate(self.directory.songs[:40]):
+            tracks.append(Track(song, index, start_time))
+            start_time += song.duration
+        cards: List[BingoTicket] = []
+        for number in range(1, 51):
+            indices = list(range(len(tracks)))
+            mrand.shuffle(indices)
+            cards.append(BingoTicket(
+                palette=Palette.BLUE, columns=5, number=number,
+                tracks=[tracks[idx] for idx in indices[:15]]))
+        order = list(tracks)
+        mrand.shuffle(order)
+        expected = [self.prime_win_values(order, card) for card in cards]
+        for use_numpy in [False, winengine.USE_NUMPY]:
+            with mock.patch('musicbingo.winengine.USE_NUMPY', use_numpy):
+                for card in cards:
+                    card.wins_on_track = 0
+                    card.rows_complete_on_track = []
+                winengine.WinEngine(order).compute_win_values(cards)
+                for card, (wins_on, rows) in zip(cards, expected):
+                    self.assertEqual(wins_on, card.wins_on_track)
+                    self.assertListEqual(rows, card.rows_complete_on_track)
+
+    @mock.patch('musicbingo.generator.secrets.randbelow')
+    def test_generate_at_point(self, mock_randbelow) -> None:
+        """
+        Check that generate_at_point() creates unique tickets that win
+        at the requested track
+        """
+        mrand = MockRandom()
+        mock_randbelow.side_effect = mrand.randbelow
+        tracks: List[Track] = []
+        for index, song in enumerate(self.directory.songs[:30]):
+            tracks.append(Track(song, index, 0))
+        opts = Options(game_id='test-at-point', games_dest=str(self.tmpdir))
+        gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(),
+                            Progress())
+        cards: List[BingoTicket] = []
+        for from_end in range(0, 6):
+            cards += gen.generate_at_point(tracks, 5, from_end)
+        self.assertEqual(len(cards), 30)
+        self.assertEqual(len({card.fingerprint for card in cards}), len(cards))
+        for card in cards:
+            self.assertEqual(len(card.tracks), opts.songs_per_ticket())
+            self.assertEqual(len(set(card.tracks)), opts.songs_per_ticket())
+            self.assertEqual(gen.get_when_ticket_wins(tracks, card),
+                             card.wins_on_track)
+        with self.assertRaises(ValueError):
+            gen.generate_at_point(tracks, 1, len(tracks) - 2)
+
+    def test_parallel_card_generation(self) -> None:
+        """
+        Check that generating tickets using worker processes creates
+        unique tickets that are the same for a given seed
+        """
+        tracks: List[Track] = []
+        for index, song in enumerate(self.directory.songs[:40]):
+            tracks.append(Track(song, index, 0))
+        results: List[List[BingoTicket]] = []
+        for workers, seed in [(1, None), (3, 1234), (3, 1234), (2, 1234)]:
+            opts = Options(game_id='test-parallel', games_dest=str(self.tmpdir),
+                           number_of_cards=60, card_workers=workers, seed=seed,
+                           sort_order=PageSortOrder.NUMBER)
+            gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(),
+                                Progress())
+            cards = gen.generate_all_cards(tracks)
+            self.assertEqual(len(cards), opts.number_of_cards)
+            self.assertEqual(len({card.fingerprint for card in cards}), len(cards))
+            for card in cards:
+                self.assertEqual(gen.get_when_ticket_wins(tracks, card),
+                                 card.wins_on_track)
+            results.append(cards)
+        serial, first, second, other = results  # pylint: disable=unbalanced-tuple-unpacking
+        self.assertListEqual([card.fingerprint for card in first],
+                             [card.fingerprint for card in second])
+        self.assertNotEqual([card.fingerprint for card in first],
+                            [card.fingerprint for card in other])
+        for cards in [first, other]:
+            self.assertListEqual(
+                sorted(card.wins_on_track for card in serial),
+                sorted(card.wins_on_track for card in cards))
+        # without a seed, the seed used by the workers is logged
+        opts = Options(game_id='test-parallel', games_dest=str(self.tmpdir),
+                       number_of_cards=60, card_workers=2, seed=None)
+        gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(), Progress())
+        with self.assertLogs('generator', level='INFO') as logs:
+            gen.generate_all_cards(tracks)
+        self.assertRegex(logs.output[0], r'Ticket pool seed: \d+$')
+
+    def test_seeded_generation(self) -> None:
+        """
+        Check that using a seed always produces the same track order
+        and the same tickets
+        """
+        results: List[tuple[List[int], List[int]]] = []
+        for seed in [5678, 5678, 9012]:
+            opts = Options(game_id='test-seed', games_dest=str(self.tmpdir),
+                           number_of_cards=30, seed=seed)
+            gen = GameGenerator(opts, MockMP3Editor(), MockDocumentGenerator(),
+                                Progress())
+            songs = gen.gen_track_order(self.directory.songs[:40])
+            tracks = [Track(song, index, 0) for index, song in enumerate(songs)]
+            cards = gen.generate_all_cards(tracks)
+            results.append(([song.ref_id for song in songs],
+                             [card.fingerprint for card in cards]))
+        self.assertEqual(results[0], results[1])
+        self.assertNotEqual(results[0], results[2])
+
+    def test_split_tickets_pdf(self) -> None:
+        """
+        Check that tickets are split across multiple documents when
+        pages_per_doc is set
+        """
+        tracks: List[Track] = []
+        for index, song in enumerate(self.directory.songs[:40]):
+            tracks.append(Track(song, index, 0))
+        opts = Options(game_id='test-split', games_dest=str(self.tmpdir),
+                       number_of_cards=22, cards_per_page=3, pages_per_doc=3,
+                       seed=1234)
+        docgen = MockDocumentGenerator()
+        gen = GameGenerator(opts, MockMP3Editor(), docgen, Progress())
+        cards = gen.generate_all_cards(tracks)
+        gen.generate_tickets_pdf(cards)
+        self.assertEqual(len(docgen.output), 3)
+        num_cards = 0
+        for part in range(1, 4):
+            name = opts.bingo_tickets_output_name(part=part).name
+            self.assertIn(name, docgen.output)
+            frames = [elt for elt in docgen.output[name]['elements'] if 'cid' in elt]
+            num_cards += len(frames)
+            self.assertLessThanOrEqual(len(frames), 3 * opts.cards_per_page)
+        self.assertEqual(num_cards, opts.number_of_cards)
+
+    def test_parallel_tickets_pdf(self) -> None:
+        """
+        Check that rendering tickets using worker processes produces the
+        same pages as using one process
+        """
+        tracks: List[Track] = []
+        for index, song in enumerate(self.directory.songs[:40]):
+            tracks.append(Track(song, index, 0))
+        pdf_pages: Dict[str, int] = {}
+        for name, workers, doc_per_page in [('serial', 0, False), ('parallel', 2, False),
+                                            ('doc-per-page', 2, True)]:
+            if name == 'parallel' and not pdfgen.USE_PYPDF:
+                continue
+            opts = Options(game_id=f'test-{name}', games_dest=str(self.tmpdir),
+                           number_of_cards=24, cards_per_page=3, pdf_workers=workers,
+                           doc_per_page=doc_per_page, seed=1234)
+            opts.game_destination_dir().mkdir(parents=True)
+            gen = GameGenerator(opts, MockMP3Editor(), pdfgen.PDFGenerator(), Progress())
+            gen.generate_tickets_pdf(gen.generate_all_cards(tracks))
+            files = list(opts.game_destination_dir().iterdir())
+            if doc_per_page:
+                self.assertEqual(len(files), 8)
+            else:
+                self.assertEqual(files, [opts.bingo_tickets_output_name()])
+            pdf_pages[name] = 0
+            for filename in files:
+                with filename.open('rb') as src:
+                    pdf_pages[name] += len(re.findall(rb'/Type\s*/Page\b', src.read()))
+        for name, count in pdf_pages.items():
+            self.assertEqual(count, 8, name)
+
+    @staticmethod
+    def prime_win_values(order: List[Track], card: BingoTicket) -> tuple[int, List[int]]:
+        """
+        Calculate when a ticket wins using products of prime numbers
+        """
+        ticket_fp = 1
+        row_fps: List[int] = []
+        for idx, track in enumerate(card.tracks, start=1):
+            ticket_fp *= PRIME_NUMBERS[track.number]
+            if (idx % card.columns) == 0:
+                row_fps.append(math.prod(
+                    PRIME_NUMBERS[trk.number]
+                    for trk in card.tracks[idx - card.columns:idx]))
+        wins_on = 0
+        rows = [0] * len(row_fps)
+        fingerprint = 1
+        for tnum, track in enumerate(order, start=1):
+            fingerprint *= PRIME_NUMBERS[track.number]
+            for idx, row_fp in enumerate(row_fps):
+                if rows[idx] == 0 and (fingerprint % row_fp) == 0:
+                    rows[idx] = tnum
+            if wins_on == 0 and (fingerprint % ticket_fp) == 0:
+                wins_on = tnum
+        return (wins_on, rows)
+
     # pylint: disable=too-many-locals,too-many-statements
     @mock.patch('musicbingo.generator.random.shuffle')
     @mock.patch('musicbingo.generator.secrets.randbelow')
     def check_bingo_game_pipeline(self, page_size: PageSizes, cards_per_page: int,
-                                  colour_scheme: str, mock_randbelow, mock_shuffle):
+                                  colour_scheme: str, mock_randbelow, mock_shuffle,
+                                  background_encode: bool = False):
         """
         Test of complete Bingo game generation
         """
@@ -253,6 +537,7 @@ class TestGameGenerator(ModelsUnitTest):
             crossfade=0,
             page_size=page_size,
             sort_order=PageSortOrder.NUMBER,
+            background_encode=background_encode,
         )
         editor = MockMP3Editor()
         docgen = MockDocumentGenerator()
@@ -0,0 +1,182 @@
+"""
+Unit tests for the MP3 parser that only reads frame headers
+"""
+from pathlib import Path
+import shutil
+import struct
+import tempfile
+from typing import List
+import unittest
+from unittest import mock
+
+from mutagen.easyid3 import EasyID3  # type: ignore
+
+from musicbingo.assets import Assets
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.factory import MP3Factory
+from musicbingo.mp3.headerparser import FrameHeader, HeaderParser
+from musicbingo.mp3.mutagenparser import MutagenParser
+from musicbingo.tests.mixin import TestCaseMixin
+
+# index of each bitrate for MPEG-1 layer III
+BITRATE_INDEX = {64: 5, 128: 9, 256: 13}
+
+
+def mpeg_frame(bitrate: int, mono: bool = False, info: bytes = b'') -> bytes:
+    """
+    Create one MPEG-1 layer III frame at 32kHz, where every frame
+    is 36ms long and there is no padding.
+    :info: optional Xing or VBRI header to place in the frame
+    """
+    header = bytes([0xFF, 0xFB, (BITRATE_INDEX[bitrate] << 4) | (2 << 2),
+                    0xC0 if mono else 0x00])
+    length = 144 * bitrate // 32
+    frame = bytearray(header + bytes(length - len(header)))
+    if info:
+        if info[:4] == b'VBRI':
+            pos = 36
+        else:
+            pos = 21 if mono else 36
+        frame[pos:pos + len(info)] = info
+    return bytes(frame)
+
+
+class TestHeaderParser(TestCaseMixin, unittest.TestCase):
+    """tests of the HeaderParser class"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_mp3(self, frames: List[bytes]) -> Path:
+        """
+        Create an MP3 file with an ID3 tag
+        """
+        filename = self.tmpdir / 'test.mp3'
+        with filename.open('wb') as dest:
+            for frame in frames:
+                dest.write(frame)
+        tags = EasyID3()
+        tags['artist'] = 'An Artist'
+        tags['title'] = 'A Title'
+        tags.save(filename)
+        return filename
+
+    def test_decode_frame_header(self) -> None:
+        """
+        Check decoding of frame headers
+        """
+        header = FrameHeader.decode(mpeg_frame(128, mono=True)[:4])
+        self.assertIsNotNone(header)
+        assert header is not None
+        self.assertTrue(header.mpeg1)
+        self.assertEqual(header.layer, 3)
+        self.assertEqual(header.bitrate, 128)
+        self.assertEqual(header.sample_rate, 32000)
+        self.assertEqual(header.channels, 1)
+        self.assertEqual(header.samples, 1152)
+        self.assertEqual(header.length, 576)
+        # MPEG-2 layer III, 22050Hz, 64Kbps, with padding
+        header = FrameHeader.decode(bytes([0xFF, 0xF3, 0x82, 0x00]))
+        assert header is not None
+        self.assertFalse(header.mpeg1)
+        self.assertEqual(header.sample_rate, 22050)
+        self.assertEqual(header.bitrate, 64)
+        self.assertEqual(header.samples, 576)
+        self.assertEqual(header.length, 72 * 64000 // 22050 + 1)
+        for data in [b'ID3\x03', b'\xFF\xFB\xF0\x00', b'\xFF\xFB\x9C\x00', b'\xFF\xE9\x90\x00']:
+            self.assertIsNone(FrameHeader.decode(data))
+
+    def test_constant_bitrate(self) -> None:
+        """
+        Check a constant bitrate file without an information frame
+        """
+        filename = self.create_mp3([mpeg_frame(128)] * 200)
+        metadata = HeaderParser().parse(filename)
+        self.assertEqual(metadata.artist, 'An Artist')
+        self.assertEqual(metadata.title, 'A Title')
+        self.assertEqual(metadata.album, self.tmpdir.name)
+        self.assertEqual(metadata.duration, 200 * 36)
+        self.assertEqual(metadata.sample_rate, 32000)
+        self.assertEqual(metadata.channels, 2)
+        self.assertEqual(metadata.sample_width, 16)
+        self.assertEqual(metadata.bitrate,
+                         round(8.0 * filename.stat().st_size / (200 * 36)))
+
+    def test_variable_bitrate_frame_walk(self) -> None:
+        """
+        Check a variable bitrate file without an information frame
+        """
+        bitrates = [128] * 40 + [64, 256] * 100
+        filename = self.create_mp3([mpeg_frame(rate, mono=True) for rate in bitrates])
+        metadata = HeaderParser().parse(filename)
+        self.assertEqual(metadata.duration, len(bitrates) * 36)
+        self.assertEqual(metadata.channels, 1)
+
+    def test_xing_header(self) -> None:
+        """
+        Check that the number of frames, encoder delay and padding are
+        read from the Xing and LAME headers
+        """
+        delay, padding = 576, 1000
+        lame = (b'LAME3.100' + bytes(12) +
+                bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF]))
+        xing = b'Info' + struct.pack('>II', 0x01, 100) + lame
+        filename = self.create_mp3(
+            [mpeg_frame(128, info=xing)] + [mpeg_frame(64)] * 100)
+        metadata = HeaderParser().parse(filename)
+        self.assertEqual(metadata.duration,
+                         round(1000.0 * (100 * 1152 - delay - padding) / 32000))
+
+    def test_vbri_header(self) -> None:
+        """
+        Check that the number of frames is read from a VBRI header
+        """
+        vbri = b'VBRI' + struct.pack('>HHHII', 1, 0, 75, 50 * 576, 50)
+        filename = self.create_mp3(
+            [mpeg_frame(128, info=vbri)] + [mpeg_frame(128)] * 50)
+        metadata = HeaderParser().parse(filename)
+        self.assertEqual(metadata.duration, 50 * 36)
+
+    def test_fallback_to_decoding(self) -> None:
+        """
+        Check that a file without frame headers is decoded
+        """
+        filename = self.create_mp3([bytes(1000)])
+        expected = Metadata(artist='An Artist', title='A Title', duration=Duration(1234),
+                            sample_width=16, channels=2, sample_rate=44100, bitrate=256)
+        with mock.patch.object(MutagenParser, 'parse', return_value=expected) as decode:
+            metadata = HeaderParser().parse(filename)
+        decode.assert_called_once_with(filename)
+        self.assertIs(metadata, expected)
+
+    def test_assets(self) -> None:
+        """
+        Check the duration of MP3 files in the Extra-Files directory, which
+        includes files with a LAME tag and files without an information frame
+        """
+        parser = HeaderParser()
+        for asset in [Assets.transition(44100), Assets.countdown(44100),
+                      Assets.quiz_countdown(44100)]:
+            with asset.fullpath.open('rb') as src:
+                info = parser.parse_stream(src)
+            self.assertIsNotNone(info)
+            assert info is not None
+            self.assertEqual(info.duration, int(asset.duration), asset.fullpath.name)
+            self.assertEqual(info.sample_rate, 44100)
+            self.assertEqual(info.channels, 2)
+
+    def test_factory(self) -> None:
+        """
+        Check that mutagen is the default parser and that the header
+        parser is only used when it is selected by name
+        """
+        self.assertIsInstance(MP3Factory.create_parser(), MutagenParser)
+        self.assertIsInstance(MP3Factory.create_parser('header'), HeaderParser)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Unit tests for measuring the loudness of songs
+"""
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Dict, List, Optional, cast
+import unittest
+
+from musicbingo import models
+from musicbingo.directory import Directory
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.loudness import (
+    Loudness, LoudnessAnalyser, MAX_GAIN, MAX_TRUE_PEAK, SILENCE, TARGET_LOUDNESS,
+    calculate_gain, measure_args, parse_summary
+)
+from musicbingo.mp3.mockeditor import MockEditor
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.options import DatabaseOptions
+from musicbingo.progress import Progress
+from musicbingo.song import Song
+from musicbingo.tests.mixin import TestCaseMixin
+
+EBUR128_OUTPUT = """Input #0, mp3, from 'song.mp3':
+  Duration: 00:00:30.02, start: 0.025057, bitrate: 256 kb/s
+[Parsed_ebur128_0 @ 0x5581] t: 0.0999773  TARGET:-23 LUFS    M:-120.7 S:-120.7
+[Parsed_ebur128_0 @ 0x5581] Summary:
+
+  Integrated loudness:
+    I:         -11.3 LUFS
+    Threshold: -21.5 LUFS
+
+  Loudness range:
+    LRA:         4.2 LU
+    Threshold:  -31.4 LUFS
+    LRA low:   -13.7 LUFS
+    LRA high:   -9.5 LUFS
+
+  True peak:
+    Peak:        0.4 dBFS
+"""
+
+
+class MeasuringEditor(MockEditor):
+    """
+    Mock editor that returns pre-defined loudness measurements
+    """
+
+    def __init__(self, results: Dict[str, Optional[Loudness]]) -> None:
+        self.results = results
+        self.measured: List[str] = []
+
+    def measure_loudness(self, mp3file: MP3File) -> Loudness:
+        name = mp3file.filename.name
+        self.measured.append(name)
+        result = self.results[name]
+        if result is None:
+            raise IOError(f'Failed to measure the loudness of "{name}"')
+        return result
+
+
+class TestLoudness(TestCaseMixin, unittest.TestCase):
+    """tests of measuring the loudness of songs"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        models.db.DatabaseConnection.bind(
+            DatabaseOptions(database_provider='sqlite',
+                            database_name=str(self.tmpdir / 'bingo.db3')),
+            create_tables=True)
+        self.clips = Directory(None, self.tmpdir / 'Clips')
+
+    def tearDown(self) -> None:
+        models.db.DatabaseConnection.close()
+        shutil.rmtree(self.tmpdir)
+
+    def create_song(self, filename: str, **kwargs) -> Song:
+        """
+        Create a song in the clips directory
+        """
+        return Song(filename, parent=self.clips, title=filename.split('.')[0],
+                    artist='Artist', album='Album', duration=Duration(30000),
+                    sample_width=16, channels=2, sample_rate=44100, bitrate=256,
+                    **kwargs)
+
+    def test_parse_summary(self) -> None:
+        """
+        Check finding the loudness in the output of the ebur128 filter
+        """
+        self.assertEqual(parse_summary(EBUR128_OUTPUT),
+                         Loudness(loudness=-11.3, true_peak=0.4, loudness_range=4.2))
+        silent = EBUR128_OUTPUT.replace('-11.3', '-70.0').replace('0.4 dBFS', '-inf dBFS')
+        self.assertEqual(parse_summary(silent),
+                         Loudness(loudness=-70.0, true_peak=float('-inf'),
+                                  loudness_range=4.2))
+        self.assertIsNone(parse_summary('song.mp3: No such file or directory'))
+        mp3file = MP3File(self.tmpdir / 'song.mp3', FileMode.READ_ONLY, start=5000,
+                          end=25000, metadata=Metadata(**self.create_song('song.mp3').as_dict(
+                              exclude={'filename', 'ref_id', 'uuid'})))
+        args = measure_args('ffmpeg', mp3file)
+        self.assertEqual(args[args.index('-ss') + 1], '5.0')
+        self.assertEqual(args[args.index('-t') + 1], '20.0')
+        self.assertIn('ebur128=peak=true', args[args.index('-af') + 1])
+
+    def test_calculate_gain(self) -> None:
+        """
+        Check calculating the gain that moves a song to the target loudness
+        """
+        self.assertIsNone(calculate_gain(self.create_song('one.mp3')))
+        loud = self.create_song('loud.mp3', loudness=-9.25, true_peak=-0.1,
+                                loudness_range=3.0)
+        self.assertAlmostEqual(calculate_gain(loud), TARGET_LOUDNESS + 9.25)
+        # a quiet song is limited by its true peak
+        quiet = self.create_song('quiet.mp3', loudness=-24.0, true_peak=-4.0,
+                                 loudness_range=9.0)
+        self.assertAlmostEqual(calculate_gain(quiet), MAX_TRUE_PEAK + 4.0)
+        self.assertAlmostEqual(calculate_gain(quiet, target=-20.0, max_peak=0.0), 4.0)
+        # the gain is limited to a sensible range
+        very_quiet = self.create_song('very_quiet.mp3', loudness=-60.0, true_peak=-40.0,
+                                      loudness_range=9.0)
+        self.assertAlmostEqual(calculate_gain(very_quiet), MAX_GAIN)
+        # a silent song does not have a gain
+        silent = self.create_song('silent.mp3', loudness=float('-inf'),
+                                  true_peak=float('-inf'), loudness_range=0.0)
+        self.assertIsNone(calculate_gain(silent))
+        silent = self.create_song('silent.mp3', loudness=SILENCE, true_peak=SILENCE,
+                                  loudness_range=0.0)
+        self.assertIsNone(calculate_gain(silent))
+
+    def test_analyse_and_save(self) -> None:
+        """
+        Check that songs are only measured if their loudness is not known,
+        and that the measurements are stored in the database
+        """
+        songs = [
+            self.create_song('one.mp3'),
+            self.create_song('two.mp3', loudness=-15.0, true_peak=-2.0,
+                             loudness_range=5.0),
+            self.create_song('three.mp3'),
+            # a silent song
+            self.create_song('four.mp3'),
+        ]
+        with models.db.session_scope() as session:
+            db_dir = self.clips.save(session, flush=True)
+            Song.save_all(session, [(db_dir.pk, song) for song in songs])
+        editor = MeasuringEditor({
+            'one.mp3': Loudness(loudness=-12.5, true_peak=-0.2, loudness_range=6.5),
+            'three.mp3': None,
+            'four.mp3': parse_summary(
+                EBUR128_OUTPUT.replace('-11.3', '-inf').replace('0.4 dBFS', '-inf dBFS')),
+        })
+        progress = Progress()
+        analyser = LoudnessAnalyser(editor, progress)
+        with self.assertLogs('musicbingo.mp3.loudness', level='WARNING'):
+            measured = analyser.analyse(songs)
+        self.assertEqual(editor.measured, ['one.mp3', 'three.mp3', 'four.mp3'])
+        self.assertEqual(measured, [songs[0], songs[3]])
+        self.assertEqual(songs[0].loudness, -12.5)
+        self.assertIsNone(songs[2].loudness)
+        # a silent song is stored, so that it is not measured again
+        self.assertEqual(songs[3].loudness, SILENCE)
+        self.assertEqual(songs[3].true_peak, SILENCE)
+        self.assertEqual(progress.pct, 100.0)
+        with models.db.session_scope() as session:
+            self.assertEqual(analyser.save(session, measured), 2)
+        with models.db.session_scope() as session:
+            db_song = cast(models.Song, models.Song.get(session, filename='four.mp3'))
+            self.assertEqual(db_song.loudness, SILENCE)
+        editor.measured = []
+        with self.assertLogs('musicbingo.mp3.loudness', level='WARNING'):
+            analyser = LoudnessAnalyser(editor, Progress())
+            self.assertEqual(analyser.analyse(songs), [])
+        self.assertEqual(editor.measured, ['three.mp3'])
+        with models.db.session_scope() as session:
+            db_song = cast(models.Song, models.Song.get(session, filename='one.mp3'))
+            self.assertEqual(db_song.loudness, -12.5)
+            self.assertEqual(db_song.true_peak, -0.2)
+            self.assertEqual(db_song.loudness_range, 6.5)
+            # songs that have not been measured do not include the
+            # loudness fields
+            db_song = cast(models.Song, models.Song.get(session, filename='three.mp3'))
+            self.assertNotIn('loudness', db_song.to_dict())
+        # editors that cannot measure loudness are not an error
+        self.assertEqual(LoudnessAnalyser(MockEditor(), Progress()).analyse(songs), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
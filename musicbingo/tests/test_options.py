@@ -127,9 +127,20 @@ class TestOptions(TestCaseMixin, unittest.TestCase):
             'crossfade': 250,
             'mp3_editor': 'mock',
             'mp3_player': 'mock',
+            'mp3_parser': 'header',
             'checkbox': True,
             'cards_per_page': 4,
             'doc_per_page': True,
+            'pages_per_doc': 50,
+            'pdf_workers': 3,
+            'background_encode': True,
+            'card_workers': 4,
+            'parse_workers': 2,
+            'encode_workers': 3,
+            'clip_workers': 5,
+            'pcm_cache': 'PCMCache',
+            'pcm_cache_size': 512,
+            'seed': 1234,
             'page_size': PageSizes.A5,
             'max_tickets_per_user': 1,
             'debug': True,
@@ -0,0 +1,114 @@
+"""
+Unit tests for assembling audio in a preallocated PCM buffer
+"""
+from pathlib import Path
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pydub import AudioSegment  # type: ignore
+from pydub.generators import Sine  # type: ignore
+
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.mp3.pcmbuffer import PCMBuffer
+from musicbingo.progress import Progress
+from musicbingo.tests.mixin import TestCaseMixin
+
+
+class TestPCMBuffer(TestCaseMixin, unittest.TestCase):
+    """tests of the PCMBuffer class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.metadata = Metadata(title='Game', artist='Artist', album='',
+                                 duration=Duration(0), sample_width=16, channels=2,
+                                 sample_rate=44100, bitrate=256)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def tone(freq: int, duration: int) -> AudioSegment:
+        """
+        Create a stereo sine wave
+        """
+        seg = Sine(freq, sample_rate=44100, bit_depth=16).to_audio_segment(
+            duration=duration, volume=-6.0)
+        return seg.set_channels(2)
+
+    def test_num_frames(self) -> None:
+        """
+        Check calculating the size of the buffer
+        """
+        files = [
+            MP3File(self.tmpdir / 'one.mp3', FileMode.READ_ONLY, start=500, end=1500,
+                    metadata=self.metadata, overlap=100),
+            MP3File(self.tmpdir / 'two.mp3', FileMode.READ_ONLY, start=0, end=2000,
+                    metadata=self.metadata, overlap=250),
+        ]
+        # the overlap of the first file is ignored
+        self.assertEqual(PCMBuffer.num_frames(files, 44100), 44100 + 2 * 44100 - 11025)
+
+    def test_append(self) -> None:
+        """
+        Check that the buffer matches the result of AudioSegment.append()
+        """
+        segs = [self.tone(440, 1000), self.tone(660, 2000), self.tone(880, 500),
+                self.tone(220, 750).set_frame_rate(22050).set_channels(1)]
+        crossfades = [0, 300, 0, 200]
+        expected = segs[0]
+        for seg, crossfade in zip(segs[1:], crossfades[1:]):
+            expected = expected.append(seg.set_frame_rate(44100).set_channels(2),
+                                       crossfade=crossfade)
+        # a buffer that is too small grows to fit all of the audio
+        for num_frames in [len(expected.raw_data) // 4, 1000]:
+            with PCMBuffer(44100, 2, num_frames, self.tmpdir) as output:
+                for seg, crossfade in zip(segs, crossfades):
+                    output.append(seg, crossfade=crossfade)
+                self.assertEqual(output.length, int(expected.frame_count()))
+                self.assertEqual(len(output), len(expected))
+                self.assertEqual(output.segment(0, output.length).raw_data,
+                                 expected.raw_data)
+        self.assertEqual(list(self.tmpdir.iterdir()), [])
+
+    def test_encode(self) -> None:
+        """
+        Check that the audio is piped to the encoder
+        """
+        # fake encoder that writes its input to the output file
+        encoder = self.tmpdir / 'encoder.sh'
+        with encoder.open('wt', encoding='utf-8') as script:
+            script.write('#!/bin/sh\nfor last; do :; done\ncat > "$last"\n')
+        encoder.chmod(encoder.stat().st_mode | stat.S_IEXEC)
+        original = AudioSegment.converter
+        try:
+            AudioSegment.converter = str(encoder)
+            filename = self.tmpdir / 'game.mp3'
+            progress = Progress()
+            with PCMBuffer(44100, 2, 0, self.tmpdir) as output:
+                output.WRITE_SIZE = 4096
+                output.append(self.tone(440, 1000))
+                args = output.encode_args(filename, self.metadata)
+                self.assertIn('pipe:0', args)
+                self.assertIn('artist=Artist', args)
+                self.assertNotIn('album=', ' '.join(args))
+                output.encode(filename, self.metadata, progress, start_pct=50.0)
+                expected = output.segment(0, output.length).raw_data
+            self.assertEqual(progress.pct, 100.0)
+            with filename.open('rb') as src:
+                self.assertEqual(src.read(), expected)
+            AudioSegment.converter = str(self.tmpdir / 'missing')
+            with PCMBuffer(44100, 2, 0, self.tmpdir) as output:
+                output.append(self.tone(440, 100))
+                with self.assertRaises(OSError):
+                    output.encode(filename, self.metadata, progress)
+        finally:
+            AudioSegment.converter = original
+
+
+if __name__ == "__main__":
+    unittest.main()
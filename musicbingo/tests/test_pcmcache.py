@@ -0,0 +1,221 @@
+"""
+Unit tests for the cache of decoded audio
+"""
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import List
+import unittest
+import wave
+
+from musicbingo.directory import Directory
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.editor import MP3File
+from musicbingo.mp3.ffmpegeditor import FfmpegEditor
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.mockeditor import MockEditor
+from musicbingo.mp3.pcmcache import PCMCache, prewarm
+from musicbingo.mp3.pydubeditor import PydubEditor
+from musicbingo.options import GameMode
+from musicbingo.progress import Progress
+from musicbingo.song import Song
+from musicbingo.tests.mixin import TestCaseMixin
+
+
+def write_wav(mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+    """
+    Create a silent WAV file with the duration of mp3file
+    """
+    num_frames = (mp3file.end - mp3file.start) * sample_rate // 1000
+    with wave.Wave_write(str(dest)) as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(num_frames * channels * 2))
+
+
+class DecodingEditor(MockEditor):
+    """
+    Mock editor that creates a silent WAV file when asked to decode
+    """
+
+    def __init__(self) -> None:
+        self.decoded: List[str] = []
+
+    def decode(self, mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+        self.decoded.append(mp3file.filename.name)
+        write_wav(mp3file, dest, sample_rate, channels)
+
+
+class TestPCMCache(TestCaseMixin, unittest.TestCase):
+    """tests of the PCMCache class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.cachedir = self.tmpdir / 'cache'
+        self.decoded: List[Path] = []
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def create_mp3(self, name: str, duration: int = 1000) -> MP3File:
+        """
+        Create a fake MP3 file
+        """
+        filename = self.tmpdir / name
+        with filename.open('wb') as dest:
+            data = name.encode('utf-8')
+            dest.write(data + bytes(100 - len(data)))
+        metadata = Metadata(title=name, artist='Artist', duration=Duration(duration),
+                            sample_width=16, channels=2, sample_rate=44100, bitrate=256)
+        return MP3File(filename, FileMode.READ_ONLY, start=0, end=duration, metadata=metadata)
+
+    def decoder(self, mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+        """
+        Decoder that records which files it was asked to decode
+        """
+        self.decoded.append(mp3file.filename)
+        write_wav(mp3file, dest, sample_rate, channels)
+
+    def test_fetch(self) -> None:
+        """
+        Check that each file is only decoded once
+        """
+        cache = PCMCache(self.cachedir, 0)
+        one = self.create_mp3('one.mp3')
+        self.assertIsNone(cache.get(one, 44100, 2))
+        filename = cache.fetch(one, 44100, 2, self.decoder)
+        self.assertTrue(filename.exists())
+        self.assertEqual(cache.get(one, 44100, 2), filename)
+        self.assertEqual(cache.fetch(one, 44100, 2, self.decoder), filename)
+        self.assertEqual(self.decoded, [one.filename])
+        with wave.open(str(filename), 'rb') as wav:
+            self.assertEqual(wav.getframerate(), 44100)
+            self.assertEqual(wav.getnchannels(), 2)
+            self.assertEqual(wav.getnframes(), 44100)
+        # a different section or format of the same file is a different entry
+        self.assertNotEqual(cache.fetch(one.clip(500, None), 44100, 2, self.decoder), filename)
+        self.assertNotEqual(cache.fetch(one, 48000, 2, self.decoder), filename)
+        self.assertNotEqual(cache.fetch(one, 44100, 1, self.decoder), filename)
+        self.assertEqual(len(self.decoded), 4)
+        # the key uses the contents of the file, not its name
+        shutil.copy(one.filename, self.tmpdir / 'copy.mp3')
+        copy = MP3File(self.tmpdir / 'copy.mp3', FileMode.READ_ONLY, start=0, end=1000,
+                       metadata=one.metadata)
+        self.assertEqual(cache.fetch(copy, 44100, 2, self.decoder), filename)
+        self.assertEqual(len(self.decoded), 4)
+        self.assertEqual(list(self.cachedir.glob('*.tmp')), [])
+
+    def test_decode_failure(self) -> None:
+        """
+        Check that a failed decode does not leave a file in the cache
+        """
+        # pylint: disable=unused-argument
+        def decoder(mp3file: MP3File, dest: Path, sample_rate: int, channels: int) -> None:
+            with dest.open('wb') as out:
+                out.write(b'partial')
+            raise IOError(f'Failed to decode {mp3file.filename}')
+
+        cache = PCMCache(self.cachedir, 0)
+        one = self.create_mp3('one.mp3')
+        with self.assertRaises(IOError):
+            cache.fetch(one, 44100, 2, decoder)
+        self.assertEqual(list(self.cachedir.iterdir()), [])
+
+    def test_evict(self) -> None:
+        """
+        Check that the least recently used files are removed when the
+        cache becomes too large
+        """
+        files = [self.create_mp3(f'{name}.mp3') for name in ['one', 'two', 'three', 'four']]
+        size = (44100 * 4) + 44
+        cache = PCMCache(self.cachedir, 3 * size)
+        cached: List[Path] = []
+        for index, mp3file in enumerate(files[:3]):
+            cached.append(cache.fetch(mp3file, 44100, 2, self.decoder))
+            timestamp = 1000000 + index
+            os.utime(cached[-1], (timestamp, timestamp))
+        self.assertEqual(cache.size(), 3 * size)
+        # using "one" makes "two" the least recently used file
+        self.assertEqual(cache.get(files[0], 44100, 2), cached[0])
+        cached.append(cache.fetch(files[3], 44100, 2, self.decoder))
+        self.assertEqual(cache.size(), 3 * size)
+        self.assertTrue(cached[0].exists())
+        self.assertFalse(cached[1].exists())
+        self.assertTrue(cached[2].exists())
+        self.assertTrue(cached[3].exists())
+        os.utime(cached[3], (1000010, 1000010))
+        cache.max_size = size
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual([item[2] for item in cache.entries()], [cached[0]])
+
+    def test_create(self) -> None:
+        """
+        Check creating a cache from the settings in Options
+        """
+        self.assertIsNone(PCMCache.create('', 100))
+        cache = PCMCache.create(str(self.cachedir), 100)
+        assert cache is not None
+        self.assertEqual(cache.directory, self.cachedir)
+        self.assertEqual(cache.max_size, 100 * 1024 * 1024)
+
+    def test_pydub_editor(self) -> None:
+        """
+        Check that PydubEditor loads audio from the cache
+        """
+        editor = PydubEditor()
+        editor.pcm_cache = PCMCache(self.cachedir, 0)
+        mp3file = self.create_mp3('one.mp3', 2000).clip(500, None).normalize(1)
+        # prefill the cache, as decoding an MP3 file requires ffmpeg
+        editor.pcm_cache.fetch(mp3file, 48000, 1, self.decoder)
+        cached = editor.use_cached_pcm(mp3file, 48000, 1)
+        self.assertEqual(cached.filename.suffix, '.wav')
+        self.assertEqual(cached.start, 0)
+        self.assertEqual(cached.end, 1500)
+        self.assertEqual(cached.headroom, 1)
+        seg = editor.load_segment(cached)
+        self.assertEqual(len(seg), 1500)
+        self.assertEqual(seg.frame_rate, 48000)
+        self.assertEqual(seg.channels, 1)
+
+    def test_ffmpeg_editor(self) -> None:
+        """
+        Check that FfmpegEditor uses files from the cache as its inputs
+        """
+        editor = FfmpegEditor()
+        editor.pcm_cache = PCMCache(self.cachedir, 0)
+        mp3file = self.create_mp3('one.mp3', 2000).clip(500, None)
+        filename = editor.pcm_cache.fetch(mp3file, 44100, 2, self.decoder)
+        args: List[str] = []
+        editor.append_input_files(args, [editor.use_cached_pcm(mp3file, 44100, 2)])
+        self.assertEqual(args, ['-t', '1.5', '-i', str(filename)])
+        editor.pcm_cache = None
+        args = []
+        editor.append_input_files(args, [editor.use_cached_pcm(mp3file, 44100, 2)])
+        self.assertEqual(args, ['-ss', '0.5', '-t', '1.5', '-i', str(mp3file.filename)])
+
+    def test_prewarm(self) -> None:
+        """
+        Check that prewarm decodes every song and the assets used by a game
+        """
+        clips = Directory(None, self.tmpdir)
+        songs: List[Song] = []
+        for name in ['one.mp3', 'two.mp3']:
+            self.create_mp3(name)
+            songs.append(Song(name, parent=clips, title=name, artist='Artist',
+                              duration=Duration(1000), sample_width=16, channels=2,
+                              sample_rate=44100, bitrate=256))
+        cache = PCMCache(self.cachedir, 0)
+        editor = DecodingEditor()
+        self.assertEqual(prewarm(cache, editor, songs, Progress()), 4)
+        self.assertEqual(editor.decoded, [
+            'one.mp3', 'two.mp3', 'transition-44100.mp3', 'start-44100.mp3'])
+        self.assertEqual(prewarm(cache, editor, songs, Progress()), 0)
+        self.assertEqual(prewarm(cache, editor, songs, Progress(), GameMode.QUIZ), 11)
+        self.assertEqual(editor.decoded[4:], 11 * ['countdown-44100.mp3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
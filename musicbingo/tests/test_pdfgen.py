@@ -6,6 +6,7 @@ tests of the PDF generator
 
 import os
 from pathlib import Path
+import re
 import shutil
 import tempfile
 from typing import Collection, Iterable, List, Optional, Tuple, cast
@@ -21,6 +22,7 @@ from musicbingo.docgen.sizes.dimension import Dimension
 from musicbingo.docgen.sizes.pagesize import PageSizes
 from musicbingo.docgen.styles import HorizontalAlignment, VerticalAlignment
 from musicbingo.docgen.styles import Padding, ElementStyle, RowStyle
+from musicbingo.progress import Progress
 
 
 class TestPDFGenerator(unittest.TestCase):
@@ -135,6 +137,67 @@ class TestPDFGenerator(unittest.TestCase):
             dg_container,
             state.current_template.frames[0], doc=doc)  # type: ignore
 
+    def test_render_pages(self) -> None:
+        """
+        test rendering a document one page at a time produces the same
+        pages as rendering the complete document
+        """
+        pstyle = DG.ElementStyle(name='test-paragraph', colour='black',
+                                 fontSize=12, leading=16)
+
+        def make_pages(num_pages: int) -> Iterable[List[DG.Element]]:
+            for page in range(num_pages):
+                elements: List[DG.Element] = []
+                for idx in range(2):
+                    frame = DG.Container(cid=f'p{page}f{idx}', top=Dimension(20 + 120 * idx),
+                                         left=Dimension(20), width=Dimension(150),
+                                         height=Dimension(100))
+                    frame.append(DG.Paragraph(f'Page {page} frame {idx}', pstyle))
+                    elements.append(frame)
+                elements.append(DG.OverlayText(Dimension(100), Dimension(10),
+                                               text=f'Page {page}', style=pstyle))
+                if page + 1 < num_pages:
+                    elements.append(DG.PageBreak())
+                yield elements
+
+        pdfgen = PDFGenerator()
+        doc = DG.Document(PageSizes.A4, topMargin=Dimension(10), bottomMargin=Dimension(10),
+                          leftMargin=Dimension(10), rightMargin=Dimension(10),
+                          title='Streaming test')
+        whole_file = os.path.join(self.tmpdir, 'whole.pdf')
+        pdfgen.render(whole_file, doc, Progress())
+        empty_file = os.path.join(self.tmpdir, 'empty.pdf')
+        pdfgen.render_pages(empty_file, doc, [], Progress())
+        self.assertEqual(self.count_pages(whole_file), self.count_pages(empty_file))
+        for num_pages in [1, 5]:
+            whole_doc = DG.Document(PageSizes.A4, topMargin=Dimension(10),
+                                    bottomMargin=Dimension(10), leftMargin=Dimension(10),
+                                    rightMargin=Dimension(10), title='Streaming test')
+            for page in make_pages(num_pages):
+                for elt in page:
+                    whole_doc.append(elt)
+            pdfgen.render(whole_file, whole_doc, Progress())
+            stream_file = os.path.join(self.tmpdir, f'stream{num_pages}.pdf')
+            pdfgen.render_pages(stream_file, doc, make_pages(num_pages), Progress())
+            self.assertEqual(num_pages, self.count_pages(stream_file))
+            self.assertEqual(self.count_pages(whole_file), self.count_pages(stream_file))
+
+    def test_streaming_doc_template_api(self) -> None:
+        """
+        Check that reportlab still provides the functions that
+        StreamingDocTemplate uses to build a document incrementally
+        """
+        for name in ['_startBuild', '_endBuild', 'handle_flowable', 'clean_hanging']:
+            self.assertTrue(callable(getattr(platypus.BaseDocTemplate, name, None)), name)
+
+    @staticmethod
+    def count_pages(filename: str) -> int:
+        """
+        count the number of pages in a PDF file
+        """
+        with open(filename, 'rb') as src:
+            return len(re.findall(rb'/Type /Page\b', src.read()))
+
     @mock.patch('musicbingo.docgen.pdfgen.platypus.Table', autospec=True)
     def test_render_results_table(self, mock_table) -> None:
         """
@@ -0,0 +1,166 @@
+"""
+Unit tests for playing MP3 files while they are being decoded
+"""
+from pathlib import Path
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+import unittest
+
+from musicbingo.duration import Duration
+from musicbingo.metadata import Metadata
+from musicbingo.mp3.filemode import FileMode
+from musicbingo.mp3.mp3file import MP3File
+from musicbingo.mp3.streamplayer import AudioStream, RingBuffer, StreamingPlayer
+from musicbingo.progress import Progress
+from musicbingo.tests.mixin import TestCaseMixin
+
+# fake decoder that writes the contents of its input file to stdout.
+# If the input file is called "endless.mp3", it never stops.
+DECODER = """
+import sys
+filename = sys.argv[sys.argv.index('-i') + 1]
+if filename.endswith('endless.mp3'):
+    while True:
+        sys.stdout.buffer.write(bytes(4096))
+with open(filename, 'rb') as src:
+    sys.stdout.buffer.write(src.read())
+"""
+
+
+class RecordingStream(AudioStream):
+    """
+    Audio output that records everything that is played
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, progress: Progress, abort_after: int) -> None:
+        self.progress = progress
+        self.abort_after = abort_after
+        self.chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+        if len(self.chunks) == self.abort_after:
+            self.progress.abort = True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class RecordingPlayer(StreamingPlayer):
+    """
+    StreamingPlayer that uses a RecordingStream as its audio output
+    """
+
+    # smaller than the test files, so that the ring buffer wraps around
+    BUFFER_SIZE = 200
+
+    def __init__(self, converter: str, progress: Progress, abort_after: int = 0) -> None:
+        super().__init__(converter)
+        self.stream = RecordingStream(progress, abort_after)
+
+    def open_output(self, sample_rate: int, channels: int) -> AudioStream:
+        return self.stream
+
+
+class TestStreamingPlayer(TestCaseMixin, unittest.TestCase):
+    """tests of the StreamingPlayer class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.metadata = Metadata(title='Song', artist='Artist', album='',
+                                 duration=Duration(60000), sample_width=16, channels=2,
+                                 sample_rate=8000, bitrate=256)
+        self.decoder = self.tmpdir / 'decoder.py'
+        with self.decoder.open('wt', encoding='utf-8') as script:
+            script.write(f'#!{sys.executable}\n{DECODER}')
+        self.decoder.chmod(self.decoder.stat().st_mode | stat.S_IEXEC)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_ring_buffer(self) -> None:
+        """
+        Check passing data between threads using a ring buffer
+        """
+        buf = RingBuffer(10)
+        expected = bytes(range(256)) * 4
+
+        def writer() -> None:
+            for pos in range(0, len(expected), 7):
+                buf.write(expected[pos:pos + 7])
+            buf.finish()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        result = b''
+        while True:
+            data = buf.read(8, timeout=5)
+            if not data:
+                break
+            result += data
+        thread.join()
+        self.assertEqual(result, expected)
+        self.assertEqual(buf.read(8, timeout=0.01), b'')
+        buf = RingBuffer(10)
+        self.assertEqual(buf.read(4, timeout=0.01), b'')
+        buf.close()
+        self.assertFalse(buf.write(b'data'))
+
+    def test_decode_args(self) -> None:
+        """
+        Check that the decoder seeks to the start of the file
+        """
+        mp3file = MP3File(self.tmpdir / 'song.mp3', FileMode.READ_ONLY, start=90000,
+                          end=120000, metadata=self.metadata).amplify(-2.5)
+        args = StreamingPlayer().decode_args(mp3file, 44100, 2)
+        self.assertLess(args.index('-ss'), args.index('-i'))
+        self.assertEqual(args[args.index('-ss') + 1], '90.0')
+        self.assertEqual(args[args.index('-t') + 1], '30.0')
+        self.assertEqual(args[args.index('-af') + 1], 'volume=-2.50dB')
+        self.assertEqual(args[-1], 'pipe:1')
+
+    def test_play(self) -> None:
+        """
+        Check that all of the decoded audio is played
+        """
+        # 1.5 seconds of 16 bit stereo audio at 8kHz
+        audio = bytes(index % 251 for index in range(8000 * 4 * 3 // 2))
+        filename = self.tmpdir / 'song.mp3'
+        with filename.open('wb') as dest:
+            dest.write(audio)
+        mp3file = MP3File(filename, FileMode.READ_ONLY, start=10000, end=11500,
+                          metadata=self.metadata)
+        progress = Progress()
+        player = RecordingPlayer(str(self.decoder), progress)
+        player.play(mp3file, progress)
+        self.assertEqual(b''.join(player.stream.chunks), audio)
+        self.assertEqual(len(player.stream.chunks[0]), 8000 * 4 * player.CHUNK_SIZE // 1000)
+        self.assertTrue(player.stream.closed)
+        self.assertEqual(progress.pct, 100.0)
+        self.assertEqual(progress.pct_text, '0:11')
+
+    def test_abort(self) -> None:
+        """
+        Check that playback stops quickly when it is aborted
+        """
+        mp3file = MP3File(self.tmpdir / 'endless.mp3', FileMode.READ_ONLY, start=0,
+                          end=60000, metadata=self.metadata)
+        progress = Progress()
+        player = RecordingPlayer(str(self.decoder), progress, abort_after=3)
+        start = time.time()
+        player.play(mp3file, progress)
+        self.assertLess(time.time() - start, 5.0)
+        self.assertEqual(len(player.stream.chunks), 3)
+        self.assertTrue(player.stream.closed)
+        self.assertLess(progress.pct, 100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Unit tests for Bingo ticket keys
+"""
+import math
+import unittest
+
+from sqlalchemy.types import String
+
+from musicbingo.models.bingoticket import BingoTicket
+from musicbingo.primes import PRIME_NUMBERS
+from musicbingo.ticketkey import (
+    MAX_TRACKS, FINGERPRINT_LENGTH, is_legacy_fingerprint, key_numbers,
+    key_to_str, legacy_to_key, parse_fingerprint, ticket_key
+)
+from musicbingo.tests.mixin import TestCaseMixin
+
+
+class TestTicketKey(TestCaseMixin, unittest.TestCase):
+    """tests of the ticketkey module"""
+
+    def test_key_is_order_independent(self) -> None:
+        """
+        Check that the order of tracks does not change the key
+        """
+        numbers = [4, 17, 0, 33, 8]
+        key = ticket_key(numbers)
+        self.assertEqual(key, ticket_key(reversed(numbers)))
+        self.assertListEqual(sorted(numbers), key_numbers(key))
+        self.assertEqual(key.bit_length(), max(numbers) + 1)
+
+    def test_string_round_trip(self) -> None:
+        """
+        Check conversion of keys to and from strings
+        """
+        for numbers in [[0], [3, 9, 63], [64], [1, MAX_TRACKS - 1]]:
+            key = ticket_key(numbers)
+            text = key_to_str(key)
+            self.assertStartsWith(text, '0x')
+            self.assertEqual((len(text) - 2) % 16, 0)
+            self.assertLessThanOrEqual(len(text), FINGERPRINT_LENGTH)
+            self.assertFalse(is_legacy_fingerprint(text))
+            self.assertEqual(parse_fingerprint(text), key)
+        self.assertGreaterThanOrEqual(MAX_TRACKS, 2048)
+        column_type = BingoTicket.__table__.c.fingerprint.type
+        assert isinstance(column_type, String)
+        self.assertEqual(column_type.length, FINGERPRINT_LENGTH)
+
+    def test_legacy_fingerprints(self) -> None:
+        """
+        Check that prime number fingerprints are converted to keys
+        """
+        numbers = [2, 5, 11, 40, 99, len(PRIME_NUMBERS) - 1]
+        fingerprint = math.prod(PRIME_NUMBERS[num] for num in numbers)
+        self.assertTrue(is_legacy_fingerprint(str(fingerprint)))
+        self.assertEqual(legacy_to_key(fingerprint), ticket_key(numbers))
+        self.assertEqual(parse_fingerprint(str(fingerprint)), ticket_key(numbers))
+        with self.assertRaises(ValueError):
+            legacy_to_key(fingerprint * 3001)
+        with self.assertRaises(ValueError):
+            parse_fingerprint('0')
+
+
+if __name__ == "__main__":
+    unittest.main()
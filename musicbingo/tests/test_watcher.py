@@ -0,0 +1,173 @@
+"""
+Unit tests for the clip library watcher
+"""
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set
+import unittest
+
+from musicbingo import models
+from musicbingo.metadata import Metadata
+from musicbingo.options import DatabaseOptions
+from musicbingo.tests.mixin import TestCaseMixin
+from musicbingo.watcher import InotifyEventSource, LibraryWatcher, PollingEventSource
+
+from .test_directory import CountingParser, create_mp3
+
+
+class MockEventSource:
+    """
+    Event source that returns pre-defined changes
+    """
+
+    def __init__(self) -> None:
+        self.changes: List[Set[Path]] = []
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """
+        Get the next set of changes
+        """
+        if self.changes:
+            return self.changes.pop(0)
+        time.sleep(timeout)
+        return set()
+
+    def close(self) -> None:
+        """
+        Stop watching for changes
+        """
+
+
+class TestLibraryWatcher(TestCaseMixin, unittest.TestCase):
+    """tests of the LibraryWatcher class"""
+
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp()).resolve()
+        models.db.DatabaseConnection.bind(
+            DatabaseOptions(database_provider='sqlite',
+                            database_name=str(self.tmpdir / 'bingo.db3')),
+            create_tables=True)
+        self.clips = self.tmpdir / 'Clips'
+        self.testcases: Dict[str, Metadata] = {}
+        self.create_mp3(self.clips / 'Fifties' / 'one.mp3', 'One')
+        self.create_mp3(self.clips / 'Sixties' / 'two.mp3', 'Two')
+
+    def tearDown(self) -> None:
+        models.db.DatabaseConnection.close()
+        shutil.rmtree(self.tmpdir)
+
+    def create_mp3(self, filename: Path, title: str, size: int = 100) -> None:
+        """
+        Create a fake MP3 file and the metadata the mock parser returns
+        """
+        create_mp3(self.testcases, filename, title, size)
+
+    def song_titles(self) -> List[str]:
+        """
+        Get the title of every song in the database
+        """
+        with models.db.session_scope() as session:
+            return sorted(song.title for song in models.Song.search(session))
+
+    def test_sync(self) -> None:
+        """
+        Check that changes to a directory are applied to the database
+        """
+        parser = CountingParser(self.testcases)
+        watcher = LibraryWatcher(self.clips, parser, events=MockEventSource())
+        changes = watcher.sync([self.clips])
+        self.assertEqual(len(changes.added), 2)
+        self.assertEqual(self.song_titles(), ['One', 'Two'])
+        self.create_mp3(self.clips / 'Fifties' / 'three.mp3', 'Three')
+        # modified in place, which does not change the directory mtime
+        self.create_mp3(self.clips / 'Fifties' / 'one.mp3', 'One Again', size=200)
+        shutil.rmtree(self.clips / 'Sixties')
+        parser.parsed = []
+        changes = watcher.sync([self.clips / 'Fifties', self.clips / 'Sixties'])
+        self.assertEqual(sorted(parser.parsed), ['one.mp3', 'three.mp3'])
+        self.assertEqual([song.filename for song in changes.added], ['three.mp3'])
+        self.assertEqual([song.filename for song in changes.changed], ['one.mp3'])
+        self.assertEqual(changes.removed, [self.clips / 'Sixties' / 'two.mp3'])
+        self.assertEqual(self.song_titles(), ['One Again', 'Three'])
+        with models.db.session_scope() as session:
+            names = sorted(item.title for item in models.Directory.search(session))
+            self.assertEqual(names, ['Clips', 'Fifties'])
+            fifties = models.Directory.get(session, name=(self.clips / 'Fifties').as_posix())
+            assert fifties is not None
+            self.assertEqual(fifties.parent.title, 'Clips')  # type: ignore
+
+    def test_new_directory(self) -> None:
+        """
+        Check that a new directory is added to the correct parent
+        """
+        watcher = LibraryWatcher(self.clips, CountingParser(self.testcases),
+                                 events=MockEventSource())
+        watcher.sync([self.clips])
+        self.create_mp3(self.clips / 'Sixties' / 'Beat' / 'four.mp3', 'Four')
+        watcher.sync([self.clips / 'Sixties' / 'Beat', self.clips / 'Sixties'])
+        self.assertEqual(self.song_titles(), ['Four', 'One', 'Two'])
+        with models.db.session_scope() as session:
+            beat = models.Directory.get(
+                session, name=(self.clips / 'Sixties' / 'Beat').as_posix())
+            assert beat is not None
+            self.assertEqual(beat.parent.title, 'Sixties')  # type: ignore
+
+    def test_debounce(self) -> None:
+        """
+        Check that changes are applied once there have been no events
+        for the debounce time
+        """
+        events = MockEventSource()
+        watcher = LibraryWatcher(self.clips, CountingParser(self.testcases),
+                                 events=events, debounce=0.2)
+        watcher.sync([self.clips])
+        self.create_mp3(self.clips / 'Fifties' / 'three.mp3', 'Three')
+        self.create_mp3(self.clips / 'Fifties' / 'four.mp3', 'Four')
+        events.changes = [{self.clips / 'Fifties'}, {self.clips / 'Fifties'}]
+        self.assertIsNone(watcher.step(0.01))
+        self.assertIsNone(watcher.step(0.01))
+        self.assertIsNone(watcher.step(0.01))
+        self.assertEqual(self.song_titles(), ['One', 'Two'])
+        time.sleep(0.2)
+        changes = watcher.step(0.01)
+        assert changes is not None
+        self.assertEqual(len(changes.added), 2)
+        self.assertEqual(self.song_titles(), ['Four', 'One', 'Three', 'Two'])
+        self.assertIsNone(watcher.step(0.01))
+
+    def test_polling_event_source(self) -> None:
+        """
+        Check finding changed directories by polling
+        """
+        events = PollingEventSource(self.clips, 0)
+        self.assertEqual(events.wait(0), set())
+        (self.clips / 'Seventies').mkdir()
+        shutil.rmtree(self.clips / 'Fifties')
+        self.assertEqual(events.wait(0), {self.clips, self.clips / 'Seventies'})
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires inotify')
+    def test_inotify_event_source(self) -> None:
+        """
+        Check finding changed directories using inotify
+        """
+        events = InotifyEventSource(self.clips)
+        try:
+            self.assertEqual(events.wait(0), set())
+            self.create_mp3(self.clips / 'Fifties' / 'three.mp3', 'Three')
+            self.assertEqual(events.wait(1), {self.clips / 'Fifties'})
+            (self.clips / 'Seventies').mkdir()
+            self.assertEqual(events.wait(1), {self.clips})
+            self.create_mp3(self.clips / 'Seventies' / 'four.mp3', 'Four')
+            self.assertEqual(events.wait(1), {self.clips / 'Seventies'})
+            with (self.clips / 'Seventies' / 'notes.txt').open('wt') as dest:
+                dest.write('not an MP3 file')
+            self.assertEqual(events.wait(0.1), set())
+        finally:
+            events.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Order-independent identity of a Bingo ticket.
+
+A ticket key is a bitset with one bit set for the number of each track
+on the ticket. As track numbers are allocated in play order, the
+number of bits in a key is also the track number at which the ticket
+wins.
+
+Older versions of musicbingo used the product of a prime number per
+track as the ticket fingerprint. These legacy fingerprints are still
+accepted when parsing a fingerprint.
+"""
+
+from typing import Iterable, List, Union
+
+from .primes import PRIME_NUMBERS
+
+KEY_PREFIX = '0x'
+WORD_DIGITS = 16  # number of hex digits in a 64 bit word
+FINGERPRINT_LENGTH = 514  # size of BingoTicket.fingerprint database column
+MAX_TRACKS = ((FINGERPRINT_LENGTH - len(KEY_PREFIX)) // WORD_DIGITS) * WORD_DIGITS * 4
+
+
+def ticket_key(numbers: Iterable[int]) -> int:
+    """
+    Create a ticket key from the numbers of the tracks on a ticket
+    """
+    key = 0
+    for number in numbers:
+        key |= 1 << number
+    return key
+
+
+def key_numbers(key: int) -> List[int]:
+    """
+    Get the list of track numbers that are in a ticket key
+    """
+    numbers: List[int] = []
+    number = 0
+    while key:
+        if key & 1:
+            numbers.append(number)
+        key >>= 1
+        number += 1
+    return numbers
+
+
+def key_to_str(key: int) -> str:
+    """
+    Convert a ticket key to the fixed-width string used in the database
+    and the ticketTracks file. The width is a whole number of 64 bit words.
+    """
+    words = max(1, (key.bit_length() + 63) // 64)
+    return f'{KEY_PREFIX}{key:0{words * WORD_DIGITS}x}'
+
+
+def is_legacy_fingerprint(fingerprint: Union[str, int]) -> bool:
+    """
+    Check if fingerprint is a product of prime numbers, rather than
+    a ticket key
+    """
+    return not str(fingerprint).lower().startswith(KEY_PREFIX)
+
+
+def legacy_to_key(fingerprint: int) -> int:
+    """
+    Convert a fingerprint that is the product of the prime number of
+    each track into a ticket key
+    """
+    if fingerprint < 1:
+        raise ValueError(f'Invalid ticket fingerprint: {fingerprint}')
+    key = 0
+    for number, prime in enumerate(PRIME_NUMBERS):
+        if fingerprint == 1:
+            break
+        if (fingerprint % prime) == 0:
+            key |= 1 << number
+            fingerprint //= prime
+    if fingerprint != 1:
+        raise ValueError('Ticket fingerprint contains an unknown track')
+    return key
+
+
+def parse_fingerprint(fingerprint: Union[str, int]) -> int:
+    """
+    Convert a ticket fingerprint into a ticket key.
+    Accepts both ticket keys and legacy prime number fingerprints.
+    An int is assumed to already be a ticket key.
+    """
+    if isinstance(fingerprint, int):
+        return fingerprint
+    fingerprint = fingerprint.strip()
+    if is_legacy_fingerprint(fingerprint):
+        return legacy_to_key(int(fingerprint, 10))
+    return int(fingerprint, 16)
@@ -2,10 +2,11 @@
 class to represent one Song within a game.
 """
 
-from typing import Optional, cast
+from typing import Dict, List, Optional, Sequence, Tuple, cast
+
+from sqlalchemy.orm import selectinload
 
 from . import models
-from .primes import PRIME_NUMBERS
 from .song import Song
 
 
@@ -15,11 +16,11 @@ class Track:
     """
 
     def __init__(self, song: Song,
-                 prime: int,  # a prime number used during game generation
+                 number: int,  # position of song in playlist (starting from 0)
                  start_time: int   # position of song in playlist (in milliseconds)
                  ):
         self.song = song
-        self.prime = prime
+        self.number = number
         self.start_time = start_time
 
     def __getattr__(self, name):
@@ -29,20 +30,18 @@ class Track:
         """
         get database model for this track
         """
-        number = PRIME_NUMBERS.index(self.prime)
         return cast(
             Optional[models.Track],
-            models.Track.get(session, game=game, number=number))
+            models.Track.get(session, game=game, number=self.number))
 
     def save(self, game: models.Game, song: models.Song, session,
              flush: bool = False) -> models.Track:
         """
         save track to database
         """
-        number = PRIME_NUMBERS.index(self.prime)
-        trk = models.Track.get(session, game_pk=game.pk, number=number)
+        trk = models.Track.get(session, game_pk=game.pk, number=self.number)
         if trk is None:
-            trk = models.Track(game=game, song=song, number=number,
+            trk = models.Track(game=game, song=song, number=self.number,
                                start_time=self.start_time)
             session.add(trk)
         else:
@@ -51,3 +50,51 @@ class Track:
             session.flush()
         assert trk is not None
         return cast(models.Track, trk)
+
+    @staticmethod
+    def directory_name(track: "Track") -> str:
+        """
+        Name of the database Directory that contains the song of a track
+        """
+        assert track.song.fullpath is not None
+        return track.song.fullpath.parent.resolve().as_posix()
+
+    @staticmethod
+    def save_all(session, game: models.Game, tracks: Sequence["Track"]) -> List[models.Track]:
+        """
+        save all the tracks of a game to database, using one INSERT statement.
+        Any previous tracks of this game must have already been deleted.
+        Returns the database model of each track, in the same order as "tracks"
+        """
+        session.flush()
+        # the database models of all the songs are found using one query
+        song_pks: Dict[Tuple[str, str], int] = {}
+        query = session.query(
+            models.Song.pk, models.Directory.name, models.Song.filename,
+        ).join(
+            models.Directory, models.Song.directory_pk == models.Directory.pk
+        ).filter(
+            models.Directory.name.in_({Track.directory_name(track) for track in tracks}),
+            models.Song.filename.in_({track.song.filename for track in tracks}))
+        for song_pk, dir_name, filename in query:
+            song_pks[(dir_name, filename)] = song_pk
+        rows = []
+        for track in tracks:
+            song_pk = song_pks.get((Track.directory_name(track), track.song.filename))
+            assert song_pk is not None
+            rows.append({
+                'game_pk': game.pk,
+                'song_pk': song_pk,
+                'number': track.number,
+                'start_time': track.start_time,
+            })
+        models.Track.bulk_insert(session, rows)
+        # the songs are loaded with the tracks, as they are needed when
+        # saving the game information
+        song = selectinload(models.Track.song)
+        query = models.Track.search(session, game_pk=game.pk).options(
+            song.selectinload(models.Song.directory),
+            song.selectinload(models.Song.artist),
+            song.selectinload(models.Song.album))
+        db_tracks = {trk.number: trk for trk in query}
+        return [db_tracks[track.number] for track in tracks]
@@ -0,0 +1,366 @@
+"""
+Watches a directory of clips and keeps the songs and directories in
+the database up to date as files are added, modified or removed.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Protocol, Sequence, Set
+
+from .directory import Directory
+from .mp3.parser import MP3Parser
+from .progress import Progress
+from .scanindex import ScanChanges, ScanIndex
+from . import models
+
+
+class EventSource(Protocol):
+    """
+    Interface for finding directories that have changed
+    """
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """
+        Wait up to timeout seconds for changes.
+        Returns the directories whose contents have changed.
+        """
+
+    def close(self) -> None:
+        """
+        Stop watching for changes
+        """
+
+
+class InotifyEventSource:
+    """
+    Uses the Linux inotify API to find directories that have changed.
+    Every directory in the tree is watched.
+    """
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+            IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    # struct inotify_event, without the name that follows it
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, top: Path) -> None:
+        self.top = top
+        self.log = logging.getLogger(__name__)
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('Failed to find the C library')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.watches: Dict[int, Path] = {}
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self._raise_error('inotify_init1')
+        try:
+            self.add_tree(top)
+        except OSError:
+            self.close()
+            raise
+
+    def _raise_error(self, name: str) -> None:
+        """
+        Raise OSError using the current value of errno
+        """
+        err = ctypes.get_errno()
+        raise OSError(err, f'{name}: {os.strerror(err)}')
+
+    def add_tree(self, directory: Path) -> None:
+        """
+        Watch a directory and all of its subdirectories
+        """
+        self.add_watch(directory)
+        for dirpath, dirnames, _ in os.walk(directory):
+            for name in dirnames:
+                self.add_watch(Path(dirpath) / name)
+
+    def add_watch(self, directory: Path) -> None:
+        """
+        Watch one directory
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            self._raise_error('inotify_add_watch')
+        self.watches[wd] = directory
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """
+        Wait up to timeout seconds for changes.
+        Returns the directories whose contents have changed.
+        """
+        changed: Set[Path] = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            self._decode_events(data, changed)
+            ready, _, _ = select.select([self.fd], [], [], 0)
+        return changed
+
+    def _decode_events(self, data: bytes, changed: Set[Path]) -> None:
+        """
+        Find the directories that are affected by each event in data
+        """
+        pos = 0
+        while pos + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, pos)
+            pos += self.EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            if mask & self.IN_Q_OVERFLOW:
+                self.log.warning('inotify event queue overflow')
+                changed.add(self.top)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                changed.add(directory.parent)
+                continue
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    try:
+                        self.add_tree(directory / name)
+                    except OSError as err:
+                        self.log.warning('Failed to watch %s: %s', directory / name, err)
+                changed.add(directory)
+            elif name.lower().endswith('.mp3'):
+                changed.add(directory)
+
+    def close(self) -> None:
+        """
+        Stop watching for changes
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.watches = {}
+
+
+class PollingEventSource:
+    """
+    Finds directories that have changed by periodically checking the
+    modification time of every directory in the tree.
+    Note that modifying a file in place does not change the modification
+    time of its directory, so that change is not found.
+    """
+
+    def __init__(self, top: Path, interval: float) -> None:
+        self.top = top
+        self.interval = interval
+        self.mtimes = self._scan()
+        self.next_poll = time.monotonic() + interval
+
+    def _scan(self) -> Dict[Path, int]:
+        """
+        Get the modification time of every directory in the tree
+        """
+        mtimes: Dict[Path, int] = {}
+        for dirpath, _, _ in os.walk(self.top):
+            try:
+                mtimes[Path(dirpath)] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                pass
+        return mtimes
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """
+        Wait up to timeout seconds for changes.
+        Returns the directories whose contents have changed.
+        """
+        delay = self.next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_poll = time.monotonic() + self.interval
+        mtimes = self._scan()
+        changed = {path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime}
+        changed.update(path.parent for path in self.mtimes if path not in mtimes)
+        self.mtimes = mtimes
+        return changed
+
+    def close(self) -> None:
+        """
+        Stop watching for changes
+        """
+
+
+class LibraryWatcher:
+    """
+    Watches a directory of clips and applies any changes to the database.
+    Filesystem events are debounced, so that a burst of changes (e.g.
+    copying a folder of clips) is applied once the burst has finished.
+    Only the directories that have changed are searched again.
+    """
+
+    DEBOUNCE = 2.0  # seconds
+    POLL_INTERVAL = 30.0  # seconds
+
+    def __init__(self, clipdir: Path, parser: MP3Parser,
+                 events: Optional[EventSource] = None,
+                 debounce: float = DEBOUNCE,
+                 poll_interval: float = POLL_INTERVAL) -> None:
+        self.clipdir = clipdir.resolve()
+        self.parser = parser
+        self.debounce = debounce
+        self.log = logging.getLogger(__name__)
+        if events is None:
+            events = self.create_event_source(self.clipdir, poll_interval)
+        self.events = events
+        self.index = ScanIndex.load(self.clipdir / ScanIndex.FILENAME)
+        self.progress = Progress()
+        self.pending: Set[Path] = set()
+        self.last_event: float = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def create_event_source(clipdir: Path, poll_interval: float) -> EventSource:
+        """
+        Use inotify if available, otherwise fall back to polling
+        """
+        log = logging.getLogger(__name__)
+        if sys.platform.startswith('linux'):
+            try:
+                return InotifyEventSource(clipdir)
+            except (OSError, AttributeError) as err:
+                log.warning('Failed to use inotify, using polling instead: %s', err)
+        return PollingEventSource(clipdir, poll_interval)
+
+    def run(self) -> None:
+        """
+        Search the whole clip directory and then apply changes until
+        stop() is called.
+        """
+        self.sync([self.clipdir])
+        try:
+            while not self._stop.is_set():
+                self.step(min(self.debounce, 1.0))
+        finally:
+            self.events.close()
+
+    def stop(self) -> None:
+        """
+        Stop a watcher that is running in another thread
+        """
+        self._stop.set()
+        self.progress.abort = True
+
+    def step(self, timeout: float) -> Optional[ScanChanges]:
+        """
+        Wait up to timeout seconds for filesystem events. If there has
+        not been an event for the debounce time, the pending changes
+        are applied.
+        Returns the changes that were applied, or None.
+        """
+        changed = self.events.wait(timeout)
+        now = time.monotonic()
+        if changed:
+            self.pending.update(changed)
+            self.last_event = now
+            return None
+        if not self.pending or (now - self.last_event) < self.debounce:
+            return None
+        directories = list(self.pending)
+        self.pending = set()
+        return self.sync(directories)
+
+    def sync(self, directories: Sequence[Path]) -> ScanChanges:
+        """
+        Search the given directories again and apply the changes to
+        the database.
+        """
+        result = ScanChanges()
+        for directory in self.top_directories(directories):
+            self.log.info('Checking %s', directory)
+            clips = self.directory_model(directory)
+            changes = clips.search(self.parser, self.progress, self.index)
+            if self.progress.abort:
+                break
+            with models.db.session_scope() as session:
+                clips.save_all(session, changes)
+            self.log.debug('%s: %s', directory, changes)
+            result.merge(changes)
+        return result
+
+    def top_directories(self, directories: Sequence[Path]) -> List[Path]:
+        """
+        Find the directories that need to be searched again. A directory
+        that has been removed is replaced by its closest parent that
+        still exists. Any directory inside another directory that is
+        being searched is skipped, as it will be checked by that search.
+        """
+        paths: Set[Path] = set()
+        for directory in directories:
+            directory = Path(os.path.abspath(directory))
+            if directory != self.clipdir and self.clipdir not in directory.parents:
+                continue
+            self.index.invalidate(directory)
+            while directory != self.clipdir and not directory.is_dir():
+                directory = directory.parent
+            paths.add(directory)
+        return sorted(path for path in paths
+                      if not any(parent in paths for parent in path.parents))
+
+    def directory_model(self, directory: Path) -> Directory:
+        """
+        Create a Directory for the given path, including Directory
+        objects for each of its parent directories
+        """
+        clips = Directory(None, self.clipdir)
+        path = self.clipdir
+        for part in directory.relative_to(self.clipdir).parts:
+            path = path / part
+            clips = Directory(clips, path)
+        return clips
+
+
+def main(args: Sequence[str]) -> int:
+    """watch the clip directory and keep the database up to date"""
+    # pylint: disable=import-outside-toplevel
+    from musicbingo.options import Options
+    from musicbingo.mp3 import MP3Factory
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    opts = Options.parse(args)
+    if opts.debug:
+        logging.getLogger(__name__).setLevel(logging.DEBUG)
+    models.db.DatabaseConnection.bind(opts.database, debug=opts.debug)
+    watcher = LibraryWatcher(Path(opts.clip_directory), MP3Factory.create_parser(opts.mp3_parser))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+"""
+Calculates when Bingo tickets win, using a table that maps each
+track in a game to its play position.
+"""
+
+from typing import Dict, List, Sequence, TYPE_CHECKING
+
+try:
+    import numpy  # type: ignore
+    USE_NUMPY = True
+except ImportError:
+    USE_NUMPY = False
+
+from .track import Track
+
+if TYPE_CHECKING:
+    from .bingoticket import BingoTicket
+
+
+class WinEngine:
+    """
+    Calculates when Bingo tickets win.
+
+    A ticket wins when the last of its tracks has been played, so the
+    win point of a ticket (or of one row of a ticket) is the maximum
+    play position of its tracks. The table of play positions is
+    computed once per game and then shared by every ticket.
+    """
+
+    def __init__(self, tracks: Sequence[Track]) -> None:
+        self.tracks = tracks
+        self.positions: Dict[int, int] = {}
+        for pos, track in enumerate(tracks, start=1):
+            self.positions[track.number] = pos
+        # When tracks are numbered in play order, the win point of a
+        # ticket is the number of bits in its ticket key
+        self.in_number_order = all(
+            track.number == idx for idx, track in enumerate(tracks))
+
+    def position(self, track: Track) -> int:
+        """
+        Get the play position (starting from 1) of the given track.
+        Returns 0 if the track is not part of this game.
+        """
+        return self.positions.get(track.number, 0)
+
+    def when_ticket_wins(self, ticket: "BingoTicket") -> int:
+        """
+        Get the track number at which the given ticket will win
+        """
+        if (self.in_number_order and ticket.fingerprint and
+                ticket.fingerprint.bit_length() <= len(self.tracks)):
+            return ticket.fingerprint.bit_length()
+        win_point = self.win_point(ticket.tracks)
+        if win_point == 0:
+            raise ValueError(f'ticket {ticket.number} never wins')
+        return win_point
+
+    def win_point(self, tracks: Sequence[Track]) -> int:
+        """
+        Get the track number at which all of the given tracks have been
+        played. Returns 0 if any of the tracks are not part of this game.
+        """
+        win_point = 0
+        for track in tracks:
+            pos = self.positions.get(track.number, 0)
+            if pos == 0:
+                return 0
+            win_point = max(win_point, pos)
+        return win_point
+
+    def rows_complete(self, ticket: "BingoTicket") -> List[int]:
+        """
+        Get the track number at which each row of the ticket is complete.
+        A value of 0 means that row is never complete.
+        """
+        columns = ticket.columns
+        num_rows = len(ticket.tracks) // columns
+        return [self.win_point(ticket.tracks[row * columns:(row + 1) * columns])
+                for row in range(num_rows)]
+
+    def compute_win_values(self, tickets: Sequence["BingoTicket"]) -> None:
+        """
+        Calculate when each ticket is complete and when each row of each
+        ticket is complete. The results are stored in the wins_on_track
+        and rows_complete_on_track properties of each ticket.
+        """
+        if not tickets:
+            return
+        if USE_NUMPY and self._is_uniform(tickets):
+            self._compute_win_values_numpy(tickets)
+            return
+        for ticket in tickets:
+            ticket.wins_on_track = self.win_point(ticket.tracks)
+            ticket.rows_complete_on_track = self.rows_complete(ticket)
+
+    @staticmethod
+    def _is_uniform(tickets: Sequence["BingoTicket"]) -> bool:
+        """
+        Check if every ticket has the same shape, which is needed to
+        use a single array for all tickets.
+        """
+        num_tracks = len(tickets[0].tracks)
+        columns = tickets[0].columns
+        if num_tracks == 0 or num_tracks < columns:
+            return False
+        for ticket in tickets:
+            if len(ticket.tracks) != num_tracks or ticket.columns != columns:
+                return False
+        return True
+
+    def _compute_win_values_numpy(self, tickets: Sequence["BingoTicket"]) -> None:
+        """
+        Version of compute_win_values() that calculates the results for
+        all tickets at once using numpy
+        """
+        columns = tickets[0].columns
+        num_rows = len(tickets[0].tracks) // columns
+        positions = numpy.array(
+            [[self.positions.get(trk.number, 0) for trk in tkt.tracks]
+             for tkt in tickets], dtype=numpy.int32)
+        # a track that is not in the game means that the ticket (or row)
+        # can never win
+        missing = positions == 0
+        wins = numpy.where(missing.any(axis=1), 0, positions.max(axis=1))
+        grid = positions[:, :num_rows * columns].reshape(
+            (len(tickets), num_rows, columns))
+        rows = numpy.where((grid == 0).any(axis=2), 0, grid.max(axis=2))
+        for ticket, win, row in zip(tickets, wins.tolist(), rows.tolist()):
+            ticket.wins_on_track = win
+            ticket.rows_complete_on_track = row
@@ -18,8 +18,10 @@ from musicbingo.generator import GameGenerator
 from musicbingo.models.modelmixin import JsonObject, PrimaryKeyMap
 from musicbingo.models.importer import Importer
 from musicbingo.mp3 import MP3Factory
+from musicbingo.mp3.pcmcache import PCMCache
 from musicbingo.options import GameMode, Options
 from musicbingo.progress import Progress
+from musicbingo.scanindex import ScanIndex
 from musicbingo.song import Song
 
 
@@ -59,13 +61,15 @@ class SearchForClips(BackgroundWorker):
         gets the Title/Artist data and adds them to the song list.
         This function runs in its own thread
         """
-        mp3parser = MP3Factory.create_parser()
+        mp3parser = MP3Factory.create_parser(self.options.mp3_parser)
         clips = Directory(None, clipdir)
         self.progress.text = 'Searching for clips'
         self.progress.pct = 0.0
-        clips.search(mp3parser, self.progress)
+        index = ScanIndex.load(clipdir / ScanIndex.FILENAME)
+        changes = clips.search(mp3parser, self.progress, index,
+                               parse_workers=self.options.parse_workers)
         with models.db.session_scope() as session:
-            clips.save_all(session)
+            clips.save_all(session, changes)
         self.result = clips
 
 
@@ -77,7 +81,10 @@ class GenerateBingoGame(BackgroundWorker):
         """
         Creates MP3 file and PDF files.
         """
-        mp3editor = MP3Factory.create_editor(self.options.mp3_editor)
+        mp3editor = MP3Factory.create_editor(
+            self.options.mp3_editor,
+            pcm_cache=PCMCache.create(self.options.pcm_cache, self.options.pcm_cache_size),
+            encode_workers=self.options.encode_workers)
         docgen = DocumentFactory.create_generator('pdf')
         gen = GameGenerator(self.options, mp3editor, docgen,
                             self.progress)
@@ -105,7 +112,8 @@ class GenerateClips(BackgroundWorker):
         This function runs in its own thread
         """
         mp3editor = MP3Factory.create_editor(self.options.mp3_editor)
-        gen = ClipGenerator(self.options, mp3editor, self.progress)
+        gen = ClipGenerator(self.options, mp3editor, self.progress,
+                            MP3Factory.create_parser(self.options.mp3_parser))
         self.result = gen.generate(songs)
 
 